@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+# End-to-end benchmarks: RISC-V workloads running on the RTL simulation
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+
+import json
+import statistics
+
+from pathlib import Path
+
+from ebrick_demo.benchmarks.harness import result
+from ebrick_demo.testbench.regression import TESTS, RegressionJob, run_job
+
+# workloads in testbench/program
+PROGRAMS = {
+    'memcpy': 'memcpy.c',    # memory-bound
+    'compute': 'compute.c',  # compute-bound
+    'printer': 'printer.c'   # UART-heavy
+}
+
+
+def run_workload(test, program, rundir, builddir, repeat=3, timeout=None):
+    '''
+    Runs a program under a test "repeat" times (after one untimed run that
+    builds the simulator and program), returning a result dictionary.
+
+    The time reported is the median time spent running the program, as
+    measured by the test's telemetry, so it excludes building and launching
+    the simulator.
+    '''
+
+    job = RegressionJob(test, program, args=['--telemetry-json', 'telemetry.json'])
+
+    times = []
+    telemetry = []
+
+    for i in range(repeat + 1):
+        r = run_job(job, Path(rundir) / str(i), builddir, timeout=timeout)
+
+        if not r['passed']:
+            raise RuntimeError(f'{job.name} failed (see {r["log"]})')
+
+        with open(Path(r['log']).parent / 'telemetry.json') as f:
+            t = json.load(f)
+
+        if i > 0:
+            times.append(t['wall_time'])
+            telemetry.append(t)
+
+    def median(key, section=None):
+        values = [(t[section] if section else t)[key] for t in telemetry]
+        values = [v for v in values if v is not None]
+        return statistics.median(values) if values else None
+
+    return result(
+        times,
+        items=median('packets'),
+        statistic='median',
+        packets=median('packets'),
+        cycles=median('cycles', 'simulation'),
+        cycles_per_second=median('cycles_per_second', 'simulation')
+    )
+
+
+def run(repeat=3, filter=None, workdir='benchmarks', timeout=None):
+    '''Runs each workload under each test, returning a dictionary of results.'''
+
+    workdir = Path(workdir).resolve()
+    builddir = workdir / 'build'
+
+    results = {}
+
+    for test in TESTS:
+        for name, program in PROGRAMS.items():
+            bench = f'e2e/{test}/{name}'
+            if (filter is not None) and (filter not in bench):
+                continue
+
+            print(f'*** Running {bench} ***', flush=True)
+            results[bench] = run_workload(test, program, workdir / test / name, builddir,
+                                          repeat=repeat, timeout=timeout)
+
+    return results
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+# Timing, saving and comparison of benchmark results
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+
+import json
+import platform
+import statistics
+import timeit
+
+# a benchmark is reported as a regression if it is slower than its baseline
+# by more than this fraction
+DEFAULT_THRESHOLD = 0.1
+
+
+def measure(fn, items=1, repeat=5, warmup=1):
+    '''
+    Times fn(), returning a result dictionary.  "items" is the amount of work
+    done by each call (for example, the number of packets processed), used to
+    report a rate.
+
+    The number of calls per repetition is chosen so that each repetition takes
+    at least 0.2s, and the fastest repetition is used as the result, since it
+    is the one least disturbed by other activity on the machine.  Garbage
+    collection is disabled while timing.
+    '''
+
+    for _ in range(warmup):
+        fn()
+
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    times = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+
+    return result(times, items=items, statistic='min')
+
+
+def result(times, items=1, statistic='median', **extra):
+    '''Summarizes a list of per-call times (in seconds) as a result dictionary.'''
+
+    time = min(times) if statistic == 'min' else statistics.median(times)
+
+    d = {
+        'time': time,
+        'statistic': statistic,
+        'min': min(times),
+        'median': statistics.median(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'repeat': len(times),
+        'rate': (items / time) if time > 0 else None
+    }
+    d.update(extra)
+
+    return d
+
+
+def save(results, filename):
+    '''Writes results to a JSON file, along with a description of the host.'''
+
+    with open(filename, 'w') as f:
+        json.dump({
+            'host': {
+                'machine': platform.machine(),
+                'processor': platform.processor(),
+                'python': platform.python_version()
+            },
+            'results': results
+        }, f, indent=2, sort_keys=True)
+
+
+def load(filename):
+    '''Reads results written by save().'''
+
+    with open(filename) as f:
+        return json.load(f)['results']
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    '''
+    Compares results against a baseline, returning a list of
+    (name, baseline time, time, ratio, status) tuples, where status is
+    "regression", "improvement", "ok", "new" or "missing".
+    '''
+
+    rows = []
+
+    for name in sorted(set(results) | set(baseline)):
+        if name not in baseline:
+            rows.append((name, None, results[name]['time'], None, 'new'))
+        elif name not in results:
+            rows.append((name, baseline[name]['time'], None, None, 'missing'))
+        else:
+            old = baseline[name]['time']
+            new = results[name]['time']
+            ratio = new / old
+            if ratio > 1 + threshold:
+                status = 'regression'
+            elif ratio < 1 / (1 + threshold):
+                status = 'improvement'
+            else:
+                status = 'ok'
+            rows.append((name, old, new, ratio, status))
+
+    return rows
+
+
+def _format_time(t):
+    if t is None:
+        return '-'
+    for unit, scale in [('s', 1), ('ms', 1e-3), ('us', 1e-6)]:
+        if t >= scale:
+            return f'{t / scale:.3f}{unit}'
+    return f'{t / 1e-9:.1f}ns'
+
+
+def summarize(results, comparison=None):
+    '''Returns a printable table of results, with the baseline comparison if provided.'''
+
+    width = max([len(name) for name in results] + [9])
+    lines = []
+
+    if comparison is None:
+        lines.append(f'{"benchmark":<{width}}  {"time":>10}  {"stdev":>10}  {"rate":>12}')
+        for name, r in sorted(results.items()):
+            rate = f'{r["rate"]:.0f}/s' if r.get('rate') else '-'
+            lines.append(f'{name:<{width}}  {_format_time(r["time"]):>10}  '
+                         f'{_format_time(r["stdev"]):>10}  {rate:>12}')
+    else:
+        width = max([len(row[0]) for row in comparison] + [9])
+        lines.append(f'{"benchmark":<{width}}  {"baseline":>10}  {"time":>10}  '
+                     f'{"ratio":>6}  status')
+        for name, old, new, ratio, status in comparison:
+            ratio = f'{ratio:.2f}' if ratio is not None else '-'
+            lines.append(f'{name:<{width}}  {_format_time(old):>10}  {_format_time(new):>10}  '
+                         f'{ratio:>6}  {status}')
+
+    return '\n'.join(lines)
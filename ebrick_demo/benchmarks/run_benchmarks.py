@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+# Runs the benchmark suites and compares the results against a baseline
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import sys
+
+from ebrick_demo.benchmarks import harness, umi_ram_bench, e2e_bench, startup_bench
+
+# benchmark name prefix of each suite
+SUITES = {
+    'micro': 'umi_ram/',
+    'e2e': 'e2e/',
+    'startup': 'startup/'
+}
+
+
+def main():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description='Run benchmarks.')
+    parser.add_argument('suites', nargs='*',
+        help=f'suites to run, from {", ".join(SUITES.keys())} (default: all)')
+    parser.add_argument('--filter',
+        help='only run benchmarks whose names contain this string')
+    parser.add_argument('--repeat', type=int, default=None,
+        help='number of timed repetitions (default: 5 for micro and startup, 3 for e2e)')
+    parser.add_argument('--workdir', default='benchmarks',
+        help='directory for end-to-end builds and runs')
+    parser.add_argument('--timeout', type=float, default=None,
+        help='timeout for each end-to-end run, in seconds')
+    parser.add_argument('--save',
+        help='write the results to this JSON file, for use as a baseline')
+    parser.add_argument('--compare',
+        help='compare the results against a baseline JSON file')
+    parser.add_argument('--threshold', type=float, default=harness.DEFAULT_THRESHOLD,
+        help='slowdown, as a fraction, reported as a regression')
+
+    args = parser.parse_args()
+
+    suites = args.suites if args.suites else list(SUITES.keys())
+    for suite in suites:
+        if suite not in SUITES:
+            parser.error(f'unknown suite: {suite}')
+
+    results = {}
+
+    if 'micro' in suites:
+        repeat = args.repeat if args.repeat is not None else 5
+        results.update(umi_ram_bench.run(repeat=repeat, filter=args.filter))
+
+    if 'e2e' in suites:
+        repeat = args.repeat if args.repeat is not None else 3
+        results.update(e2e_bench.run(repeat=repeat, filter=args.filter, workdir=args.workdir,
+                                     timeout=args.timeout))
+
+    if 'startup' in suites:
+        repeat = args.repeat if args.repeat is not None else 5
+        results.update(startup_bench.run(repeat=repeat, filter=args.filter))
+
+    comparison = None
+    if args.compare:
+        baseline = harness.load(args.compare)
+        # only compare against the benchmarks that were selected to run
+        baseline = {name: r for name, r in baseline.items()
+                    if any(name.startswith(SUITES[suite]) for suite in suites)
+                    and ((args.filter is None) or (args.filter in name))}
+        comparison = harness.compare(results, baseline, threshold=args.threshold)
+
+    print(harness.summarize(results, comparison))
+
+    if args.save:
+        harness.save(results, args.save)
+
+    failed = False
+
+    # startup benchmarks have a fixed budget, whether or not there is a baseline
+    for name in startup_bench.over_budget(results):
+        r = results[name]
+        print(f'{name} took {r["time"]:.3f}s, over its budget of {r["budget"]:.3f}s; '
+              f'slowest imports of {r["module"]}:')
+        for t, module in startup_bench.import_profile(r['module']):
+            print(f'  {t:.3f}s  {module}')
+        failed = True
+
+    if comparison is not None:
+        regressions = [row[0] for row in comparison if row[4] == 'regression']
+        if regressions:
+            print(f'{len(regressions)} regression(s) beyond {100 * args.threshold:.0f}%')
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+# Startup benchmarks: time to import the ebrick CLI and the tests
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+
+import subprocess
+import sys
+import time
+
+from ebrick_demo.benchmarks.harness import result
+
+# module imported by each benchmark, and its budget: the most time, in
+# seconds, that starting a Python interpreter and importing the module
+# should take.  The budgets are generous, to allow for slow CI machines;
+# they are meant to catch a heavy dependency creeping back into a path
+# that does not need it.
+#
+# * import_ebrick: ebrick.py, which loads siliconcompiler and the tests
+#   only when they are used
+# * import_test_prv32: what "ebrick.py -test" loads before building the
+#   simulator (switchboard, siliconcompiler and the Python testbench)
+MODULES = {
+    'import_ebrick': ('ebrick_demo.ebrick', 0.25),
+    'import_test_prv32': ('ebrick_demo.testbench.test_prv32', 2.0)
+}
+
+
+def time_command(args):
+    '''Returns the wall time of running a Python interpreter with args.'''
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable] + args, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def import_profile(module, top=10):
+    '''
+    Returns the "top" imports that take the longest (cumulatively) when
+    importing module in a fresh interpreter, as (seconds, name) pairs.
+    '''
+
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          check=True, capture_output=True, text=True)
+
+    # lines are "import time: self [us] | cumulative | imported package"
+    imports = []
+    for line in proc.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        imports.append((int(fields[1]) * 1e-6, fields[2].strip()))
+
+    return sorted(imports, reverse=True)[:top]
+
+
+def run(repeat=5, filter=None):
+    '''
+    Times a bare interpreter and each import in MODULES, each in a fresh
+    interpreter, returning a dictionary of results.  The results of the
+    imports include their "budget".
+    '''
+
+    results = {}
+
+    benchmarks = {'python': ([], None, None)}
+    for name, (module, budget) in MODULES.items():
+        benchmarks[name] = (['-c', f'import {module}'], module, budget)
+
+    for name, (args, module, budget) in benchmarks.items():
+        bench = f'startup/{name}'
+        if (filter is not None) and (filter not in bench):
+            continue
+
+        print(f'*** Running {bench} ***', flush=True)
+
+        args = args if args else ['-c', 'pass']
+
+        # one untimed run, so that the bytecode caches are written
+        time_command(args)
+        times = [time_command(args) for _ in range(repeat)]
+
+        extra = {}
+        if module is not None:
+            extra = {'module': module, 'budget': budget}
+
+        results[bench] = result(times, statistic='min', **extra)
+
+    return results
+
+
+def over_budget(results):
+    '''Returns the names of the results that took longer than their budget.'''
+
+    return sorted(name for name, r in results.items()
+                  if (r.get('budget') is not None) and (r['time'] > r['budget']))
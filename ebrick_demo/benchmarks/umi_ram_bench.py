@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+# Microbenchmarks for the UmiRam model under synthetic UMI packet streams
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+
+import numpy as np
+
+from switchboard import PyUmiPacket, UmiCmd, umi_opcode, umi_pack
+
+from ebrick_demo.benchmarks.harness import measure
+from ebrick_demo.testbench.umi_ram import UmiRam
+from ebrick_demo.testbench.umi_router import UmiRouter
+from ebrick_demo.testbench.umi_service import UmiBatchService
+
+MEMORY_SIZE = 32768
+
+# number of packets in each stream
+STREAM_LENGTH = 4096
+
+# bytes per packet
+SIZES = [1, 4, 32]
+
+# fraction of reads in each stream
+MIXES = {
+    'read': 1.0,
+    'write': 0.0,
+    'mixed': 0.5
+}
+
+# offset from natural alignment
+ALIGNMENTS = {
+    'aligned': 0,
+    'unaligned': 1
+}
+
+
+def packet_stream(size, reads, offset, count=STREAM_LENGTH, seed=0):
+    '''
+    Returns a list of "count" read/write requests of "size" bytes to random
+    addresses, where the fraction "reads" of them are reads.  Addresses are
+    multiples of "size", plus "offset".
+    '''
+
+    rng = np.random.default_rng(seed)
+
+    # the largest UMI size (bytes per word) that evenly divides the packet
+    word_bytes = min(size, 4) if offset == 0 else 1
+    cmd_size = word_bytes.bit_length() - 1
+    cmd_len = (size // word_bytes) - 1
+
+    read_cmd = umi_pack(opcode=int(UmiCmd.UMI_REQ_READ), size=cmd_size, len=cmd_len)
+    write_cmd = umi_pack(opcode=int(UmiCmd.UMI_REQ_WRITE), size=cmd_size, len=cmd_len)
+
+    slots = (MEMORY_SIZE - size - offset) // size
+    addrs = (rng.integers(0, slots, count) * size) + offset
+    is_read = rng.random(count) < reads
+    data = rng.integers(0, 256, (count, size), dtype=np.uint8)
+
+    return [PyUmiPacket(read_cmd, int(addr), 0) if read
+            else PyUmiPacket(write_cmd, int(addr), 0, data[i])
+            for i, (addr, read) in enumerate(zip(addrs, is_read))]
+
+
+class NullUmi:
+    """Discards the responses sent by UmiBatchService"""
+
+    def send(self, p):
+        pass
+
+
+def per_packet(memory, packets, umi):
+    '''
+    Services packets one at a time with UmiRam.read() and UmiRam.write(),
+    sending a response for each, as test_prv32 did before UmiBatchService.
+    '''
+
+    read = int(UmiCmd.UMI_REQ_READ)
+    read_resp = int(UmiCmd.UMI_RESP_READ)
+    write_resp = int(UmiCmd.UMI_RESP_WRITE)
+
+    for p in packets:
+        if umi_opcode(p.cmd) == read:
+            data = memory.read(p)
+            umi.send(PyUmiPacket((p.cmd & 0xffffffe0) | read_resp, p.srcaddr, p.dstaddr, data))
+        else:
+            memory.write(p)
+            umi.send(PyUmiPacket((p.cmd & 0xffffffe0) | write_resp, p.srcaddr, p.dstaddr))
+
+
+def run(repeat=5, filter=None):
+    '''Runs the microbenchmarks, returning a dictionary of results.'''
+
+    results = {}
+
+    memory = UmiRam(MEMORY_SIZE)
+
+    router = UmiRouter()
+    router.register_region('MEM', memory, size=MEMORY_SIZE)
+    service = UmiBatchService(NullUmi(), router)
+    vectorized = UmiBatchService(NullUmi(), router, vectorize=True)
+
+    def single(packets):
+        # one request per batch, as with the PicoRV32
+        for p in packets:
+            service.process([p])
+
+    def add(name, fn, items):
+        if (filter is None) or (filter in name):
+            print(f'*** Running {name} ***', flush=True)
+            results[name] = measure(fn, items=items, repeat=repeat)
+
+    for mix, reads in MIXES.items():
+        for size in SIZES:
+            for alignment, offset in ALIGNMENTS.items():
+                if (size == 1) and (offset != 0):
+                    # single bytes are always aligned
+                    continue
+
+                packets = packet_stream(size, reads, offset)
+                prefix = f'umi_ram/{mix}/{size}B/{alignment}'
+
+                add(f'{prefix}/per_packet', lambda: per_packet(memory, packets, NullUmi()),
+                    len(packets))
+                add(f'{prefix}/batch', lambda: service.process(packets), len(packets))
+                add(f'{prefix}/vectorized', lambda: vectorized.process(packets), len(packets))
+                add(f'{prefix}/single', lambda: single(packets), len(packets))
+
+    addrs = [int(addr) for addr in np.random.default_rng(0).integers(0, MEMORY_SIZE, 4096)]
+
+    def check_addresses():
+        for addr in addrs:
+            memory.check_address(addr)
+
+    add('umi_ram/check_address', check_addresses, len(addrs))
+
+    return results
@@ -4,12 +4,27 @@
 # This code is licensed under Apache License 2.0 (see LICENSE for details)
 
 
+# Heavy dependencies (siliconcompiler, umi, lambdalib, switchboard, and the
+# tests) are imported in the functions that use them, so that importing this
+# module, and running a test, only load what is needed.  See
+# benchmarks/startup_bench.py for the startup time budget.
+
+import importlib
 import os
-import umi
-import lambdalib
-from siliconcompiler import Chip
-from siliconcompiler.targets import asap7_demo
-from siliconcompiler.flows import lintflow
+import sys
+
+# sources fetched from elsewhere: name -> (URL, ref).  These are looked up in
+# the local source store before going to the network (see source_store.py).
+SOURCES = {
+    'picorv32': ('git+https://github.com/YosysHQ/picorv32.git',
+                 'a7b56fc81ff1363d20fd0fb606752458cd810552')
+}
+
+# test name -> module with a run_test() function
+TESTS = {
+    'test_prv32': 'ebrick_demo.testbench.test_prv32',
+    'test_prv32_memagent': 'ebrick_demo.testbench.test_prv32_memagent'
+}
 
 
 def __add_ebrick_sources(chip):
@@ -23,6 +38,9 @@ def __add_ebrick_sources(chip):
     chip.add('option', 'idir', 'config', package='ebrick_demo')
 
     # Import umi and lambdalib libraries
+    import umi
+    import lambdalib
+
     chip.use(umi)
     chip.use(lambdalib)
 
@@ -33,11 +51,12 @@ def __add_ebrick_sources(chip):
 def setup_core_design(chip):
     __add_ebrick_sources(chip)
 
-    # Add picorv32 data source
-    chip.register_source(
-        name='picorv32',
-        path='git+https://github.com/YosysHQ/picorv32.git',
-        ref='a7b56fc81ff1363d20fd0fb606752458cd810552')
+    # Add picorv32 data source, using the copy in the local source store
+    # if it has been prefetched
+    from ebrick_demo.source_store import register_source
+
+    url, ref = SOURCES['picorv32']
+    register_source(chip, name='picorv32', path=url, ref=ref)
 
     # Add your core files here
     chip.input('picorv32.v', package='picorv32')
@@ -45,9 +64,44 @@ def setup_core_design(chip):
     # Add your library imports here
 
 
-def __setup_asicflow(chip):
+# Default asicflow settings, which may be overridden with the "asicflow"
+# argument of setup() (see sweep.py for exploring other values):
+# * density: target placement density, in percent
+# * gpl_uniform_placement_adjustment: OpenROAD global placement setting
+# * pin_layers: (vertical layers, horizontal layers) for pin placement;
+#   None selects the PDK default from PIN_LAYERS
+# * pin_min_distance: minimum pin spacing in tracks; None selects the PDK
+#   default from PIN_MIN_DISTANCE
+ASICFLOW_DEFAULTS = {
+    'density': 40,
+    'gpl_uniform_placement_adjustment': 0.2,
+    'pin_layers': None,
+    'pin_min_distance': None
+}
+
+# Pin placement layers for each PDK.  Multiple layers are used to avoid
+# pin placement congestion.
+PIN_LAYERS = {
+    'asap7': (['M3', 'M5'], ['M4', 'M6']),
+    'skywater130': (['met2', 'met4'], ['met1', 'met3'])
+}
+
+# Minimum pin placement distance in tracks for each PDK, which reduces
+# routing congestion
+PIN_MIN_DISTANCE = {
+    'asap7': 3
+}
+
+
+def __setup_asicflow(chip, options=None):
     # Setup asic flow
 
+    options = {**ASICFLOW_DEFAULTS, **(options or {})}
+
+    unknown = set(options) - set(ASICFLOW_DEFAULTS)
+    if unknown:
+        raise ValueError(f'Unknown asicflow options: {", ".join(sorted(unknown))}')
+
     # set SYNTHESIS macro
     chip.add('option', 'define', 'SYNTHESIS')
 
@@ -56,44 +110,40 @@ def __setup_asicflow(chip):
     chip.input(f'implementation/{mainlib}.sdc', package='ebrick_demo')
 
     # Setup physical constraints
-    chip.set('constraint', 'density', 40)
+    chip.set('constraint', 'density', options['density'])
 
     # Provide tool specific settings
     chip.set('tool', 'openroad', 'task', 'place', 'var',
              'gpl_uniform_placement_adjustment',
-             '0.2')
+             str(options['gpl_uniform_placement_adjustment']))
 
     pdk = chip.get('option', 'pdk')
-    if pdk == 'asap7':
+
+    pin_layers = options['pin_layers']
+    if pin_layers is None:
+        pin_layers = PIN_LAYERS.get(pdk)
+
+    if pin_layers is not None:
         # Change pin placement settings to allow for multiple layers
         # to avoid pin placement congestion
+        vertical, horizontal = pin_layers
         stackup = chip.get('option', 'stackup')
-        chip.set('pdk', pdk, 'var', 'openroad', 'pin_layer_vertical', stackup, [
-            'M3',
-            'M5'
-        ])
-        chip.set('pdk', pdk, 'var', 'openroad', 'pin_layer_horizontal', stackup, [
-            'M4',
-            'M6'
-        ])
-        # Change minimum pin placement distance to 3 tracks for tasks
+        chip.set('pdk', pdk, 'var', 'openroad', 'pin_layer_vertical', stackup,
+                 list(vertical))
+        chip.set('pdk', pdk, 'var', 'openroad', 'pin_layer_horizontal', stackup,
+                 list(horizontal))
+
+    pin_min_distance = options['pin_min_distance']
+    if pin_min_distance is None:
+        pin_min_distance = PIN_MIN_DISTANCE.get(pdk)
+
+    if pin_min_distance is not None:
+        # Change minimum pin placement distance for tasks
         # which impact pin placement to reduce routing congestion
         for task in ('floorplan', 'place'):
             chip.add('tool', 'openroad', 'task', task, 'var', 'ppl_arguments', [
                 '-min_distance_in_tracks',
-                '-min_distance', '3'])
-    elif pdk == 'skywater130':
-        # Change pin placement settings to allow for multiple layers
-        # to avoid pin placement congestion
-        stackup = chip.get('option', 'stackup')
-        chip.set('pdk', pdk, 'var', 'openroad', 'pin_layer_vertical', stackup, [
-            'met2',
-            'met4'
-        ])
-        chip.set('pdk', pdk, 'var', 'openroad', 'pin_layer_horizontal', stackup, [
-            'met1',
-            'met3'
-        ])
+                '-min_distance', str(pin_min_distance)])
 
 
 def __setup_lintflow(chip):
@@ -102,6 +152,8 @@ def __setup_lintflow(chip):
              f'{chip.get("option", "jobname")}_lint')
 
     # Import lintflow
+    from siliconcompiler.flows import lintflow
+
     chip.use(lintflow)
 
     # Add tool specific settings
@@ -118,14 +170,14 @@ def __setup_testbench(chip):
              'config/config.vlt', package='ebrick_demo')
 
 
-def setup(chip, testbench=False):
+def setup(chip, testbench=False, asicflow=None):
     # Add source files for this design
     setup_core_design(chip)
 
     if not testbench:
         flow = chip.get('option', 'flow')
         if flow == 'asicflow':
-            __setup_asicflow(chip)
+            __setup_asicflow(chip, options=asicflow)
         elif flow == 'lintflow':
             __setup_lintflow(chip)
         else:
@@ -136,17 +188,60 @@ def setup(chip, testbench=False):
     return chip
 
 
+# switches that control waveform dumping in test_prv32 (see
+# testbench/trace_control.py): switch -> help
+TRACE_SWITCHES = {
+    'trace_format': "waveform format: vcd, or fst (compressed)",
+    'trace_scope': "part of the design to dump: testbench, ebrick_core or picorv32",
+    'trace_start': "start dumping on a trigger: cycle=N, exit, uart=C, addr=A[:D] or status=N",
+    'trace_stop': "stop dumping on a trigger (same forms as -trace_start)"
+}
+
+
+def run_test(test, trace=False, fast=False, **trace_options):
+    # the test module is imported only when it is run; this also avoids a
+    # circular import, since the tests import ebrick
+    module = importlib.import_module(TESTS[test])
+
+    # trace options are only passed on when set, since only test_prv32 takes them
+    trace_options = {k: v for k, v in trace_options.items() if v is not None}
+    if trace_options and not trace:
+        raise ValueError(f'-{", -".join(trace_options)} requires -trace')
+    if trace_options and (test != 'test_prv32'):
+        raise ValueError(f'-{", -".join(trace_options)} is only supported by test_prv32')
+
+    module.run_test(trace=trace, fast=fast, **trace_options)
+
+
+def __test_main(argv):
+    # Fast path for -test: the test switches are parsed without building the
+    # SiliconCompiler command line, which only the flows need
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(prog='ebrick.py', prefix_chars='-')
+    parser.add_argument('-test', nargs='?', const='test_prv32', choices=list(TESTS.keys()),
+                        help='run a test, defaulting to test_prv32')
+    parser.add_argument('-trace', action='store_true',
+                        help="dump waveforms during simulation")
+    parser.add_argument('-fast', action='store_true',
+                        help="don't rebuild the simulator if its sources are unchanged")
+    for switch, help in TRACE_SWITCHES.items():
+        parser.add_argument(f'-{switch}', help=help)
+
+    args = parser.parse_args(argv)
+
+    run_test(args.test, trace=args.trace, fast=args.fast,
+             **{switch: getattr(args, switch) for switch in TRACE_SWITCHES})
+
+
 def main():
-    chip = Chip("ebrick-demo")
+    if '-test' in sys.argv[1:]:
+        __test_main(sys.argv[1:])
+        return
 
-    # needed because the test imports ebrick
-    from ebrick_demo.testbench.test_prv32 import run_test as run_test_prv32
-    from ebrick_demo.testbench.test_prv32_memagent import run_test as run_test_prv32_memagent
+    from siliconcompiler import Chip
 
-    run_test_map = {
-        'test_prv32': run_test_prv32,
-        'test_prv32_memagent': run_test_prv32_memagent
-    }
+    chip = Chip("ebrick-demo")
 
     args = chip.create_cmdline(
         switchlist=['-target',
@@ -160,7 +255,7 @@ def main():
                 'type': str,
                 'nargs': '?',
                 'const': 'test_prv32',
-                'choices': list(run_test_map.keys()),
+                'choices': list(TESTS.keys()),
                 'help': 'run a test, defaulting to test_prv32',
                 'sc_print': False
             },
@@ -171,17 +266,22 @@ def main():
             },
             '-fast': {
                 'action': 'store_true',
-                'help': "don't build the simulator if one is found",
+                'help': "don't rebuild the simulator if its sources are unchanged",
                 'sc_print': False
-            }
+            },
+            '-incremental': {
+                'action': 'store_true',
+                'help': "skip the lintflow if its inputs are unchanged since the last run",
+                'sc_print': False
+            },
+            **{f'-{switch}': {'type': str, 'help': help, 'sc_print': False}
+               for switch, help in TRACE_SWITCHES.items()}
         }
     )
 
     if args['test']:
-        run_test_map[args['test']](
-            trace=args['trace'],
-            fast=args['fast']
-        )
+        run_test(args['test'], trace=args['trace'], fast=args['fast'],
+                 **{switch: args[switch] for switch in TRACE_SWITCHES})
         return
 
     ################################
@@ -190,11 +290,19 @@ def main():
 
     if not chip.get('option', 'target'):
         # load the target if it wasn't specified at the CLI
+        from siliconcompiler.targets import asap7_demo
+
         chip.load_target(asap7_demo)
 
     # Setup chip
     setup(chip)
 
+    if chip.get('option', 'flow') == 'lintflow':
+        from ebrick_demo.lint_cache import run_lint
+
+        run_lint(chip, incremental=args['incremental'])
+        return
+
     chip.run()
     chip.summary()
 
@@ -0,0 +1,152 @@
+# Fingerprints of the inputs to a SiliconCompiler build
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import hashlib
+import json
+import subprocess
+
+from functools import lru_cache
+from pathlib import Path
+
+# package sources that are fetched rather than read from the local disk.
+# these are identified by their URL and ref instead of their contents.
+REMOTE_SCHEMES = ('git://', 'git+', 'http://', 'https://', 'ssh://')
+
+# file suffixes hashed when a directory (e.g. an include directory) is an input
+HDL_SUFFIXES = ('.v', '.sv', '.vh', '.svh', '.vlt')
+
+# schema keys holding directories and settings that affect a build
+DIR_KEYPATHS = [
+    ('option', 'idir'),
+    ('option', 'ydir')
+]
+VALUE_KEYPATHS = [
+    ('option', 'define'),
+    ('option', 'undefine'),
+    ('option', 'entrypoint')
+]
+
+
+@lru_cache(maxsize=None)
+def tool_version(tool):
+    '''Returns the version reported by "<tool> --version", or "unknown".'''
+
+    try:
+        result = subprocess.run([tool, '--version'], capture_output=True, text=True)
+    except OSError:
+        return 'unknown'
+
+    return result.stdout.strip() or 'unknown'
+
+
+def file_digest(path):
+    '''Returns the SHA-256 hex digest of a file's contents.'''
+
+    h = hashlib.sha256()
+
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+def fingerprint_chip(chip, tool, task, extra=None):
+    '''
+    Fingerprints the inputs of a chip for the given tool and task.
+
+    Returns a dictionary with:
+    * "files": digest of each input file, keyed by "<package>:<path>", which
+      does not depend on where the repository is checked out
+    * "values": settings that affect the build (defines, package refs, tool
+      version, and anything passed in "extra")
+    * "digest": a digest of all of the above
+    '''
+
+    files = {}
+    values = {'tool': tool, 'task': task, 'version': tool_version(tool)}
+
+    if extra is not None:
+        values['extra'] = extra
+
+    def resolve_package(prefix, package):
+        # returns the local root of a package, or None for remote packages,
+        # which are recorded by URL and ref instead
+        for keypath in (prefix + ('package', 'source', package), ('package', 'source', package)):
+            if package in _getkeys(chip, *keypath[:-1]):
+                url = chip.get(*keypath, 'path')
+                ref = chip.get(*keypath, 'ref')
+                break
+        else:
+            url, ref = None, None
+
+        if url is not None and str(url).startswith(REMOTE_SCHEMES):
+            values[f'package:{package}'] = f'{url}@{ref}'
+            return None
+
+        from siliconcompiler.package import path as sc_path
+        return Path(sc_path(chip, package))
+
+    def add_path(prefix, value, package, directory=False):
+        label = f'{package or ""}:{value}'
+
+        if package:
+            root = resolve_package(prefix, package)
+            if root is None:
+                return
+            path = root / value
+        else:
+            path = Path(value)
+
+        if not directory:
+            files[label] = file_digest(path)
+        elif path.is_dir():
+            for item in sorted(path.iterdir()):
+                if item.is_file() and item.suffix in HDL_SUFFIXES:
+                    files[f'{label}/{item.name}'] = file_digest(item)
+
+    def add_keypath(prefix, keypath, directory=False):
+        keypath = prefix + keypath
+        paths = chip.get(*keypath)
+        packages = chip.get(*keypath, field='package')
+
+        for value, package in zip(paths, packages):
+            add_path(prefix, value, package, directory=directory)
+
+    # the design itself, followed by each library it uses
+    prefixes = [()] + [('library', lib) for lib in sorted(_getkeys(chip, 'library'))]
+
+    for prefix in prefixes:
+        for fileset in _getkeys(chip, *prefix, 'input'):
+            for filetype in _getkeys(chip, *prefix, 'input', fileset):
+                add_keypath(prefix, ('input', fileset, filetype))
+
+        for keypath in DIR_KEYPATHS:
+            add_keypath(prefix, keypath, directory=True)
+
+        for keypath in VALUE_KEYPATHS:
+            value = chip.get(*prefix, *keypath)
+            if value:
+                values[':'.join(prefix + keypath)] = value
+
+    # tool configuration files, such as config.vlt, and extra tool options,
+    # such as --trace-depth
+    add_keypath((), ('tool', tool, 'task', task, 'file', 'config'))
+
+    options = chip.get('tool', tool, 'task', task, 'option')
+    if options:
+        values[f'tool:{tool}:{task}:option'] = options
+
+    digest = hashlib.sha256(json.dumps({'files': files, 'values': values}, sort_keys=True,
+                                       default=str).encode()).hexdigest()
+
+    return {'files': files, 'values': values, 'digest': digest}
+
+
+def _getkeys(chip, *keypath):
+    try:
+        return chip.getkeys(*keypath)
+    except Exception:
+        return []
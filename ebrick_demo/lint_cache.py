@@ -0,0 +1,95 @@
+# Reuses lint results when the inputs to the lint run are unchanged
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import io
+import json
+
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from ebrick_demo.fingerprint import fingerprint_chip
+
+# file in the lint job directory recording the fingerprint and summary of
+# the last successful run
+LINT_RECORD = 'lint_fingerprint.json'
+
+
+def lint_record_path(chip):
+    '''Returns the path of the lint record for the chip's current job.'''
+
+    return Path(chip.get('option', 'builddir')) / chip.design / chip.get('option', 'jobname') / \
+        LINT_RECORD
+
+
+def load_lint_record(chip):
+    '''Returns the lint record of the chip's current job, or None if there is none.'''
+
+    try:
+        with open(lint_record_path(chip)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def changed_files(old, new):
+    '''Returns the sorted labels of the files that differ between two fingerprints.'''
+
+    old_files = old['files']
+    new_files = new['files']
+
+    return sorted(label for label in set(old_files) | set(new_files)
+                  if old_files.get(label) != new_files.get(label))
+
+
+def run_lint(chip, incremental=True):
+    '''
+    Runs the lint flow on a chip that has been set up with ebrick.setup(), and
+    prints its summary.
+
+    If "incremental" is set, the inputs of the run (each source file, include
+    directory, define, config.vlt, package ref, and the Verilator version) are
+    fingerprinted, and when they match the last successful run of the same
+    job, the run is skipped and its summary is printed again.  Returns True if
+    the previous result was reused.
+
+    Verilator lints the design as a whole, starting from the top module, so a
+    change to any file causes the whole design to be linted again; the files
+    that changed are listed to show why.
+    '''
+
+    fingerprint = None
+
+    if incremental:
+        fingerprint = fingerprint_chip(chip, 'verilator', 'lint',
+                                       extra={'flow': chip.get('option', 'flow')})
+
+        record = load_lint_record(chip)
+
+        if record is not None:
+            if record['fingerprint']['digest'] == fingerprint['digest']:
+                chip.logger.info('Lint inputs are unchanged, reusing the previous result')
+                print(record['summary'], end='')
+                return True
+
+            changed = changed_files(record['fingerprint'], fingerprint)
+            if changed:
+                chip.logger.info(f'Lint inputs changed: {", ".join(changed)}')
+            else:
+                chip.logger.info('Lint settings changed')
+
+    chip.run()
+
+    # keep a copy of the summary to print when the result is reused
+    summary = io.StringIO()
+    with redirect_stdout(summary):
+        chip.summary()
+    print(summary.getvalue(), end='')
+
+    if fingerprint is not None:
+        with open(lint_record_path(chip), 'w') as f:
+            json.dump({'fingerprint': fingerprint, 'summary': summary.getvalue()}, f,
+                      indent=2, sort_keys=True, default=str)
+
+    return False
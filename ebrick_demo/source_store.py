@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+# Local store of fetched package sources, so that runs don't need the network
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+
+from pathlib import Path
+
+from ebrick_demo.testbench.sim_build import file_lock
+
+# default location of the store, which may be shared by several checkouts of
+# this repository (and, on a shared file system, by several hosts)
+DEFAULT_STORE_DIR = Path(os.environ.get(
+    'EBRICK_DEMO_CACHE', Path.home() / '.cache' / 'ebrick_demo')) / 'sources'
+
+# file in each entry describing where it came from
+SOURCE_RECORD = 'source.json'
+
+
+def store_dir(directory=None):
+    '''Returns "directory" if given, otherwise $EBRICK_DEMO_SOURCES or the default store.'''
+
+    if directory is not None:
+        return Path(directory)
+    return Path(os.environ.get('EBRICK_DEMO_SOURCES', DEFAULT_STORE_DIR))
+
+
+def source_key(url, ref):
+    '''Returns the key of a source in the store, which identifies its URL and ref.'''
+
+    return hashlib.sha256(f'{url}@{ref}'.encode()).hexdigest()[:32]
+
+
+def lookup(url, ref, directory=None):
+    '''Returns the directory holding the source at url and ref, or None if it is not stored.'''
+
+    entry = store_dir(directory) / source_key(url, ref)
+
+    # entries are only renamed into place once complete, so an entry with a
+    # record is always a complete copy
+    if (entry / SOURCE_RECORD).is_file():
+        return entry
+
+    return None
+
+
+def fetch(url, ref, directory=None):
+    '''
+    Returns the directory holding the source at url and ref, cloning it into
+    the store first if needed.  Concurrent fetches of the same source are
+    serialized with a lock file, so it is cloned once.
+    '''
+
+    root = store_dir(directory)
+    key = source_key(url, ref)
+
+    with file_lock(root / f'.{key}.lock'):
+        entry = lookup(url, ref, root)
+        if entry is not None:
+            return entry
+
+        tmp = Path(tempfile.mkdtemp(dir=root, prefix=f'.{key}.'))
+        try:
+            _clone(url, ref, tmp)
+
+            with open(tmp / SOURCE_RECORD, 'w') as f:
+                json.dump({'url': url, 'ref': ref}, f, indent=2)
+
+            os.rename(tmp, root / key)
+        finally:
+            if tmp.exists():
+                shutil.rmtree(tmp)
+
+    return root / key
+
+
+def _clone(url, ref, path):
+    # fetches only the commit needed, and drops the git metadata, which the
+    # builds don't use
+    git_url = url[len('git+'):] if url.startswith('git+') else url
+
+    for cmd in (['git', 'init', '--quiet'],
+                ['git', 'fetch', '--quiet', '--depth', '1', git_url, ref],
+                ['git', 'checkout', '--quiet', 'FETCH_HEAD']):
+        subprocess.run(cmd, cwd=path, check=True)
+
+    shutil.rmtree(path / '.git')
+
+
+def register_source(chip, name, path, ref, directory=None):
+    '''
+    Registers a package source with chip, using the copy in the store if there
+    is one, and otherwise the URL (which SiliconCompiler fetches on its own).
+    '''
+
+    entry = lookup(path, ref, directory)
+
+    if entry is not None:
+        chip.register_source(name=name, path=str(entry.resolve()))
+    else:
+        chip.register_source(name=name, path=path, ref=ref)
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    import ebrick_demo.ebrick as ebrick
+
+    parser = ArgumentParser(description='Manage the local store of package sources.')
+    parser.add_argument('command', choices=['prefetch', 'list'],
+        help="prefetch: fetch the sources used by ebrick.py into the store; "
+        "list: show where each source is stored")
+    parser.add_argument('--store',
+        help=f"store directory (default: $EBRICK_DEMO_SOURCES or {DEFAULT_STORE_DIR})")
+
+    args = parser.parse_args()
+
+    for name, (url, ref) in ebrick.SOURCES.items():
+        if args.command == 'prefetch':
+            entry = fetch(url, ref, args.store)
+        else:
+            entry = lookup(url, ref, args.store)
+
+        print(f'{name}: {url}@{ref} -> {entry if entry is not None else "not stored"}')
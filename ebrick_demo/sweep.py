@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+# Runs the asicflow for every point of a grid of settings and compares the results
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import itertools
+import json
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+from siliconcompiler import Chip
+
+import ebrick_demo.ebrick as ebrick
+
+# metrics reported for each point, taken from the last node of the flow that
+# reports them
+DEFAULT_METRICS = [
+    'cellarea',
+    'totalarea',
+    'utilization',
+    'setupwns',
+    'setuptns',
+    'holdwns'
+]
+
+
+def expand_grid(grid):
+    '''
+    Returns every combination of the values in grid, which maps asicflow
+    option names (see ebrick.ASICFLOW_DEFAULTS) to lists of values.
+    '''
+
+    unknown = set(grid) - set(ebrick.ASICFLOW_DEFAULTS)
+    if unknown:
+        raise ValueError(f'Unknown asicflow options: {", ".join(sorted(unknown))}')
+
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+def node_order(chip, flow):
+    '''Returns the (step, index) nodes of a flow, with every node after its inputs.'''
+
+    nodes = [(step, index) for step in chip.getkeys('flowgraph', flow)
+             for index in chip.getkeys('flowgraph', flow, step)]
+
+    depth = {}
+
+    def node_depth(node):
+        if node not in depth:
+            inputs = chip.get('flowgraph', flow, *node, 'input')
+            depth[node] = 1 + max([node_depth(tuple(i)) for i in inputs], default=-1)
+        return depth[node]
+
+    return sorted(nodes, key=node_depth)
+
+
+def collect_metrics(chip, metrics=None):
+    '''
+    Returns a dictionary of metrics from a finished run: each metric in
+    "metrics" from the last node that reports it, the run time of each step
+    (summed over its indices) under "steps", and the total under "time".
+    '''
+
+    metrics = metrics if metrics is not None else DEFAULT_METRICS
+    flow = chip.get('option', 'flow')
+
+    result = {metric: None for metric in metrics}
+    steps = {}
+
+    for step, index in node_order(chip, flow):
+        for metric in metrics:
+            value = chip.get('metric', metric, step=step, index=index)
+            if value is not None:
+                result[metric] = value
+
+        tasktime = chip.get('metric', 'tasktime', step=step, index=index)
+        if tasktime is not None:
+            steps[step] = steps.get(step, 0) + tasktime
+
+    result['steps'] = steps
+    result['time'] = sum(steps.values())
+
+    return result
+
+
+def run_point(point, jobname, target='asap7_demo', builddir=None, metrics=None):
+    '''
+    Runs the asicflow with the asicflow options in "point" as job "jobname",
+    returning a dictionary with the point, its metrics and any error.
+    '''
+
+    row = {'job': jobname, 'point': point, 'error': None}
+
+    try:
+        chip = Chip('ebrick-demo')
+        chip.set('option', 'jobname', jobname)
+        chip.set('option', 'quiet', True)
+        if builddir is not None:
+            chip.set('option', 'builddir', os.path.abspath(builddir))
+
+        chip.load_target(target)
+        chip.set('option', 'flow', 'asicflow')
+
+        ebrick.setup(chip, asicflow=point)
+
+        chip.run()
+
+        row.update(collect_metrics(chip, metrics))
+    except Exception as e:
+        row['error'] = f'{type(e).__name__}: {e}'
+
+    return row
+
+
+def run_sweep(grid, target='asap7_demo', workers=None, jobname='sweep', builddir=None,
+              metrics=None):
+    '''
+    Runs the asicflow for every point in grid (see expand_grid), up to
+    "workers" points at a time, returning a list of results in grid order.
+
+    Each point is a separate Chip with its own job (<jobname>_<n>) in the
+    same build directory, so the results of every point are kept.
+    '''
+
+    points = expand_grid(grid)
+
+    if workers is None:
+        workers = max(1, os.cpu_count() // 4)
+
+    # each point runs in its own process, since a Chip run is not thread-safe
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_point, point, f'{jobname}_{n:03d}', target,
+                                   builddir, metrics)
+                   for n, point in enumerate(points)]
+        return [future.result() for future in futures]
+
+
+def _format(value):
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return f'{value:.4g}'
+    if isinstance(value, (list, tuple)):
+        # e.g. pin_layers: [['M3', 'M5'], ['M4', 'M6']] -> M3,M5/M4,M6
+        nested = any(isinstance(v, (list, tuple)) for v in value)
+        return ('/' if nested else ',').join(_format(v) for v in value)
+    return str(value)
+
+
+def _table(header, rows):
+    widths = [max(len(cell) for cell in column) for column in zip(header, *rows)]
+    return ['  '.join(f'{cell:<{w}}' for cell, w in zip(line, widths)).rstrip()
+            for line in [header] + rows]
+
+
+def summarize(results, metrics=None, sort=None):
+    '''Returns a printable comparison table of sweep results, optionally sorted by a metric.'''
+
+    metrics = metrics if metrics is not None else DEFAULT_METRICS
+
+    names = []
+    for r in results:
+        names += [name for name in r['point'] if name not in names]
+
+    if sort is not None:
+        # failed runs and missing values go last
+        results = sorted(results, key=lambda r: (r.get(sort) is None, r.get(sort) or 0))
+
+    header = ['job'] + names + metrics + ['time (s)']
+    rows = []
+    for r in results:
+        params = [_format(r['point'].get(name)) for name in names]
+        values = [_format(r.get(metric)) for metric in metrics]
+        rows.append([r['job']] + params + values + [_format(r.get('time'))])
+
+    lines = _table(header, rows)
+
+    # run time of each step, to show where the time goes
+    steps = []
+    for r in results:
+        steps += [step for step in r.get('steps', {}) if step not in steps]
+
+    if steps:
+        lines.append('')
+        lines += _table(['job'] + steps,
+                        [[r['job']] + [_format(r.get('steps', {}).get(step)) for step in steps]
+                         for r in results])
+
+    for r in results:
+        if r['error'] is not None:
+            lines.append(f'{r["job"]} failed: {r["error"]}')
+
+    return '\n'.join(lines)
+
+
+def parse_param(text):
+    '''Parses "name=v1,v2,..." into (name, [v1, v2, ...]), reading values as JSON if possible.'''
+
+    name, sep, values = text.partition('=')
+    if not sep:
+        raise ValueError(f'Expected name=value[,value...], got {text}')
+
+    def parse(value):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return value
+
+    return name, [parse(value) for value in values.split(',')]
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description='Run the asicflow over a grid of settings.')
+    parser.add_argument('--grid',
+        help="JSON file mapping asicflow options to lists of values")
+    parser.add_argument('--param', action='append', default=[],
+        help="option and values to sweep, e.g. density=30,40,50; may be repeated")
+    parser.add_argument('--target', default='asap7_demo',
+        help="SiliconCompiler target (default: asap7_demo)")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+        help="number of points run at once (default: a quarter of the cores)")
+    parser.add_argument('--jobname', default='sweep',
+        help="prefix of the job names of the points")
+    parser.add_argument('--builddir',
+        help="directory for the builds (default: ./build)")
+    parser.add_argument('--sort',
+        help="metric to sort the table by, e.g. setupwns")
+    parser.add_argument('--json',
+        help="write the results to this JSON file")
+
+    args = parser.parse_args()
+
+    grid = {}
+    if args.grid is not None:
+        with open(args.grid) as f:
+            grid.update(json.load(f))
+
+    try:
+        grid.update(parse_param(param) for param in args.param)
+        points = expand_grid(grid)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f'*** Running {len(points)} points ***')
+
+    results = run_sweep(grid, target=args.target, workers=args.workers, jobname=args.jobname,
+                        builddir=args.builddir)
+
+    print(summarize(results, sort=args.sort))
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
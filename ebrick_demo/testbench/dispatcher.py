@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+# Polling loop with configurable wait strategies for switchboard queues
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+
+import time
+
+
+class SpinWait:
+    """Polls again immediately, keeping one host core busy"""
+
+    def reset(self):
+        pass
+
+    def idle(self):
+        pass
+
+
+class SpinYieldWait:
+    """Spins for a while, then yields the host core between polls"""
+
+    def __init__(self, spins=1000):
+        self.spins = spins
+        self.count = 0
+
+    def reset(self):
+        self.count = 0
+
+    def idle(self):
+        if self.count < self.spins:
+            self.count += 1
+        else:
+            time.sleep(0)
+
+
+class BackoffWait:
+    """Spins for a while, then sleeps for exponentially longer periods between polls"""
+
+    def __init__(self, spins=1000, min_sleep=1e-6, max_sleep=1e-3):
+        self.spins = spins
+        self.min_sleep = min_sleep
+        self.max_sleep = max_sleep
+
+        self.count = 0
+        self.sleep = min_sleep
+
+    def reset(self):
+        self.count = 0
+        self.sleep = self.min_sleep
+
+    def idle(self):
+        if self.count < self.spins:
+            self.count += 1
+        else:
+            time.sleep(self.sleep)
+            self.sleep = min(2 * self.sleep, self.max_sleep)
+
+
+WAIT_STRATEGIES = {
+    'spin': SpinWait,
+    'yield': SpinYieldWait,
+    'backoff': BackoffWait
+}
+
+
+class Dispatcher:
+    """Calls a polling function until told to stop
+
+    "poll" is called repeatedly and returns the amount of work it did (for
+    example, the number of UMI packets handled).  When it returns zero, the
+    wait strategy decides how long to wait before polling again.  The default,
+    "spin", polls again at once, which keeps the response time of the host
+    lowest.  The time spent in productive and unproductive polls is
+    accumulated so that it can be reported at the end of a run.
+    """
+
+    def __init__(self, poll, wait='spin'):
+        self.poll = poll
+
+        if isinstance(wait, str):
+            if wait not in WAIT_STRATEGIES:
+                raise ValueError(f'Unknown wait strategy: {wait}')
+            wait = WAIT_STRATEGIES[wait]()
+        self.wait = wait
+
+        self.busy_time = 0.0
+        self.idle_time = 0.0
+        self.busy_polls = 0
+        self.idle_polls = 0
+
+    def step(self):
+        '''Polls once, waiting afterwards if there was nothing to do.'''
+
+        start = time.perf_counter()
+        try:
+            work = self.poll()
+        except BaseException:
+            # a poll that fails still counts towards the busy time
+            self.busy_time += time.perf_counter() - start
+            self.busy_polls += 1
+            raise
+        stop = time.perf_counter()
+
+        if work:
+            self.busy_time += stop - start
+            self.busy_polls += 1
+            self.wait.reset()
+        else:
+            self.wait.idle()
+            self.idle_time += time.perf_counter() - start
+            self.idle_polls += 1
+
+        return work
+
+    def run(self, until=None):
+        '''Polls until "until" returns True, or forever if it is not provided.'''
+
+        while (until is None) or (not until()):
+            self.step()
+
+    def report(self):
+        '''Returns a one-line summary of where the time was spent.'''
+
+        total = self.busy_time + self.idle_time
+        busy = (100 * self.busy_time / total) if total > 0 else 0
+
+        return (f'host busy {self.busy_time:.3f}s ({busy:.1f}%, {self.busy_polls} polls), '
+                f'idle {self.idle_time:.3f}s ({self.idle_polls} polls), '
+                f'wait strategy: {type(self.wait).__name__}')
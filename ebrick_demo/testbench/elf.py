@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+
+# Loads ELF executables directly into memory models
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+
+import bisect
+import numpy as np
+
+from collections import namedtuple
+
+ELF_MAGIC = b'\x7fELF'
+
+# e_ident[EI_CLASS]
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+
+# e_ident[EI_DATA]
+ELFDATA2LSB = 1
+
+# p_type
+PT_LOAD = 1
+
+# p_flags
+PF_X = 1
+PF_W = 2
+PF_R = 4
+
+# sh_type
+SHT_SYMTAB = 2
+SHT_NOBITS = 8
+
+# sh_flags
+SHF_WRITE = 0x1
+SHF_ALLOC = 0x2
+SHF_EXECINSTR = 0x4
+
+# symbol types, from st_info
+STT_NOTYPE = 0
+STT_OBJECT = 1
+STT_FUNC = 2
+
+_IDENT_DTYPE = np.dtype([('magic', 'S4'), ('class', 'u1'), ('data', 'u1')])
+
+_DTYPES = {
+    ELFCLASS32: {
+        'ehdr': np.dtype([
+            ('ident', 'S16'), ('type', '<u2'), ('machine', '<u2'), ('version', '<u4'),
+            ('entry', '<u4'), ('phoff', '<u4'), ('shoff', '<u4'), ('flags', '<u4'),
+            ('ehsize', '<u2'), ('phentsize', '<u2'), ('phnum', '<u2'),
+            ('shentsize', '<u2'), ('shnum', '<u2'), ('shstrndx', '<u2')
+        ]),
+        'phdr': np.dtype([
+            ('type', '<u4'), ('offset', '<u4'), ('vaddr', '<u4'), ('paddr', '<u4'),
+            ('filesz', '<u4'), ('memsz', '<u4'), ('flags', '<u4'), ('align', '<u4')
+        ]),
+        'shdr': np.dtype([
+            ('name', '<u4'), ('type', '<u4'), ('flags', '<u4'), ('addr', '<u4'),
+            ('offset', '<u4'), ('size', '<u4'), ('link', '<u4'), ('info', '<u4'),
+            ('addralign', '<u4'), ('entsize', '<u4')
+        ]),
+        'sym': np.dtype([
+            ('name', '<u4'), ('value', '<u4'), ('size', '<u4'), ('info', 'u1'),
+            ('other', 'u1'), ('shndx', '<u2')
+        ])
+    },
+    ELFCLASS64: {
+        'ehdr': np.dtype([
+            ('ident', 'S16'), ('type', '<u2'), ('machine', '<u2'), ('version', '<u4'),
+            ('entry', '<u8'), ('phoff', '<u8'), ('shoff', '<u8'), ('flags', '<u4'),
+            ('ehsize', '<u2'), ('phentsize', '<u2'), ('phnum', '<u2'),
+            ('shentsize', '<u2'), ('shnum', '<u2'), ('shstrndx', '<u2')
+        ]),
+        'phdr': np.dtype([
+            ('type', '<u4'), ('flags', '<u4'), ('offset', '<u8'), ('vaddr', '<u8'),
+            ('paddr', '<u8'), ('filesz', '<u8'), ('memsz', '<u8'), ('align', '<u8')
+        ]),
+        'shdr': np.dtype([
+            ('name', '<u4'), ('type', '<u4'), ('flags', '<u8'), ('addr', '<u8'),
+            ('offset', '<u8'), ('size', '<u8'), ('link', '<u4'), ('info', '<u4'),
+            ('addralign', '<u8'), ('entsize', '<u8')
+        ]),
+        'sym': np.dtype([
+            ('name', '<u4'), ('info', 'u1'), ('other', 'u1'), ('shndx', '<u2'),
+            ('value', '<u8'), ('size', '<u8')
+        ])
+    }
+}
+
+Segment = namedtuple('Segment', ['paddr', 'vaddr', 'data', 'memsz', 'flags'])
+
+Section = namedtuple('Section', ['name', 'addr', 'data', 'size', 'flags'])
+
+Symbol = namedtuple('Symbol', ['name', 'value', 'size', 'type'])
+
+
+class ElfFile:
+    """A little-endian ELF executable, mapped into memory
+
+    The file is memory-mapped read-only, and the contents of each PT_LOAD
+    segment ("data" in each Segment) are views into that mapping, so loading
+    a program copies each byte once, straight into the memory model.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = np.memmap(filename, dtype=np.uint8, mode='r')
+
+        ident = self.file[:_IDENT_DTYPE.itemsize].view(_IDENT_DTYPE)[0]
+        if ident['magic'] != ELF_MAGIC:
+            raise ValueError(f'{filename} is not an ELF file')
+        if ident['class'] not in _DTYPES:
+            raise ValueError(f'{filename} has unsupported ELF class {ident["class"]}')
+        if ident['data'] != ELFDATA2LSB:
+            raise ValueError(f'{filename} is not little-endian')
+
+        self.dtypes = _DTYPES[int(ident['class'])]
+        self.header = self._table(0, 1, 'ehdr')[0]
+
+        self.entry = int(self.header['entry'])
+
+        phdrs = self._table(self.header['phoff'], self.header['phnum'], 'phdr')
+        self.segments = [
+            Segment(
+                paddr=int(ph['paddr']),
+                vaddr=int(ph['vaddr']),
+                data=self.file[int(ph['offset']):int(ph['offset']) + int(ph['filesz'])],
+                memsz=int(ph['memsz']),
+                flags=int(ph['flags'])
+            )
+            for ph in phdrs if ph['type'] == PT_LOAD
+        ]
+
+        self._sections = None
+        self._symbols = None
+        self._functions = None
+
+    def _table(self, offset, count, kind):
+        dtype = self.dtypes[kind]
+        offset = int(offset)
+        return self.file[offset:offset + int(count) * dtype.itemsize].view(dtype)
+
+    def _string(self, table_offset, index):
+        start = int(table_offset) + int(index)
+        end = start
+        while self.file[end] != 0:
+            end += 1
+        return bytes(self.file[start:end]).decode()
+
+    @property
+    def sections(self):
+        '''Dictionary mapping section names to Sections, read from the headers on first use.'''
+
+        if self._sections is None:
+            self._sections = {}
+
+            shdrs = self._table(self.header['shoff'], self.header['shnum'], 'shdr')
+            if len(shdrs) > 0:
+                shstrtab = shdrs[self.header['shstrndx']]
+
+            for sh in shdrs:
+                if sh['name'] == 0:
+                    continue
+
+                offset = int(sh['offset'])
+                size = int(sh['size'])
+                name = self._string(shstrtab['offset'], sh['name'])
+                self._sections[name] = Section(
+                    name=name,
+                    addr=int(sh['addr']),
+                    data=self.file[offset:offset + (size if sh['type'] != SHT_NOBITS else 0)],
+                    size=size,
+                    flags=int(sh['flags'])
+                )
+
+        return self._sections
+
+    @property
+    def symbols(self):
+        '''Dictionary mapping symbol names to Symbols, read from .symtab on first use.'''
+
+        if self._symbols is None:
+            self._symbols = {}
+
+            shdrs = self._table(self.header['shoff'], self.header['shnum'], 'shdr')
+            for sh in shdrs:
+                if sh['type'] != SHT_SYMTAB:
+                    continue
+
+                strtab = shdrs[sh['link']]
+                syms = self._table(sh['offset'], int(sh['size']) // self.dtypes['sym'].itemsize,
+                                   'sym')
+
+                for sym in syms:
+                    if sym['name'] == 0:
+                        continue
+                    name = self._string(strtab['offset'], sym['name'])
+                    self._symbols[name] = Symbol(name=name, value=int(sym['value']),
+                                                 size=int(sym['size']),
+                                                 type=int(sym['info']) & 0xf)
+
+        return self._symbols
+
+    def function(self, addr):
+        '''Returns the function symbol containing addr, or None.'''
+
+        if self._functions is None:
+            functions = sorted((s for s in self.symbols.values() if s.type == STT_FUNC),
+                               key=lambda s: s.value)
+            boundaries = sorted({s.value for s in self.symbols.values()})
+            self._functions = ([s.value for s in functions], functions, boundaries)
+
+        starts, functions, boundaries = self._functions
+        i = bisect.bisect_right(starts, addr) - 1
+
+        if i < 0:
+            return None
+
+        s = functions[i]
+        if s.size != 0:
+            return s if addr < s.value + s.size else None
+
+        # symbols without a size (such as those defined in assembly) are
+        # taken to extend to the next symbol of any kind; the last one in the
+        # file has no bound, so it is not taken to contain anything after it
+        j = bisect.bisect_right(boundaries, s.value)
+        if (j < len(boundaries)) and (addr < boundaries[j]):
+            return s
+
+        return None
+
+    def load(self, memory):
+        '''
+        Loads each PT_LOAD segment into memory (for example, a UmiRam) at its
+        physical address, zero-filling the part of the segment that is not in
+        the file (.bss).  Returns the entry point.
+        '''
+
+        for segment in self.segments:
+            if segment.data.size > 0:
+                memory.initialize_memory(segment.paddr, segment.data)
+
+            bss = segment.memsz - segment.data.size
+            if bss > 0:
+                memory.initialize_memory(segment.paddr + segment.data.size,
+                                         np.zeros(bss, dtype=np.uint8))
+
+        return self.entry
+
+
+def load_elf(memory, filename):
+    '''Loads an ELF executable into memory, returning the ElfFile.'''
+
+    elf = ElfFile(filename)
+    elf.load(memory)
+    return elf
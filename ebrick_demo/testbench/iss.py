@@ -0,0 +1,574 @@
+#!/usr/bin/env python3
+
+# RV32IM instruction-set simulator for checking programs without the RTL
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+
+import numpy as np
+
+from collections import namedtuple
+
+from switchboard import PyUmiPacket, UmiCmd, umi_pack, umi_opcode, umi_size, umi_len
+
+from ebrick_demo.testbench.umi_router import CHIP_ADDR_MASK
+
+MASK = 0xFFFFFFFF
+
+# memory transactions logged in lockstep mode, in the form the PicoRV32 issues
+# them: instruction fetches and loads are aligned 32-bit reads, while stores
+# write only the bytes stored
+Transaction = namedtuple('Transaction', ['write', 'addr', 'data'])
+
+
+class Trap(Exception):
+    """Raised when the program does something that makes the PicoRV32 trap"""
+
+    def __init__(self, pc, message):
+        super().__init__(f'Trap at pc={pc:#010x}: {message}')
+        self.pc = pc
+
+
+def _signed(x):
+    return x - (1 << 32) if x & 0x80000000 else x
+
+
+def _sext(value, bits):
+    sign = 1 << (bits - 1)
+    return (value & (sign - 1)) - (value & sign)
+
+
+class RiscvIss:
+    """Executes RV32IM programs, with memory and devices reached through a UmiRouter
+
+    Addresses below the size of main memory go to the MEM chiplet and all
+    others to the MONITOR chiplet, as in ebrick_core.v, so the UmiRam, UART
+    and exit devices registered with the router for the RTL tests work here
+    as well.  Accesses to a UmiRam go straight to its storage; accesses to
+    other devices are passed to their handle() methods as UMI packets.
+
+    Each instruction is decoded into a Python closure the first time it is
+    executed, and the closure is cached by address, so loops run without
+    decoding again.  Stores to a cached instruction drop it from the cache.
+    """
+
+    def __init__(self, router, pc=0):
+        self.router = router
+
+        memory_map = router.memory_map
+        self.main_memory_size = memory_map.macros['MAIN_MEMORY_SIZE']
+        self.mem_base = memory_map.chipid('MEM') << 40
+        self.monitor_base = memory_map.chipid('MONITOR') << 40
+
+        mem = router.lookup(self.mem_base)
+        if (mem is None) or (not mem.memory):
+            raise ValueError('No UmiRam is registered for the MEM region')
+        self.memory = mem.handler
+
+        # UmiRam and MemmapUmiRam keep their contents in one NumPy array,
+        # which is accessed through a memoryview; other memories (such as
+        # SparseUmiRam) are accessed through gather() and initialize_memory()
+        ram = getattr(self.memory, 'ram', None)
+        self.ram = memoryview(ram) if isinstance(ram, np.ndarray) else None
+
+        self.regs = [0] * 32
+        self.pc = pc
+        self.steps = 0
+
+        self.cache = {}
+        self.log = None
+
+        self.stop = False
+        self.until = None
+
+    #################
+    # memory access #
+    #################
+
+    def _read_ram(self, addr, n):
+        if self.ram is not None:
+            return int.from_bytes(self.ram[addr:addr + n], 'little')
+        return int.from_bytes(self.memory.gather([addr], [n])[0].tobytes(), 'little')
+
+    def _write_ram(self, addr, value, n):
+        data = value.to_bytes(n, 'little')
+        if self.ram is not None:
+            self.ram[addr:addr + n] = data
+        else:
+            self.memory.initialize_memory(addr, np.frombuffer(data, dtype=np.uint8))
+
+        # keep the decode cache coherent with the program in memory
+        self.cache.pop(addr & ~3, None)
+
+    def _device(self, pc, addr, opcode, n, value=None):
+        umi_addr = self.monitor_base | (addr & CHIP_ADDR_MASK)
+
+        route = self.router.lookup(umi_addr)
+        if route is None:
+            raise Trap(pc, f'access to unmapped address {addr:#010x}')
+
+        cmd = umi_pack(opcode=int(opcode), size=n.bit_length() - 1, len=0)
+        data = None
+        if value is not None:
+            data = np.frombuffer(value.to_bytes(n, 'little'), dtype=np.uint8)
+
+        result = route.handler.handle(PyUmiPacket(cmd, umi_addr, 0, data))
+
+        if (self.until is not None) and self.until():
+            self.stop = True
+
+        if value is None:
+            return int.from_bytes(np.asarray(result, dtype=np.uint8).tobytes()[:n], 'little')
+
+    def load(self, pc, addr, n):
+        '''Returns the n-byte value at addr, as an unsigned integer.'''
+
+        if addr & (n - 1):
+            raise Trap(pc, f'misaligned load from {addr:#010x}')
+
+        if self.log is not None:
+            # the PicoRV32 reads the whole word
+            self.log.append(Transaction(False, self._umi_addr(addr & ~3), None))
+
+        if addr < self.main_memory_size:
+            return self._read_ram(addr, n)
+        return self._device(pc, addr, UmiCmd.UMI_REQ_READ, n)
+
+    def store(self, pc, addr, value, n):
+        '''Writes the low n bytes of value to addr.'''
+
+        if addr & (n - 1):
+            raise Trap(pc, f'misaligned store to {addr:#010x}')
+
+        value &= (1 << (8 * n)) - 1
+
+        if self.log is not None:
+            self.log.append(Transaction(True, self._umi_addr(addr), value.to_bytes(n, 'little')))
+
+        if addr < self.main_memory_size:
+            self._write_ram(addr, value, n)
+        else:
+            self._device(pc, addr, UmiCmd.UMI_REQ_WRITE, n, value)
+
+    def fetch(self, pc):
+        '''Returns the instruction at pc.'''
+
+        if pc & 3:
+            raise Trap(pc, 'misaligned instruction fetch')
+        if pc >= self.main_memory_size:
+            raise Trap(pc, 'instruction fetch outside of main memory')
+
+        return self._read_ram(pc, 4)
+
+    def _umi_addr(self, addr):
+        base = self.mem_base if addr < self.main_memory_size else self.monitor_base
+        return base | addr
+
+    ############
+    # decoding #
+    ############
+
+    def decode(self, insn, pc):
+        '''Returns a function that executes insn at pc and returns the next pc.'''
+
+        r = self.regs
+
+        opcode = insn & 0x7f
+        rd = (insn >> 7) & 0x1f
+        funct3 = (insn >> 12) & 0x7
+        rs1 = (insn >> 15) & 0x1f
+        rs2 = (insn >> 20) & 0x1f
+        funct7 = insn >> 25
+
+        imm_i = _sext(insn >> 20, 12)
+        imm_s = _sext(((insn >> 25) << 5) | ((insn >> 7) & 0x1f), 12)
+        imm_b = _sext(((insn >> 31) << 12) | (((insn >> 7) & 1) << 11)
+                      | (((insn >> 25) & 0x3f) << 5) | (((insn >> 8) & 0xf) << 1), 13)
+        imm_u = insn & 0xfffff000
+        imm_j = _sext(((insn >> 31) << 20) | (((insn >> 12) & 0xff) << 12)
+                      | (((insn >> 20) & 1) << 11) | (((insn >> 21) & 0x3ff) << 1), 21)
+
+        def illegal(pc):
+            raise Trap(pc, f'illegal instruction {insn:#010x}')
+
+        if opcode == 0x37:  # LUI
+            def op(pc):
+                r[rd] = imm_u
+                return pc + 4
+        elif opcode == 0x17:  # AUIPC
+            value = (pc + imm_u) & MASK
+
+            def op(pc):
+                r[rd] = value
+                return pc + 4
+        elif opcode == 0x6f:  # JAL
+            target = (pc + imm_j) & MASK
+
+            def op(pc):
+                r[rd] = pc + 4
+                return target
+        elif (opcode == 0x67) and (funct3 == 0):  # JALR
+            def op(pc):
+                target = (r[rs1] + imm_i) & MASK & ~1
+                r[rd] = pc + 4
+                return target
+        elif opcode == 0x63:  # branches
+            return self._decode_branch(funct3, rs1, rs2, (pc + imm_b) & MASK) or illegal
+        elif opcode == 0x03:  # loads
+            return self._decode_load(funct3, rd, rs1, imm_i) or illegal
+        elif opcode == 0x23:  # stores
+            n = {0: 1, 1: 2, 2: 4}.get(funct3)
+            if n is None:
+                return illegal
+
+            store = self.store
+
+            def op(pc):
+                store(pc, (r[rs1] + imm_s) & MASK, r[rs2], n)
+                return pc + 4
+        elif opcode == 0x13:  # register-immediate
+            return self._decode_op_imm(funct3, funct7, rd, rs1, imm_i) or illegal
+        elif opcode == 0x33:  # register-register
+            return self._decode_op(funct3, funct7, rd, rs1, rs2) or illegal
+        elif opcode == 0x0f:  # FENCE, FENCE.I
+            def op(pc):
+                return pc + 4
+        else:
+            # including ECALL and EBREAK, which make the PicoRV32 trap
+            return illegal
+
+        return op
+
+    def _decode_branch(self, funct3, rs1, rs2, target):
+        r = self.regs
+
+        compare = {
+            0: lambda a, b: a == b,
+            1: lambda a, b: a != b,
+            4: lambda a, b: _signed(a) < _signed(b),
+            5: lambda a, b: _signed(a) >= _signed(b),
+            6: lambda a, b: a < b,
+            7: lambda a, b: a >= b
+        }.get(funct3)
+
+        if compare is None:
+            return None
+
+        def op(pc):
+            return target if compare(r[rs1], r[rs2]) else pc + 4
+
+        return op
+
+    def _decode_load(self, funct3, rd, rs1, imm):
+        r = self.regs
+        load = self.load
+
+        # (size, sign-extend)
+        kind = {0: (1, True), 1: (2, True), 2: (4, False), 4: (1, False), 5: (2, False)}
+        if funct3 not in kind:
+            return None
+        n, signed = kind[funct3]
+
+        if signed:
+            def op(pc):
+                r[rd] = _sext(load(pc, (r[rs1] + imm) & MASK, n), 8 * n) & MASK
+                return pc + 4
+        else:
+            def op(pc):
+                r[rd] = load(pc, (r[rs1] + imm) & MASK, n)
+                return pc + 4
+
+        return op
+
+    def _decode_op_imm(self, funct3, funct7, rd, rs1, imm):
+        r = self.regs
+        shamt = imm & 0x1f
+
+        if funct3 == 0:
+            def op(pc):
+                r[rd] = (r[rs1] + imm) & MASK
+                return pc + 4
+        elif funct3 == 1 and funct7 == 0:
+            def op(pc):
+                r[rd] = (r[rs1] << shamt) & MASK
+                return pc + 4
+        elif funct3 == 5 and funct7 == 0:
+            def op(pc):
+                r[rd] = r[rs1] >> shamt
+                return pc + 4
+        elif funct3 == 5 and funct7 == 0x20:
+            def op(pc):
+                r[rd] = (_signed(r[rs1]) >> shamt) & MASK
+                return pc + 4
+        elif funct3 in (2, 3, 4, 6, 7):
+            fn = ALU[funct3]
+            uimm = imm & MASK
+
+            def op(pc):
+                r[rd] = fn(r[rs1], uimm)
+                return pc + 4
+        else:
+            return None
+
+        return op
+
+    def _decode_op(self, funct3, funct7, rd, rs1, rs2):
+        r = self.regs
+
+        if funct7 == 0:
+            fn = ALU[funct3]
+        elif funct7 == 0x20 and funct3 in (0, 5):
+            fn = SUB if funct3 == 0 else SRA
+        elif funct7 == 1:
+            fn = MULDIV[funct3]
+        else:
+            return None
+
+        def op(pc):
+            r[rd] = fn(r[rs1], r[rs2])
+            return pc + 4
+
+        return op
+
+    #############
+    # execution #
+    #############
+
+    def run(self, until=None, max_steps=None, log=None):
+        '''
+        Runs the program until "until" returns True (checked after each access
+        to a device, e.g. lambda: exit_device.done) or max_steps instructions
+        have run, returning the number of instructions executed.  If "log" is
+        a list, the memory transactions of the run (see Transaction) are
+        appended to it.
+        '''
+
+        self.until = until
+        self.stop = False
+        self.log = log
+
+        r = self.regs
+        cache = self.cache
+        pc = self.pc
+        steps = 0
+
+        try:
+            while not self.stop:
+                if (max_steps is not None) and (steps >= max_steps):
+                    break
+
+                op = cache.get(pc)
+                if op is None:
+                    op = self.decode(self.fetch(pc), pc)
+                    cache[pc] = op
+
+                if log is not None:
+                    log.append(Transaction(False, self._umi_addr(pc), None))
+
+                pc = op(pc)
+                r[0] = 0
+                steps += 1
+        finally:
+            self.pc = pc
+            self.steps += steps
+            self.log = None
+
+        return steps
+
+
+def _div(a, b):
+    a, b = _signed(a), _signed(b)
+    if b == 0:
+        return MASK
+    if a == -(1 << 31) and b == -1:
+        return a & MASK
+    q = abs(a) // abs(b)
+    return (-q if (a < 0) != (b < 0) else q) & MASK
+
+
+def _rem(a, b):
+    a, b = _signed(a), _signed(b)
+    if b == 0:
+        return a & MASK
+    if a == -(1 << 31) and b == -1:
+        return 0
+    rem = abs(a) % abs(b)
+    return (-rem if a < 0 else rem) & MASK
+
+
+# register-register operations by funct3, for funct7 = 0
+ALU = {
+    0: lambda a, b: (a + b) & MASK,
+    1: lambda a, b: (a << (b & 0x1f)) & MASK,
+    2: lambda a, b: int(_signed(a) < _signed(b)),
+    3: lambda a, b: int(a < b),
+    4: lambda a, b: a ^ b,
+    5: lambda a, b: a >> (b & 0x1f),
+    6: lambda a, b: a | b,
+    7: lambda a, b: a & b
+}
+
+
+def SUB(a, b):
+    return (a - b) & MASK
+
+
+def SRA(a, b):
+    return (_signed(a) >> (b & 0x1f)) & MASK
+
+
+# M extension, by funct3
+MULDIV = {
+    0: lambda a, b: (a * b) & MASK,
+    1: lambda a, b: ((_signed(a) * _signed(b)) >> 32) & MASK,
+    2: lambda a, b: ((_signed(a) * b) >> 32) & MASK,
+    3: lambda a, b: (a * b) >> 32,
+    4: _div,
+    5: lambda a, b: (a // b) if b else MASK,
+    6: _rem,
+    7: lambda a, b: (a % b) if b else a
+}
+
+
+def trace_transactions(records):
+    '''
+    Returns the requests in a UMI trace (see umi_trace.py) as Transactions,
+    for comparison with the transactions logged by RiscvIss.run().
+    '''
+
+    from ebrick_demo.testbench.umi_trace import RX
+
+    transactions = []
+
+    for record in records[records['dir'] == RX]:
+        opcode = umi_opcode(int(record['cmd']))
+        if opcode == UmiCmd.UMI_REQ_READ:
+            transactions.append(Transaction(False, int(record['dstaddr']), None))
+        else:
+            n = (umi_len(int(record['cmd'])) + 1) << umi_size(int(record['cmd']))
+            transactions.append(Transaction(True, int(record['dstaddr']),
+                                            bytes(record['data'][:n])))
+
+    return transactions
+
+
+def _normalize(t):
+    # writes are compared byte by byte, so that a write of the same bytes
+    # at the same addresses matches however it was sized
+    if t.write:
+        return (True, tuple((t.addr + i, b) for i, b in enumerate(t.data)))
+    return (False, t.addr)
+
+
+def compare_transactions(expected, actual):
+    '''
+    Compares two lists of Transactions, returning None if they match (up to
+    the length of the shorter one) or the index of the first difference.
+    '''
+
+    for i, (a, b) in enumerate(zip(expected, actual)):
+        if _normalize(a) != _normalize(b):
+            return i
+
+    return None
+
+
+def _describe(t):
+    if t is None:
+        return 'nothing'
+    if t.write:
+        return f'write of {t.data.hex()} to {t.addr:#x}'
+    return f'read from {t.addr:#x}'
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    from argparse import ArgumentParser
+    from pathlib import Path
+
+    from ebrick_demo.testbench.elf import load_elf
+    from ebrick_demo.testbench.program.riscv import build_riscv_binary
+    from ebrick_demo.testbench.umi_ram import UmiRam
+    from ebrick_demo.testbench.umi_router import UmiRouter
+    from ebrick_demo.testbench.umi_devices import UartDevice, UartSink, ExitDevice, \
+        FLUSH_POLICIES
+    from ebrick_demo.testbench.umi_trace import read_trace
+
+    parser = ArgumentParser(description='Run a RISC-V program without the RTL simulation.')
+    parser.add_argument('--program', default='hello.c',
+        help="C source file in testbench/program to build and run")
+    parser.add_argument('--elf',
+        help="run this ELF file instead of building a program")
+    parser.add_argument('--bindir',
+        help="directory for the program binary (default: testbench/program)")
+    parser.add_argument('--memory-size', type=int, default=32768,
+        help="size of the main memory in bytes")
+    parser.add_argument('--max-steps', type=int, default=None,
+        help="stop after this many instructions")
+    parser.add_argument('--uart-flush', default='line', choices=FLUSH_POLICIES,
+        help="when the program's UART output is written to stdout")
+    parser.add_argument('--lockstep',
+        help="compare the memory transactions against this UMI trace, recorded "
+        "from the RTL simulation with test_prv32.py --record")
+
+    args = parser.parse_args()
+
+    if args.elf is not None:
+        elf_file = Path(args.elf)
+    else:
+        testbench_dir = Path(__file__).resolve().parent
+        bindir = Path(args.bindir) if args.bindir is not None else testbench_dir / 'program'
+        program_file = bindir.resolve() / Path(args.program).with_suffix('.bin').name
+
+        build_riscv_binary(
+            files=[f'program/{args.program}', 'program/init.S'],
+            linkcfg='program/link.ld',
+            incdirs=['.', '../config'],
+            output=program_file,
+            cwd=testbench_dir
+        )
+
+        elf_file = program_file.with_suffix('.elf')
+
+    main_memory = UmiRam(args.memory_size)
+    elf = load_elf(main_memory, elf_file)
+
+    uart = UartDevice(sink=UartSink(policy=args.uart_flush))
+    exit_device = ExitDevice()
+
+    router = UmiRouter()
+    router.register_region('MEM', main_memory, size=args.memory_size)
+    router.register_address(router.memory_map.uart_addr, uart, name='UART')
+    router.register_address(router.memory_map.exit_addr, exit_device, name='EXIT')
+
+    iss = RiscvIss(router, pc=elf.entry)
+    log = [] if args.lockstep is not None else None
+
+    start = time.perf_counter()
+    try:
+        iss.run(until=lambda: exit_device.done, max_steps=args.max_steps, log=log)
+    except Trap as e:
+        print(f'*** {e} ***')
+    finally:
+        uart.flush()
+    elapsed = time.perf_counter() - start
+
+    print(f'*** {iss.steps} instructions in {elapsed:.3f}s '
+          f'({iss.steps / elapsed:.0f} instructions/s), exit code {exit_device.exit_code} ***')
+
+    passed = exit_device.exit_code == 0
+
+    if log is not None:
+        expected = trace_transactions(read_trace(args.lockstep))
+        index = compare_transactions(expected, log)
+
+        if index is None:
+            print(f'*** Lockstep: {min(len(expected), len(log))} transactions match ***')
+        else:
+            print(f'*** Lockstep: transaction {index} differs: RTL {_describe(expected[index])}, '
+                  f'ISS {_describe(log[index])} ***')
+            passed = False
+
+    sys.exit(0 if passed else 1)
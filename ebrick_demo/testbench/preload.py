@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+# Fast loading of program images into memory over UMI
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+
+import time
+import numpy as np
+
+from collections import namedtuple
+
+PRELOAD_MODES = ['posted', 'acked']
+
+PreloadResult = namedtuple('PreloadResult', ['bytes', 'time'])
+
+
+def preload(umi, addr, data, srcaddr, mode='posted', verify=False):
+    '''
+    Writes data to memory at addr over the UMI connection umi, returning a
+    PreloadResult with the number of bytes written and the time taken.
+
+    In "posted" mode, the data is sent as a stream of posted writes, which are
+    not acknowledged, so the host never waits for a round trip through the
+    simulation while loading.  The writes are followed by a read of the last
+    word written: since the memory handles requests in order, its response
+    arrives only after every write has completed.
+
+    In "acked" mode, each write waits for its response before the next write
+    is sent.  This is slower, but is useful to isolate problems.
+
+    If "verify" is set, the data is read back and compared after loading.
+    '''
+
+    if mode not in PRELOAD_MODES:
+        raise ValueError(f'Unknown preload mode: {mode}')
+
+    data = data.view(np.uint8)
+
+    if data.size == 0:
+        return PreloadResult(bytes=0, time=0.0)
+
+    # write whole 32-bit words, which map directly onto the memory width
+    words = np.zeros((data.size + 3) // 4, dtype=np.uint32)
+    words.view(np.uint8)[:data.size] = data
+
+    start = time.perf_counter()
+
+    if mode == 'posted':
+        umi.write(addr, words, srcaddr=srcaddr, posted=True)
+
+        # fence: wait until the last posted write has been performed
+        umi.read(addr + 4 * (words.size - 1), np.uint32, srcaddr=srcaddr)
+    else:
+        umi.write(addr, words, srcaddr=srcaddr, posted=False)
+
+    elapsed = time.perf_counter() - start
+
+    if verify:
+        readback = umi.read(addr, words.size, np.uint32, srcaddr=srcaddr)
+        if not np.array_equal(readback, words):
+            mismatch = int(np.argmax(readback != words))
+            raise ValueError(f'Preload verification failed at address 0x{addr + 4 * mismatch:x}')
+
+    return PreloadResult(bytes=data.size, time=elapsed)
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+
+# Firmware profiler driven by the instruction fetches seen by the monitor
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+
+import bisect
+import subprocess
+
+from collections import Counter
+
+import numpy as np
+
+from switchboard import UmiCmd, umi_opcode
+
+from ebrick_demo.testbench.elf import SHF_ALLOC, SHF_EXECINSTR, STT_NOTYPE
+
+# number of fetch addresses buffered before they are added to the histogram
+BUFFER_SIZE = 1 << 16
+
+# name used for addresses that are not in any function
+UNKNOWN = '[unknown]'
+
+# RV32 opcodes and registers used to follow calls and returns
+_OP_JAL = 0x6f
+_OP_JALR = 0x67
+_RA = 1
+
+
+class FetchProfiler:
+    """Counts instruction fetches per address and attributes them to functions
+
+    Every instruction that the PicoRV32 executes is fetched from memory with
+    a UMI read, so the reads that fall in the executable sections (.text) of
+    the program's ELF file are a complete trace of the program counter.  wrap()
+    returns a UmiTxRx stand-in that copies those addresses into a buffer as
+    requests arrive; each time the buffer fills up (and on flush()), the
+    addresses are added to a NumPy histogram with one bin per instruction.
+
+    The buffered addresses are also scanned, in order, for calls (JAL/JALR
+    writing ra) and returns (JALR to ra), which gives the call stack of each
+    fetch for the folded (flamegraph) output.  Only the calls and returns
+    are handled in Python; the rest of the work is vectorized.
+
+    The range is taken from the sections rather than from the executable
+    segments, since link.ld places all of the program, including .data and
+    .bss, in one segment that is readable, writable and executable.  Data
+    reads that do fall in .text (such as constants that the compiler leaves
+    there) are still counted as fetches.
+    """
+
+    def __init__(self, elf, chipid=0, buffer_size=BUFFER_SIZE):
+        self.elf = elf
+
+        sections = [s for s in elf.sections.values()
+                    if (s.flags & SHF_ALLOC) and (s.flags & SHF_EXECINSTR)]
+        if not sections:
+            raise ValueError(f'{elf.filename} has no executable sections')
+
+        self.base = min(s.addr for s in sections)
+        end = max(s.addr + s.size for s in sections)
+
+        # address range of fetches, including the chipid of main memory
+        self.low = (chipid << 40) | self.base
+        self.high = (chipid << 40) | end
+
+        # instruction words of the program, for finding calls and returns
+        nwords = (end - self.base + 3) // 4
+        text = np.zeros(4 * nwords, dtype=np.uint8)
+        for s in sections:
+            offset = s.addr - self.base
+            text[offset:offset + s.data.size] = s.data
+        self.words = text.view('<u4')
+
+        # index of the function containing each instruction, into a list of
+        # function names ending with UNKNOWN.  Code outside of functions
+        # (such as _start in init.S, which has no symbol type) is named
+        # after the closest label before it.
+        labels = sorted((sym.value, sym.name) for sym in elf.symbols.values()
+                        if (sym.type == STT_NOTYPE) and (sym.name[0] not in '.$')
+                        and (self.base <= sym.value < end))
+
+        names = {}
+        index = []
+        for addr in range(self.base, end, 4):
+            s = elf.function(addr)
+            if s is not None:
+                name = s.name
+            else:
+                i = bisect.bisect_right(labels, (addr, chr(0x10ffff))) - 1
+                name = labels[i][1] if i >= 0 else None
+            index.append(names.setdefault(name, len(names)) if name is not None else -1)
+
+        self.functions = list(names) + [UNKNOWN]
+        self.function_index = np.array(index, dtype=np.int64)
+        self.function_index[self.function_index < 0] = len(names)
+
+        self.counts = np.zeros(nwords, dtype=np.uint64)
+
+        # call stacks, as tuples of function indices (outermost first),
+        # interned to small integers
+        self._stack = ()
+        self._stack_ids = {(): 0}
+        self._stacks = [()]
+        self.stack_counts = Counter()
+
+        self._buffer = np.zeros(buffer_size, dtype=np.uint64)
+        self._count = 0
+
+    def wrap(self, umi):
+        '''Returns a UmiTxRx stand-in that profiles the fetches passing through umi.'''
+
+        return ProfilingUmi(umi, self)
+
+    def record(self, addr):
+        '''Records one fetch from "addr" (a full UMI address).'''
+
+        self._buffer[self._count] = addr
+        self._count += 1
+        if self._count == self._buffer.size:
+            self.flush()
+
+    def flush(self):
+        '''Adds the buffered fetches to the histogram and call stack counts.'''
+
+        if self._count == 0:
+            return
+
+        index = ((self._buffer[:self._count] - np.uint64(self.low)) >> np.uint64(2)).astype(
+            np.int64)
+        self._count = 0
+
+        self.counts += np.bincount(index, minlength=self.counts.size).astype(np.uint64)
+
+        self._count_stacks(index)
+
+    def _count_stacks(self, index):
+        words = self.words[index]
+        opcode = words & 0x7f
+        rd = (words >> 7) & 0x1f
+        rs1 = (words >> 15) & 0x1f
+
+        calls = ((opcode == _OP_JAL) | (opcode == _OP_JALR)) & (rd == _RA)
+        returns = (opcode == _OP_JALR) & (rd == 0) & (rs1 == _RA)
+
+        leaf = self.function_index[index]
+
+        # the stack that each fetch runs under changes just after each call
+        # and return, so fetches are grouped into runs between them
+        events = np.flatnonzero(calls | returns)
+
+        stack_ids = np.empty(events.size + 1, dtype=np.int64)
+        stack = self._stack
+        for n, e in enumerate(events):
+            stack_ids[n] = self._stack_id(stack)
+            if calls[e]:
+                stack = stack + (int(leaf[e]),)
+            elif stack:
+                stack = stack[:-1]
+        stack_ids[-1] = self._stack_id(stack)
+        self._stack = stack
+
+        lengths = np.diff(np.concatenate(([0], events + 1, [index.size])))
+        per_fetch = np.repeat(stack_ids, lengths)
+
+        keys, counts = np.unique(per_fetch * len(self.functions) + leaf, return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self.stack_counts[divmod(key, len(self.functions))] += count
+
+    def _stack_id(self, stack):
+        stack_id = self._stack_ids.get(stack)
+        if stack_id is None:
+            stack_id = self._stack_ids[stack] = len(self._stacks)
+            self._stacks.append(stack)
+        return stack_id
+
+    @property
+    def samples(self):
+        return int(self.counts.sum())
+
+    def addresses(self):
+        '''Returns the fetched addresses and their counts, as two NumPy arrays.'''
+
+        index = np.flatnonzero(self.counts)
+        return self.base + 4 * index, self.counts[index]
+
+    def function_counts(self):
+        '''Returns a list of (count, function name) pairs, most fetched first.'''
+
+        counts = np.bincount(self.function_index, weights=self.counts,
+                             minlength=len(self.functions))
+        return sorted(((int(c), name) for c, name in zip(counts, self.functions) if c),
+                      reverse=True)
+
+    def line_counts(self, addr2line='riscv64-unknown-elf-addr2line'):
+        '''
+        Returns a list of (count, function name, "file:line") tuples, most
+        fetched first, using addr2line to look up the source line of each
+        fetched address.  The program must have been built with -g.
+        '''
+
+        addrs, counts = self.addresses()
+        if addrs.size == 0:
+            return []
+
+        # addresses are read from stdin when none are given on the command
+        # line, one line of output per address
+        proc = subprocess.run([addr2line, '-e', str(self.elf.filename)],
+                              input='\n'.join(f'{a:#x}' for a in addrs.tolist()) + '\n',
+                              capture_output=True, text=True, check=True)
+
+        lines = Counter()
+        functions = {}
+        for addr, count, line in zip(addrs.tolist(), counts.tolist(),
+                                     proc.stdout.splitlines()):
+            # drop the "(discriminator N)" that follows some lines
+            line = line.split(' (')[0]
+            lines[line] += count
+            functions.setdefault(line, self.functions[self.function_index[
+                (addr - self.base) // 4]])
+
+        return sorted(((count, functions[line], line) for line, count in lines.items()),
+                      reverse=True)
+
+    def folded(self):
+        '''
+        Returns the call stacks in the folded format of flamegraph.pl and
+        compatible tools: one "outer;...;inner count" line per stack.
+        '''
+
+        folded = Counter()
+        for (stack_id, leaf), count in self.stack_counts.items():
+            frames = [self.functions[i] for i in self._stacks[stack_id]]
+            frames.append(self.functions[leaf])
+            folded[';'.join(frames)] += count
+
+        return ''.join(f'{stack} {count}\n' for stack, count in sorted(folded.items()))
+
+    def save_folded(self, filename):
+        '''Writes the folded call stacks to a file.'''
+
+        with open(filename, 'w') as f:
+            f.write(self.folded())
+
+    def report(self, top=20, addr2line=None):
+        '''
+        Returns a printable summary of the hottest functions and, if the name
+        of addr2line is given, the hottest source lines.
+        '''
+
+        total = self.samples
+        lines = [f'profile: {total} instruction fetches']
+
+        def percent(count):
+            return 100 * count / total if total else 0.0
+
+        lines.append(f'{"fetches":>10} {"%":>6}  function')
+        for count, name in self.function_counts()[:top]:
+            lines.append(f'{count:>10} {percent(count):>6.2f}  {name}')
+
+        if addr2line is not None:
+            try:
+                line_counts = self.line_counts(addr2line)
+            except (OSError, subprocess.CalledProcessError) as e:
+                lines.append(f'source lines unavailable: {e}')
+            else:
+                lines.append(f'{"fetches":>10} {"%":>6}  line')
+                for count, name, line in line_counts[:top]:
+                    lines.append(f'{count:>10} {percent(count):>6.2f}  {line} ({name})')
+
+        return '\n'.join(lines)
+
+
+class ProfilingUmi:
+    """Forwards recv() and send() to a UmiTxRx, profiling instruction fetches"""
+
+    def __init__(self, umi, profiler):
+        self.umi = umi
+        self.profiler = profiler
+
+    def recv(self, blocking=True):
+        p = self.umi.recv(blocking=blocking)
+        if (p is not None) and (umi_opcode(p.cmd) == UmiCmd.UMI_REQ_READ):
+            profiler = self.profiler
+            if profiler.low <= p.dstaddr < profiler.high:
+                profiler.record(p.dstaddr)
+        return p
+
+    def send(self, p, *args, **kwargs):
+        return self.umi.send(p, *args, **kwargs)
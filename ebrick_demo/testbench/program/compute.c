@@ -0,0 +1,54 @@
+// Copyright (c) 2024 Zero ASIC Corporation
+// This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+// Compute-bound benchmark: fills a small buffer with pseudo-random bytes
+// and computes its CRC-32 bit by bit.  Apart from instruction fetches,
+// there is very little memory traffic.
+
+#include "ebrick_memory_map.h"
+
+#define BUF_SIZE 256
+
+// zlib.crc32() of the buffer contents
+#define EXPECTED_CRC 0x8144bf85
+
+static unsigned char buf[BUF_SIZE];
+
+static inline void puts(char* str) {
+	char* s = str;
+	char c;
+	while ((c = *s++)) {
+		*((volatile int*)UART_ADDR) = c;
+	}
+	*((volatile int*)UART_ADDR) = '\n';
+}
+
+static unsigned int crc32(unsigned char* data, int n) {
+	unsigned int crc = 0xFFFFFFFF;
+
+	for (int i = 0; i < n; i++) {
+		crc ^= data[i];
+		for (int j = 0; j < 8; j++) {
+			crc = (crc >> 1) ^ (0xEDB88320 & -(crc & 1));
+		}
+	}
+
+	return ~crc;
+}
+
+int main() {
+	// linear congruential generator, as in the C standard's example rand()
+	unsigned int x = 1;
+	for (int i = 0; i < BUF_SIZE; i++) {
+		x = (x * 1103515245) + 12345;
+		buf[i] = x >> 16;
+	}
+
+	if (crc32(buf, BUF_SIZE) != EXPECTED_CRC) {
+		puts("compute: FAIL");
+		return 1;
+	}
+
+	puts("compute: PASS");
+	return 0;
+}
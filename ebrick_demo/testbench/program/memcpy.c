@@ -0,0 +1,49 @@
+// Copyright (c) 2024 Zero ASIC Corporation
+// This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+// Memory-bound benchmark: copies a buffer back and forth several times,
+// one word at a time, and checks the result.
+
+#include "ebrick_memory_map.h"
+
+#define BUF_WORDS 1024
+#define PASSES 8
+
+static unsigned int src[BUF_WORDS];
+static unsigned int dst[BUF_WORDS];
+
+static inline void puts(char* str) {
+	char* s = str;
+	char c;
+	while ((c = *s++)) {
+		*((volatile int*)UART_ADDR) = c;
+	}
+	*((volatile int*)UART_ADDR) = '\n';
+}
+
+static void copy(volatile unsigned int* to, volatile unsigned int* from, int n) {
+	for (int i = 0; i < n; i++) {
+		to[i] = from[i];
+	}
+}
+
+int main() {
+	for (int i = 0; i < BUF_WORDS; i++) {
+		src[i] = (i * 0x9E3779B9) ^ 0x5A5A5A5A;
+	}
+
+	for (int pass = 0; pass < PASSES; pass++) {
+		copy(dst, src, BUF_WORDS);
+		copy(src, dst, BUF_WORDS);
+	}
+
+	for (int i = 0; i < BUF_WORDS; i++) {
+		if (dst[i] != ((i * 0x9E3779B9) ^ 0x5A5A5A5A)) {
+			puts("memcpy: FAIL");
+			return 1;
+		}
+	}
+
+	puts("memcpy: PASS");
+	return 0;
+}
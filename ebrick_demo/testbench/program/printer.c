@@ -0,0 +1,44 @@
+// Copyright (c) 2024 Zero ASIC Corporation
+// This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+// UART-heavy benchmark: prints many numbered lines, so that most of the
+// UMI traffic is character writes to the UART.
+
+#include "ebrick_memory_map.h"
+
+#define LINES 100
+
+static inline void putchar(char c) {
+	*((volatile int*)UART_ADDR) = c;
+}
+
+static void print(char* str) {
+	char c;
+	while ((c = *str++)) {
+		putchar(c);
+	}
+}
+
+static void print_uint(unsigned int value) {
+	char digits[10];
+	int n = 0;
+
+	do {
+		digits[n++] = '0' + (value % 10);
+		value /= 10;
+	} while (value);
+
+	while (n) {
+		putchar(digits[--n]);
+	}
+}
+
+int main() {
+	for (int i = 0; i < LINES; i++) {
+		print("line ");
+		print_uint(i);
+		print(": the quick brown fox jumps over the lazy dog\n");
+	}
+
+	return 0;
+}
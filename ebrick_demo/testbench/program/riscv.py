@@ -3,17 +3,71 @@
 # Copyright (c) 2024 Zero ASIC Corporation
 # This code is licensed under Apache License 2.0 (see LICENSE for details)
 
+import hashlib
+import os
+import re
+import shutil
 import subprocess
+import tempfile
 
+from functools import lru_cache
 from pathlib import Path
 
+GCC_FLAGS = [
+    '-mabi=ilp32',
+    '-march=rv32im',
+    '-static',
+    '-mcmodel=medany',
+    '-fvisibility=hidden',
+    '-nostdlib',
+    '-nostartfiles',
+    '-fno-builtin',
+    '-g'  # source lines for profiler.py; debug info is not loaded into memory
+]
+
+# default location of the build cache, which may be shared by several
+# checkouts of this repository
+DEFAULT_CACHE_DIR = Path(os.environ.get(
+    'EBRICK_DEMO_CACHE', Path.home() / '.cache' / 'ebrick_demo')) / 'riscv'
+
+# maximum number of builds kept in the cache
+DEFAULT_CACHE_LIMIT = 256
+
+_INCLUDE = re.compile(rb'^\s*#\s*include\s*[<"]([^>"]+)[>"]', re.MULTILINE)
+
+
+def build_riscv_binary(files, linkcfg, incdirs, output, prefix='riscv64-unknown-elf-', cwd=None,
+                       cache=True, cache_dir=None, cache_limit=DEFAULT_CACHE_LIMIT):
+    '''
+    Compiles files into an ELF and a flat binary (output).  If cache is True,
+    the build is skipped when the same sources, included files, linker script,
+    flags and toolchain have been built before.
+    '''
+
+    elf_output = Path(output).with_suffix('.elf')
+
+    if cache:
+        cache_dir = Path(cache_dir) if cache_dir is not None else DEFAULT_CACHE_DIR
+        key = riscv_build_key(files, linkcfg, incdirs, prefix, cwd=cwd)
+        entry = cache_dir / key
+
+        try:
+            _install(entry / 'program.elf', elf_output, cwd)
+            _install(entry / 'program.bin', output, cwd)
+
+            # mark the entry as recently used
+            os.utime(entry)
+
+            return output
+        except FileNotFoundError:
+            # not built yet, or evicted by another process
+            pass
 
-def build_riscv_binary(files, linkcfg, incdirs, output, prefix='riscv64-unknown-elf-', cwd=None):
     elf = run_riscv_gcc(
         files=files,
         linkcfg=linkcfg,
         incdirs=incdirs,
-        output=Path(output).with_suffix('.elf'),
+        output=elf_output,
         prefix=prefix,
         cwd=cwd
     )
@@ -25,21 +79,18 @@ def build_riscv_binary(files, linkcfg, incdirs, output, prefix='riscv64-unknown-
         cwd=cwd
     )
 
+    if cache:
+        _store(entry, {
+            'program.elf': _resolve(elf, cwd),
+            'program.bin': _resolve(bin, cwd)
+        })
+        _evict(cache_dir, cache_limit)
+
     return bin
 
 
 def run_riscv_gcc(files, linkcfg, incdirs, output, prefix, cwd=None):
-    cmd = [
-        f'{prefix}gcc',
-        '-mabi=ilp32',
-        '-march=rv32im',
-        '-static',
-        '-mcmodel=medany',
-        '-fvisibility=hidden',
-        '-nostdlib',
-        '-nostartfiles',
-        '-fno-builtin'
-    ]
+    cmd = [f'{prefix}gcc'] + GCC_FLAGS
 
     cmd += [f'-I{incdir}' for incdir in incdirs]
 
@@ -69,3 +120,115 @@ def run_riscv_objcopy(input, output, prefix, cwd=None):
     subprocess.run(cmd, cwd=cwd, check=True)
 
     return output
+
+
+@lru_cache(maxsize=None)
+def riscv_toolchain_version(prefix):
+    '''Returns the version string reported by the RISC-V GCC with this prefix.'''
+
+    result = subprocess.run([f'{prefix}gcc', '--version'], capture_output=True, text=True,
+                            check=True)
+
+    return result.stdout.splitlines()[0]
+
+
+def riscv_build_key(files, linkcfg, incdirs, prefix, cwd=None):
+    '''Returns a hash identifying the result of building files with build_riscv_binary().'''
+
+    h = hashlib.sha256()
+
+    def add(*items):
+        for item in items:
+            item = item if isinstance(item, bytes) else str(item).encode()
+            h.update(len(item).to_bytes(8, 'little'))
+            h.update(item)
+
+    add(prefix, riscv_toolchain_version(prefix))
+    add(*GCC_FLAGS)
+    add(*incdirs)
+    add(linkcfg, _resolve(linkcfg, cwd).read_bytes())
+
+    incdirs = [_resolve(incdir, cwd) for incdir in incdirs]
+
+    for file in files:
+        add(file)
+        for path in _source_closure(_resolve(file, cwd), incdirs):
+            add(path.name, path.read_bytes())
+
+    return h.hexdigest()
+
+
+def _source_closure(path, incdirs):
+    # returns path followed by every file it includes, recursively.  includes
+    # that can't be found in the source directory or the include directories
+    # (e.g. system headers) are skipped.
+    found = [path]
+    seen = {path}
+
+    for current in found:
+        for name in _INCLUDE.findall(current.read_bytes()):
+            name = name.decode()
+            for incdir in [current.parent] + incdirs:
+                candidate = (incdir / name).resolve()
+                if candidate.is_file():
+                    if candidate not in seen:
+                        seen.add(candidate)
+                        found.append(candidate)
+                    break
+
+    return found
+
+
+def _resolve(path, cwd):
+    path = Path(path)
+    if (cwd is not None) and (not path.is_absolute()):
+        path = Path(cwd) / path
+    return path.resolve()
+
+
+def _install(src, dst, cwd):
+    # copy src to dst atomically, so that concurrent builds never see
+    # a partially-written file
+    dst = _resolve(dst, cwd)
+    fd, tmp = tempfile.mkstemp(dir=dst.parent, prefix=f'.{dst.name}.')
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _store(entry, artifacts):
+    entry.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp = Path(tempfile.mkdtemp(dir=entry.parent, prefix=f'.{entry.name}.'))
+
+    for name, path in artifacts.items():
+        shutil.copyfile(path, tmp / name)
+
+    try:
+        tmp.rename(entry)
+    except OSError:
+        # another process stored the same build first
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _evict(cache_dir, limit):
+    # other processes may be evicting at the same time, so entries can
+    # disappear at any point; those are skipped
+    entries = []
+    for path in cache_dir.iterdir():
+        if path.name.startswith('.'):
+            continue
+        try:
+            if path.is_dir():
+                entries.append((path.stat().st_mtime, path))
+        except FileNotFoundError:
+            pass
+
+    if len(entries) > limit:
+        entries.sort()
+        for _, path in entries[:len(entries) - limit]:
+            shutil.rmtree(path, ignore_errors=True)
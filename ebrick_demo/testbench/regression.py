@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+# Runs several tests and programs concurrently, each in its own directory
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+TESTBENCH_DIR = Path(__file__).resolve().parent
+
+TESTS = {
+    'test_prv32': TESTBENCH_DIR / 'test_prv32.py',
+    'test_prv32_memagent': TESTBENCH_DIR / 'test_prv32_memagent.py'
+}
+
+# file in each job's directory that the tests write the program's UART output
+# to.  A test that does not get as far as writing it (e.g. one that times out)
+# has no UART output in the results; its full output is in output.log.
+UART_LOG = 'uart.log'
+
+
+class RegressionJob:
+    """One test running one program"""
+
+    def __init__(self, test, program='hello.c', args=None):
+        if test not in TESTS:
+            raise ValueError(f'Unknown test: {test}')
+
+        self.test = test
+        self.program = program
+        self.args = list(args) if args is not None else []
+
+    @property
+    def name(self):
+        return f'{self.test}-{Path(self.program).stem}'
+
+
+def run_job(job, rundir, builddir, timeout=None):
+    '''
+    Runs a job in its own process and directory, returning a dictionary of results.
+
+    Switchboard queues are created relative to the working directory, so giving
+    each job its own directory keeps their queues (and program binaries) apart.
+    Simulator builds go to the shared builddir, where they are keyed by their
+    fingerprint, so jobs that need the same simulator build it once.
+    '''
+
+    rundir = Path(rundir)
+    rundir.mkdir(parents=True, exist_ok=True)
+
+    # don't pick up the UART output of an earlier run in the same directory
+    uart_log = rundir / UART_LOG
+    uart_log.unlink(missing_ok=True)
+
+    cmd = [
+        sys.executable, str(TESTS[job.test]),
+        '--fast',
+        '--program', job.program,
+        '--bindir', str(rundir),
+        '--builddir', str(builddir),
+        '--uart-flush', 'batch',
+        '--uart-log', UART_LOG
+    ] + job.args
+
+    start = time.time()
+
+    try:
+        result = subprocess.run(cmd, cwd=rundir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                text=True, timeout=timeout)
+        returncode = result.returncode
+        log = result.stdout
+    except subprocess.TimeoutExpired as e:
+        returncode = None
+        log = e.stdout.decode() if isinstance(e.stdout, bytes) else (e.stdout or '')
+
+    with open(rundir / 'output.log', 'w') as f:
+        f.write(log)
+
+    uart = uart_log.read_text() if uart_log.exists() else ''
+
+    return {
+        'name': job.name,
+        'test': job.test,
+        'program': job.program,
+        'returncode': returncode,
+        'passed': returncode == 0,
+        'time': time.time() - start,
+        'uart': uart,
+        'log': str(rundir / 'output.log')
+    }
+
+
+def run_regression(jobs, workdir='regression', workers=None, timeout=None):
+    '''Runs jobs concurrently, with up to "workers" at a time, returning their results.'''
+
+    workdir = Path(workdir).resolve()
+    builddir = workdir / 'build'
+
+    if workers is None:
+        workers = os.cpu_count()
+
+    # give every job a unique directory, even if the same job is repeated
+    rundirs = [workdir / f'{i:03d}-{job.name}' for i, job in enumerate(jobs)]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_job, job, rundir, builddir, timeout)
+                   for job, rundir in zip(jobs, rundirs)]
+        return [future.result() for future in futures]
+
+
+def summarize(results, elapsed=None):
+    '''Returns a printable summary of regression results.'''
+
+    lines = []
+
+    width = max([len(r['name']) for r in results] + [4])
+    lines.append(f'{"job":<{width}}  {"status":<7}  {"exit":>5}  {"time (s)":>8}  output')
+
+    for r in results:
+        status = 'PASS' if r['passed'] else ('TIMEOUT' if r['returncode'] is None else 'FAIL')
+        exit_code = '-' if r['returncode'] is None else r['returncode']
+        uart = r['uart'].strip().replace('\n', '\\n')
+        lines.append(f'{r["name"]:<{width}}  {status:<7}  {exit_code:>5}  '
+                     f'{r["time"]:>8.1f}  {uart}')
+
+    passed = sum(r['passed'] for r in results)
+    lines.append(f'{passed}/{len(results)} passed'
+                 + (f' in {elapsed:.1f}s' if elapsed is not None else ''))
+
+    return '\n'.join(lines)
+
+
+def main():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description='Run tests and programs concurrently.')
+    parser.add_argument('tests', nargs='*',
+        help=f'tests to run, from {", ".join(TESTS.keys())} (default: all)')
+    parser.add_argument('--program', action='append',
+        help='C source file in testbench/program to run; may be repeated (default: hello.c)')
+    parser.add_argument('--repeat', type=int, default=1,
+        help='number of times to run each test/program combination')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+        help='number of jobs to run at once (default: number of cores)')
+    parser.add_argument('--timeout', type=float, default=None,
+        help='timeout for each job, in seconds')
+    parser.add_argument('--workdir', default='regression',
+        help='directory for builds and per-job run directories')
+    parser.add_argument('--json',
+        help='write the results to this JSON file')
+
+    args = parser.parse_args()
+
+    tests = args.tests if args.tests else list(TESTS.keys())
+    for test in tests:
+        if test not in TESTS:
+            parser.error(f'unknown test: {test}')
+    programs = args.program if args.program else ['hello.c']
+
+    jobs = [RegressionJob(test, program)
+            for test in tests
+            for program in programs
+            for _ in range(args.repeat)]
+
+    start = time.time()
+    results = run_regression(jobs, workdir=args.workdir, workers=args.jobs, timeout=args.timeout)
+    elapsed = time.time() - start
+
+    print(summarize(results, elapsed))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'elapsed': elapsed, 'results': results}, f, indent=2)
+
+    sys.exit(0 if all(r['passed'] for r in results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+
+# Runs a sequence of RISC-V programs against one running RTL simulation
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import time
+import numpy as np
+
+from collections import namedtuple
+from pathlib import Path
+
+from siliconcompiler.package import path as sc_path
+from switchboard import SbDut, UmiTxRx
+
+import ebrick_demo.ebrick as ebrick
+from ebrick_demo.testbench.program.riscv import build_riscv_binary
+from ebrick_demo.testbench.sim_build import build_simulator
+from ebrick_demo.testbench.elf import load_elf
+from ebrick_demo.testbench.umi_ram import UmiRam
+from ebrick_demo.testbench.umi_service import UmiBatchService
+from ebrick_demo.testbench.umi_router import UmiRouter
+from ebrick_demo.testbench.umi_devices import UartDevice, ExitDevice
+from ebrick_demo.testbench.dispatcher import Dispatcher
+from ebrick_demo.testbench.preload import preload
+
+# size of the processor memory in bytes
+MEMORY_SIZE = 32768
+
+# consecutive empty polls of the monitor queue, spaced by the session's wait
+# strategy, after which a core held in reset is taken to have nothing left
+# in flight
+RESET_SETTLE_POLLS = 1000
+
+ProgramResult = namedtuple('ProgramResult', ['program', 'exit_code', 'output', 'time'])
+
+
+class Prv32Session:
+    """A PicoRV32 EBRICK simulation that stays up across several programs
+
+    The simulator is built and launched, and the switchboard queues and the
+    UmiRouter are created, once in start().  Each call to run() then holds
+    the EBRICK in reset, loads a new program (into the session's UmiRam, or
+    into umi_mem_agent when memagent=True), releases reset, asserts "go", and services the EBRICK
+    until the program writes its exit code.  The exit code and UART output
+    are returned rather than ending the Python process.
+
+    See test_prv32.py and test_prv32_memagent.py for a walkthrough of the
+    individual steps.
+    """
+
+    def __init__(self, memagent=False, trace=False, fast=True, wait='spin', echo=True,
+                 bindir=None, builddir=None):
+        self.memagent = memagent
+        self.trace = trace
+        self.fast = fast
+        self.wait = wait
+        self.bindir = bindir
+        self.builddir = builddir
+
+        self.uart = UartDevice(echo=echo, capture=True)
+        self.exit_device = ExitDevice()
+
+        self.dut = None
+        self.process = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def testbench_dir(self):
+        return Path(sc_path(self.dut, 'ebrick_demo')) / 'testbench'
+
+    def start(self):
+        '''Builds and launches the simulation.'''
+
+        dut = SbDut('testbench', tool='verilator', trace=self.trace, default_main=True)
+
+        ebrick.setup(dut, testbench=True)
+
+        if self.builddir is not None:
+            dut.set('option', 'builddir', str(Path(self.builddir).resolve()))
+
+        dut.add('option', 'idir', 'testbench', package='ebrick_demo')
+        if self.memagent:
+            dut.input('testbench/ebrick_crossbar_4x4.sv', package='ebrick_demo')
+            dut.input('testbench/testbench_prv32_memagent.sv', package='ebrick_demo')
+        else:
+            dut.input('testbench/testbench.sv', package='ebrick_demo')
+
+        self.dut = dut
+
+        build_simulator(dut, fast=self.fast, trace=self.trace)
+
+        if self.memagent:
+            self.mem = UmiTxRx('host2mem_0.q', 'mem2host_0.q', fresh=True, max_bytes=4)
+        self.mon = UmiTxRx('mtr2core_0.q', 'core2mtr_0.q', fresh=True)
+        gpioq = UmiTxRx('host2gpio_0.q', 'gpio2host_0.q', fresh=True)
+
+        self.process = dut.simulate()
+
+        # nreset=0, go=0
+        self.gpio = gpioq.gpio(iwidth=128, owidth=32, init=0, max_bytes=4)
+
+        # the routes stay the same from one program to the next; each run
+        # loads its program into the same memory
+        self.router = UmiRouter()
+        if not self.memagent:
+            self.memory = UmiRam(MEMORY_SIZE)
+            self.router.register_region('MEM', self.memory, size=MEMORY_SIZE)
+        self.router.register_address(self.router.memory_map.uart_addr, self.uart, name='UART')
+        self.router.register_address(self.router.memory_map.exit_addr, self.exit_device,
+                                     name='EXIT')
+
+    def close(self):
+        '''Stops the simulation.'''
+
+        if self.process is not None:
+            self.process.terminate()
+            self.process = None
+
+    def build(self, program):
+        '''Builds a program in testbench/program, returning the path of its binary.'''
+
+        bindir = Path(self.bindir) if self.bindir is not None else self.testbench_dir / 'program'
+        program_file = bindir.resolve() / Path(program).with_suffix('.bin').name
+
+        build_riscv_binary(
+            files=[f'program/{program}', 'program/init.S'],
+            linkcfg='program/link.ld',
+            incdirs=['.', '../config'],
+            output=program_file,
+            cwd=self.testbench_dir
+        )
+
+        return program_file
+
+    def reset(self):
+        '''Holds the EBRICK in reset and discards any requests it left behind.'''
+
+        self.gpio.o[1] = 0  # de-assert go
+        self.gpio.o[0] = 0  # assert nreset
+
+        # the previous program's final instruction fetch (and anything else
+        # that was in flight) is never answered; the core restarts from reset.
+        # Requests can still arrive for a while after reset is asserted, so
+        # keep discarding them until RESET_SETTLE_POLLS polls in a row have
+        # found nothing, waiting between polls as the session does when it
+        # services the EBRICK.
+        quiet = 0
+
+        def discard():
+            nonlocal quiet
+            count = 0
+            while self.mon.recv(blocking=False) is not None:
+                count += 1
+            quiet = 0 if count else quiet + 1
+            return count
+
+        Dispatcher(discard, wait=self.wait).run(until=lambda: quiet >= RESET_SETTLE_POLLS)
+
+    def run(self, program):
+        '''Runs a program, returning a ProgramResult.'''
+
+        program_file = self.build(program)
+
+        start = time.time()
+
+        self.reset()
+        self.uart.reset()
+        self.exit_device.reset()
+
+        self.gpio.o[0] = 1  # de-assert nreset
+
+        if self.memagent:
+            # 0x8888 is the chipid for the Python host
+            program_mem = np.fromfile(program_file, dtype=np.uint8)
+            preload(self.mem, 0x0, program_mem,
+                    srcaddr=self.router.memory_map.chipid('HOST') << 40)
+        else:
+            load_elf(self.memory, program_file.with_suffix('.elf'))
+
+        self.gpio.o[1] = 1  # assert go
+
+        service = UmiBatchService(self.mon, self.router)
+        dispatcher = Dispatcher(service.service, wait=self.wait)
+        dispatcher.run(until=lambda: self.exit_device.done)
+        self.uart.flush()
+
+        return ProgramResult(
+            program=program,
+            exit_code=self.exit_device.exit_code,
+            output=self.uart.getvalue(),
+            time=time.time() - start
+        )
+
+    def run_all(self, programs):
+        '''Runs several programs one after the other, returning a list of ProgramResults.'''
+
+        return [self.run(program) for program in programs]
+
+
+if __name__ == '__main__':
+    import sys
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description='Run several programs in one simulation.')
+    parser.add_argument('programs', nargs='*', default=['hello.c'],
+        help="C source files in testbench/program to run, in order")
+    parser.add_argument('--memagent', action='store_true',
+        help="use the umi_mem_agent testbench instead of the Python memory")
+    parser.add_argument('--trace', action='store_true',
+        help="dump waveforms during simulation")
+
+    args = parser.parse_args()
+
+    with Prv32Session(memagent=args.memagent, trace=args.trace) as session:
+        results = session.run_all(args.programs)
+
+    for result in results:
+        print(f'*** {result.program}: exit code {result.exit_code} ({result.time:.2f}s) ***')
+
+    sys.exit(0 if all(result.exit_code == 0 for result in results) else 1)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+# Fingerprint-keyed simulator builds
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+
+import fcntl
+import json
+
+from contextlib import contextmanager
+from pathlib import Path
+
+from ebrick_demo.fingerprint import fingerprint_chip
+
+
+@contextmanager
+def file_lock(path):
+    '''Holds an exclusive lock on path (created if needed) for the duration of the block.'''
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def build_simulator(dut, fast=False, trace=False):
+    '''
+    Builds the simulator for dut in a build directory keyed by a fingerprint of
+    its inputs: RTL sources, include directories, defines, Verilator control
+    files and options (such as config.vlt), package refs (such as the
+    picorv32 commit) and the Verilator version.
+
+    Each fingerprint gets its own jobname, so builds for different testbenches
+    or different sources are kept side by side.  If "fast" is set, a simulator
+    previously built from the same fingerprint is reused; a simulator built from
+    different sources is never picked up.  Concurrent builds of the same
+    fingerprint are serialized with a lock file.
+    '''
+
+    extra = {'trace': trace}
+    if trace:
+        # VCD and FST tracing are different builds
+        extra['trace_type'] = getattr(dut, 'trace_type', 'vcd')
+
+    fingerprint = fingerprint_chip(dut, 'verilator', 'compile', extra=extra)
+
+    jobname = f'sim_{fingerprint["digest"][:16]}'
+    dut.set('option', 'jobname', jobname)
+
+    builddir = Path(dut.get('option', 'builddir')) / dut.design
+
+    with file_lock(builddir / f'.{jobname}.lock'):
+        sim = dut.build(fast=fast)
+
+        # record what went into the build, to help with debugging cache misses
+        with open(builddir / jobname / 'fingerprint.json', 'w') as f:
+            json.dump(fingerprint, f, indent=2, sort_keys=True, default=str)
+
+    return sim
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+# Host-side performance telemetry for simulation runs
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+
+import json
+import time
+import numpy as np
+
+from collections import Counter
+
+from switchboard import UmiCmd
+
+OPCODE_NAMES = {
+    int(UmiCmd.UMI_REQ_READ): 'UMI_REQ_READ',
+    int(UmiCmd.UMI_REQ_WRITE): 'UMI_REQ_WRITE',
+    int(UmiCmd.UMI_REQ_POSTED): 'UMI_REQ_POSTED'
+}
+
+# response latencies are binned by powers of two of microseconds: bin 0 is
+# below 1 us, bin n covers [2^(n-1), 2^n) us, and the last bin holds the rest
+LATENCY_BINS = 24
+
+
+def read_cycle_count(gpio):
+    '''
+    Reads the cycle counter that testbench.sv exposes on GPIO inputs 127:64.
+
+    Slicing gpio.i reads all 128 input bits, so the counter's 8 bytes are
+    read directly instead, at byte offset 8 of the GPIO inputs.  If the GPIO
+    is limited to transactions of fewer than 8 bytes, the counter is read 32
+    bits at a time and the upper half is read again to catch the lower half
+    wrapping between the two reads.
+    '''
+
+    gpio_in = gpio.i
+    addr = gpio_in.dstaddr + 8
+
+    def read(offset, dtype):
+        return int(gpio_in.umi.read(addr + offset, dtype, srcaddr=gpio_in.srcaddr,
+                                    max_bytes=gpio_in.max_bytes))
+
+    if gpio_in.max_bytes >= 8:
+        return read(0, np.uint64)
+
+    while True:
+        upper = read(4, np.uint32)
+        lower = read(0, np.uint32)
+        if read(4, np.uint32) == upper:
+            return (upper << 32) | lower
+
+
+def _latency_bin(seconds):
+    return min(int(seconds * 1e6).bit_length(), LATENCY_BINS - 1)
+
+
+def _latency_label(n):
+    if n == 0:
+        return '<1us'
+    elif n == LATENCY_BINS - 1:
+        return f'>={1 << (n - 1)}us'
+    else:
+        return f'{1 << (n - 1)}-{1 << n}us'
+
+
+class Telemetry:
+    """Counters describing where the time goes in a simulation run
+
+    UmiBatchService updates the counters for each batch of requests that it
+    services: requests per opcode, bytes moved per memory-map region, time
+    spent in Python handling requests, and a histogram of the latency from
+    receiving each request to sending its response.  start() and stop()
+    bracket the run, optionally with the simulator's cycle count, and pick up
+    the busy/idle time of the Dispatcher polling the service.
+
+    The counters are plain integers and dictionaries updated once per packet,
+    so telemetry can be left on for ordinary runs.  report() returns a
+    printable summary and to_dict()/save() export the same data as JSON.
+    """
+
+    def __init__(self):
+        self.opcodes = Counter()
+        self.region_bytes = Counter()
+        self.region_requests = Counter()
+        self.latency = [0] * LATENCY_BINS
+
+        self.packets = 0
+        self.responses = 0
+        self.batches = 0
+        self.handler_time = 0.0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+        self.start_time = None
+        self.stop_time = None
+        self.start_cycles = None
+        self.stop_cycles = None
+
+        self.busy_time = None
+        self.idle_time = None
+
+    def start(self, cycles=None):
+        '''Marks the start of the run, optionally with the simulator cycle count.'''
+
+        self.start_time = time.perf_counter()
+        self.start_cycles = cycles
+
+    def stop(self, cycles=None, dispatcher=None):
+        '''Marks the end of the run, optionally with the simulator cycle count.'''
+
+        self.stop_time = time.perf_counter()
+        self.stop_cycles = cycles
+
+        if dispatcher is not None:
+            self.busy_time = dispatcher.busy_time
+            self.idle_time = dispatcher.idle_time
+
+    def request(self, opcode, region, nbytes):
+        '''Counts one request.'''
+
+        self.opcodes[opcode] += 1
+        self.region_requests[region] += 1
+        self.region_bytes[region] += nbytes
+
+    def batch(self, recv_times, send_time, responses, handler_time):
+        '''
+        Counts one batch of requests.  recv_times are the times at which the
+        requests were received, and send_time is the time at which the
+        responses were sent.
+        '''
+
+        self.batches += 1
+        self.packets += len(recv_times)
+        self.handler_time += handler_time
+
+        # every request in the batch is answered (if at all) at send_time
+        if responses:
+            self.responses += responses
+            for t in recv_times:
+                latency = send_time - t
+                self.latency[_latency_bin(latency)] += 1
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+
+    @property
+    def wall_time(self):
+        if self.start_time is None:
+            return None
+        stop = self.stop_time if self.stop_time is not None else time.perf_counter()
+        return stop - self.start_time
+
+    @property
+    def cycles(self):
+        if (self.start_cycles is None) or (self.stop_cycles is None):
+            return None
+        return self.stop_cycles - self.start_cycles
+
+    def to_dict(self):
+        '''Returns the measurements as a JSON-serializable dictionary.'''
+
+        wall = self.wall_time
+        cycles = self.cycles
+
+        def rate(count):
+            return (count / wall) if wall else None
+
+        return {
+            'wall_time': wall,
+            'packets': self.packets,
+            'responses': self.responses,
+            'batches': self.batches,
+            'packets_per_second': rate(self.packets),
+            'opcodes': {OPCODE_NAMES.get(int(k), str(k)): v for k, v in self.opcodes.items()},
+            'regions': {
+                name: {'requests': self.region_requests[name], 'bytes': self.region_bytes[name]}
+                for name in self.region_requests
+            },
+            'latency': {
+                'mean': (self.latency_total / sum(self.latency)) if any(self.latency) else None,
+                'max': self.latency_max,
+                'histogram': {_latency_label(n): count
+                              for n, count in enumerate(self.latency) if count}
+            },
+            'host': {
+                'handler_time': self.handler_time,
+                'busy_time': self.busy_time,
+                'idle_time': self.idle_time
+            },
+            'simulation': {
+                'cycles': cycles,
+                'cycles_per_second': rate(cycles) if cycles is not None else None
+            }
+        }
+
+    def save(self, filename):
+        '''Writes the measurements to a JSON file.'''
+
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def report(self):
+        '''Returns a printable summary of the measurements.'''
+
+        d = self.to_dict()
+        lines = []
+
+        wall = d['wall_time'] or 0.0
+        pps = d['packets_per_second'] or 0.0
+        lines.append(f'{d["packets"]} requests in {d["batches"]} batches over {wall:.3f}s '
+                     f'({pps:.0f} requests/s)')
+
+        if d['opcodes']:
+            lines.append('requests: ' + ', '.join(f'{name} {count}'
+                                                  for name, count in sorted(d['opcodes'].items())))
+        for name, region in sorted(d['regions'].items()):
+            lines.append(f'region {name}: {region["requests"]} requests, {region["bytes"]} bytes')
+
+        latency = d['latency']
+        if latency['mean'] is not None:
+            lines.append(f'response latency: mean {1e6 * latency["mean"]:.1f}us, '
+                         f'max {1e6 * latency["max"]:.1f}us')
+            lines.append('latency histogram: ' + ', '.join(
+                f'{label} {count}' for label, count in latency['histogram'].items()))
+
+        host = d['host']
+        line = f'host: handling requests {host["handler_time"]:.3f}s'
+        if host['idle_time'] is not None:
+            line += f', polling {host["busy_time"]:.3f}s busy / {host["idle_time"]:.3f}s idle'
+        lines.append(line)
+
+        sim = d['simulation']
+        if sim['cycles'] is not None:
+            cps = sim['cycles_per_second'] or 0.0
+            lines.append(f'simulation: {sim["cycles"]} cycles ({cps:.0f} cycles/s)')
+
+        return '\n'.join(lines)
@@ -7,21 +7,45 @@
 # This code is licensed under Apache License 2.0 (see LICENSE for details)
 
 import sys
-import numpy as np
 from pathlib import Path
 
 from siliconcompiler.package import path as sc_path
-from switchboard import SbDut, UmiTxRx, PyUmiPacket, UmiCmd, umi_opcode
+from switchboard import SbDut, UmiTxRx
 
 import ebrick_demo.ebrick as ebrick
 from ebrick_demo.testbench.program.riscv import build_riscv_binary
-from ebrick_demo.testbench.umi_ram import UmiRam
+from ebrick_demo.testbench.sim_build import build_simulator
+from ebrick_demo.testbench.elf import ElfFile, load_elf
+from ebrick_demo.testbench.umi_ram import UmiRam, SparseUmiRam, MemmapUmiRam
+from ebrick_demo.testbench.umi_service import UmiBatchService
+from ebrick_demo.testbench.umi_router import UmiRouter, MemoryMap
+from ebrick_demo.testbench.umi_devices import UartDevice, UartSink, ExitDevice, FLUSH_POLICIES
+from ebrick_demo.testbench.dispatcher import Dispatcher, WAIT_STRATEGIES
+from ebrick_demo.testbench.umi_trace import UmiTraceRecorder
+from ebrick_demo.testbench.telemetry import Telemetry, read_cycle_count
+from ebrick_demo.testbench.umi_timing import MemoryTiming, parse_timing
+from ebrick_demo.testbench.profiler import FetchProfiler
+from ebrick_demo.testbench.trace_control import TraceControl, parse_trigger, setup_trace, \
+    trace_plusargs, TRACE_FORMATS, TRACE_SCOPES
 
 # size of the processor memory in bytes
 MEMORY_SIZE = 32768
 
 
-def run_test(trace=False, fast=False):
+def run_test(trace=False, fast=False, wait='spin', memory_image=None, snapshot=None,
+             save_snapshot=None, sparse_memory=False,
+             program='hello.c', bindir=None, builddir=None, record=None,
+             telemetry=False, telemetry_json=None,
+             uart_flush='line', uart_log=None, memory_timing=None, memory_timing_json=None,
+             profile=False, profile_folded=None,
+             trace_format='vcd', trace_scope='testbench', trace_depth=0,
+             trace_start=None, trace_stop=None):
+    if (memory_image is not None) and (snapshot is not None):
+        raise ValueError('memory_image and snapshot cannot be combined')
+    if sparse_memory and ((memory_image is not None) or (snapshot is not None)
+                          or (save_snapshot is not None)):
+        raise ValueError('sparse_memory cannot be combined with memory images or snapshots')
+
     ############################
     # build the RTL simulation #
     ############################
@@ -35,12 +59,17 @@ def run_test(trace=False, fast=False):
     # * 'testbench' is the name of the top-level module
     # * 'tool' indicates the Verilog simulation tool ('verilator' or 'icarus')
     # * 'trace' indicates whether waveforms should be dumped
+    # * 'trace_type' is the waveform format: 'vcd', or 'fst', which is
+    #   compressed and much smaller for long runs
     # * 'default_main' is Verilator-specific; means that switchboard's default
     #   C++ main() implementation should be used. In the future, it will not
     #   generally be necessary to specify this, because default_main=True will
-    #   become the default in the SbDut constructor.
+    #   become the default in the SbDut constructor.  When dumping waveforms,
+    #   testbench.cc is used instead, so that the dump can be started and
+    #   stopped during the run (see setup_trace() below).
 
-    dut = SbDut('testbench', tool='verilator', trace=trace, default_main=True)
+    dut = SbDut('testbench', tool='verilator', trace=trace, trace_type=trace_format,
+                default_main=not trace)
 
     # The next few commands specify the Verilog sources to be used in the
     # simulation.  ebrick.setup() configures the RTL sources for the custom
@@ -50,17 +79,37 @@ def run_test(trace=False, fast=False):
 
     ebrick.setup(dut, testbench=True)
 
+    # builds go to "builddir" if one is given (the default is ./build), while
+    # the program binary goes to "bindir" (the default is testbench/program)
+    if builddir is not None:
+        dut.set('option', 'builddir', str(Path(builddir).resolve()))
+
+    if bindir is None:
+        bindir = Path(sc_path(dut, 'ebrick_demo')) / 'testbench' / 'program'
+    program_file = Path(bindir).resolve() / Path(program).with_suffix('.bin').name
+
     dut.add('option', 'idir', 'testbench', package='ebrick_demo')
     dut.input('testbench/testbench.sv', package='ebrick_demo')
 
+    # Verilator fixes the part of the design in the waveform dump when the
+    # simulator is built, so the scope and depth are set up here
+    if trace:
+        setup_trace(dut, scope=trace_scope, depth=trace_depth)
+
     # build() kicks off the simulator build using the source files configured
     # in the previous commands. The result depends on the simulator being used
     # For Verilator, the output of build() is an executable that can be run
     # in a standalone fashion, while for Icarus Verilog, the result is a binary
-    # run with vvp. The "fast" argument indicates whether the build should be
-    # skipped if the binary output already exists.
+    # run with vvp.
+    #
+    # build_simulator() wraps build().  It computes a fingerprint of everything
+    # that goes into the simulator (RTL sources, include directories, defines,
+    # config.vlt, the picorv32 commit, and the Verilator version) and builds
+    # into a directory named after that fingerprint.  The "fast" argument
+    # indicates whether the build should be skipped if a simulator with the
+    # same fingerprint already exists.
 
-    dut.build(fast=fast)
+    build_simulator(dut, fast=fast, trace=trace)
 
     ############################
     # build the program binary #
@@ -73,10 +122,10 @@ def run_test(trace=False, fast=False):
     # have different compilation tools.
 
     build_riscv_binary(
-        files=['program/hello.c', 'program/init.S'],
+        files=[f'program/{program}', 'program/init.S'],
         linkcfg='program/link.ld',
         incdirs=['.', '../config'],
-        output='program/hello.bin',
+        output=program_file,
         cwd=Path(sc_path(dut, 'ebrick_demo')) / 'testbench'
     )
 
@@ -113,8 +162,26 @@ def run_test(trace=False, fast=False):
     print('*** Launching RTL simulation ***')
 
     # simulate() launches the RTL simulation built earlier via the build() command
-
-    dut.simulate()
+    #
+    # Dumping waveforms for a whole run slows the simulation down and makes
+    # large files, so the dump can be limited to part of the hierarchy
+    # ("trace_scope" and "trace_depth") and to a window of the run, from
+    # "trace_start" to "trace_stop".  These are triggers such as "cycle=5000",
+    # "uart=!" or "status=0" (see trace_control.py); testbench.sv reads the
+    # dump file name and the cycle triggers from plusargs.
+
+    plusargs = None
+    if trace:
+        memory_map = MemoryMap()
+        if trace_start is not None:
+            trace_start = parse_trigger(trace_start, memory_map)
+        if trace_stop is not None:
+            trace_stop = parse_trigger(trace_stop, memory_map)
+
+        plusargs = trace_plusargs(fmt=trace_format, scope=trace_scope, depth=trace_depth,
+                                  start=trace_start, stop=trace_stop)
+
+    dut.simulate(plusargs=plusargs)
 
     #####################
     # main test program #
@@ -130,18 +197,22 @@ def run_test(trace=False, fast=False):
     #
     # Each UmiGpio instance corresponds to an instance of umi_gpio in the RTL
     # simulation. In this case, there is one umi_gpio instance in testbench.sv,
-    # and it has IWIDTH=32, OWIDTH=32. Those same values are provided to the
+    # and it has IWIDTH=128, OWIDTH=32. Those same values are provided to the
     # UmiTxRx.gpio() method, along with the initial value of the GPIO outputs,
-    # "init".
+    # "init".  Since the UMI data width of umi_gpio is 32 bits, max_bytes=4
+    # splits reads of the 128 input bits into 4-byte transactions.
     #
     # From testbench.sv, the GPIO mapping is as follows:
     # * Output 0: nreset
     # * Output 1: go
+    # * Outputs 3:2: stop/start the waveform dump (see trace_control.py)
+    # * Inputs 31:0: EBRICK status
+    # * Inputs 127:64: number of simulated clock cycles
     #
     # Setting init=0 means that nreset=0, go=0. Hence, the EBRICK is initially
     # held in reset.
 
-    gpio = gpioq.gpio(iwidth=32, owidth=32, init=0)
+    gpio = gpioq.gpio(iwidth=128, owidth=32, init=0, max_bytes=4)
 
     # de-assert nreset
     print('*** De-assert ebrick "nreset" ***')
@@ -157,18 +228,50 @@ def run_test(trace=False, fast=False):
     # program the memory
     print('*** Programming RAM ***')
 
-    # np.fromfile() is a standard NumPy function that reads a file into
-    # a NumPy array.  Since dtype=np.uint8, the numpy array is formatted
-    # as a byte array.
+    # create a Python model of the processor memory
+    #
+    # By default, the memory is a NumPy array filled with random data.
+    # Alternatively, it can be kept in a memory-mapped file:
+    # * memory_image: the file is read and updated in place, so it holds
+    #   the final memory contents at the end of the run
+    # * snapshot: the file is mapped copy-on-write, so the run starts from
+    #   its contents but never modifies it.  Many runs can share one image.
+    #   The image already holds the program (see save_snapshot below), so it
+    #   is not loaded again.
+    #
+    # With "sparse_memory", storage is allocated in pages as the program
+    # touches them (SparseUmiRam), which is how large address spaces are
+    # modeled.
+
+    if snapshot is not None:
+        main_memory = MemmapUmiRam.from_snapshot(snapshot)
+    elif memory_image is not None:
+        main_memory = MemmapUmiRam(MEMORY_SIZE, memory_image)
+    elif sparse_memory:
+        main_memory = SparseUmiRam(MEMORY_SIZE)
+    else:
+        main_memory = UmiRam(MEMORY_SIZE)
+
+    # Load the RISC-V program into the memory.  build_riscv_binary() leaves the
+    # ELF file next to the flat binary, and load_elf() copies each loadable
+    # segment of the ELF straight from the (memory-mapped) file to its address
+    # in main_memory, zero-filling .bss.  Alternatively, the flat binary can be
+    # read with np.fromfile() and loaded with main_memory.initialize_memory(0, ...)
 
-    program_file = Path(sc_path(dut, 'ebrick_demo')) / 'testbench' / 'program' / 'hello.bin'
-    program_mem = np.fromfile(program_file, dtype=np.uint8)
+    #
+    # A snapshot only checkpoints memory: the PicoRV32 still comes out of reset
+    # and runs its startup code for every run.  So the snapshot is taken once
+    # the program has been loaded and before the core starts, which is the
+    # state that each run can start from.
 
-    # create a Python model of the processor memory and initialize it
-    # with the RISC-V program contents
+    if snapshot is not None:
+        # the ELF file is still needed to symbolize profiles
+        elf = ElfFile(program_file.with_suffix('.elf'))
+    else:
+        elf = load_elf(main_memory, program_file.with_suffix('.elf'))
 
-    main_memory = UmiRam(MEMORY_SIZE)
-    main_memory.initialize_memory(0, program_mem)
+    if save_snapshot is not None:
+        main_memory.save(save_snapshot)
 
     # assert go
     print('*** Assert ebrick "go" ***')
@@ -203,67 +306,148 @@ def run_test(trace=False, fast=False):
     # * chipid=0xDDDD: EBRICK DUT
     #
     # Details of the memory map are contained in ebrick_demo/config/ebrick_memory_map.vh
+    # (for the RTL) and ebrick_demo/config/ebrick_memory_map.h (for C and Python)
 
     print('*** Monitoring ebrick output ***')
 
-    while True:
-        # UmiTxRx.recv() returns a PyUmiPacket object.  blocking=False means that
-        # the method returns None if there is no UMI packet immediately available.
-        p = mon.recv(blocking=False)
-
-        if p is not None:
-            # make sure that we know how to process this request
-            opcode = umi_opcode(p.cmd)
-            assert opcode in {UmiCmd.UMI_REQ_READ, UmiCmd.UMI_REQ_WRITE, UmiCmd.UMI_REQ_POSTED}, \
-                f'Unsupported opcode: {opcode}'
-
-            # 0x0000 is the chipid for UmiRam
-            # 0x00_0000_0000 to MEMORY_SIZE is address space for main memory
-            if p.dstaddr < ((0x0000 << 40) + MEMORY_SIZE):
-                if opcode in {UmiCmd.UMI_REQ_WRITE, UmiCmd.UMI_REQ_POSTED}:
-                    # commit the write to the Python memory model
-                    main_memory.write(p)
-                elif opcode == UmiCmd.UMI_REQ_READ:
-                    # read the requested data and send it back
-
-                    # change the command to a read response
-                    cmd = (p.cmd & 0xffffffe0) | int(UmiCmd.UMI_RESP_READ)
-
-                    # format response into a packet. in UMI, outgoing requests have
-                    # a srcaddr field that indicates where the response should be
-                    # sent. hence the dstaddr and srcaddr fields are flipped when
-                    # formatting the response packet.
-                    resp = PyUmiPacket(cmd, p.srcaddr, p.dstaddr, main_memory.read(p))
-
-                    # send the packet back to the processor
-                    mon.send(resp)
-
-            # 0xCCCC is the chipid for the Python monitor
-            # 0x00_C000_0000 is the write address for the UART device
-            elif p.dstaddr == ((0xCCCC << 40) + 0x00C0000000):
-                # print the character received
-                c = chr(p.data[0])
-                print(c, end='', flush=True)
-
-            # 0xCCCC is the chipid for the Python monitor
-            # 0x00_D000_0000 is the EXIT ADDRESS
-            elif p.dstaddr == ((0xCCCC << 40) + 0x00D0000000):
-                # exit the simulation
-                exit_code = int(p.data.view(np.uint32)[0])
-                sys.exit(exit_code)
-            else:
-                raise ValueError(f'Unsupported address: 0x{p.dstaddr:08x}')
-
-            # send a write reponse if this was an ordinary write (non-posted)
-            if opcode == UmiCmd.UMI_REQ_WRITE:
-                # change the command to a write response
-                cmd = (p.cmd & 0xffffffe0) | int(UmiCmd.UMI_RESP_WRITE)
-
-                # flip the source address and destination address
-                resp = PyUmiPacket(cmd, p.srcaddr, p.dstaddr)
-
-                # send the response
-                mon.send(resp)
+    # The memory map above is implemented with a UmiRouter.  The router reads
+    # the chipids and address ranges from ebrick_memory_map.h (the same file
+    # used by the RISC-V program) and maps each range to the object that
+    # handles requests to it:
+    #
+    # * the MEM region (chipid=0x0000, up to MEMORY_SIZE bytes) goes to the UmiRam
+    # * UART_ADDR in the MONITOR region (chipid=0xCCCC) goes to a UartDevice,
+    #   which prints the character received
+    # * EXIT_ADDR in the MONITOR region goes to an ExitDevice, which records
+    #   the exit code
+    #
+    # Requests to any other address are reported as errors.  New devices can be
+    # added by registering them with the router.
+
+    # The UartDevice passes characters to a UartSink, which buffers them on
+    # their way to stdout.  The "uart_flush"
+    # policy decides when the buffer is written: "immediate" writes every
+    # character as it arrives, "line" writes whole lines, and "batch" writes
+    # several kilobytes at a time, which is the cheapest for chatty programs.
+    # If "uart_log" is given, the sink also keeps a copy of the output, which
+    # is saved to that file, so that regressions can check the output without
+    # picking it out of the test's log.
+
+    uart = UartDevice(sink=UartSink(policy=uart_flush, capture=uart_log is not None))
+
+    router = UmiRouter()
+    router.register_region('MEM', main_memory, size=MEMORY_SIZE)
+    router.register_address(router.memory_map.uart_addr, uart, name='UART')
+    exit_device = ExitDevice()
+    router.register_address(router.memory_map.exit_addr, exit_device, name='EXIT')
+
+    # UmiBatchService implements the processing loop described above.  Each
+    # call to service() drains all of the UMI requests that are waiting in the
+    # queue, performs the memory reads and writes among them on the UmiRam,
+    # passes the remaining requests to their devices, and then sends all of
+    # the responses back to the processor.
+
+    # optionally record every request and response into a binary trace,
+    # which can be replayed later without the RTL simulation (see umi_trace.py)
+    recorder = None
+    if record is not None:
+        recorder = UmiTraceRecorder(record)
+        mon = recorder.wrap(mon)
+
+    # Telemetry counts the requests serviced per opcode and per region, times
+    # the Python side, and uses the cycle counter in testbench.sv to measure
+    # how fast the RTL simulation runs.  Together with the dispatcher's
+    # busy/idle times, this shows whether a slow run is limited by the
+    # simulator or by the Python host.
+
+    stats = None
+    if telemetry or (telemetry_json is not None):
+        stats = Telemetry()
+        stats.start(cycles=read_cycle_count(gpio))
+
+    # By default, UmiRam responds as soon as the Python host gets to a request.
+    # To see how the core would perform with a real memory chiplet, a
+    # MemoryTiming model can be placed in between: it works out when each
+    # memory request would complete (from read/write latencies, banks and
+    # open rows, the number of requests in flight, and the interface
+    # bandwidth), and the response is held until the cycle counter in
+    # testbench.sv reaches that cycle.  "memory_timing" is a preset name,
+    # a JSON file, or a list of parameters (see umi_timing.py).
+
+    timing = None
+    if memory_timing is not None:
+        timing = MemoryTiming(**parse_timing(memory_timing))
+        mon = timing.wrap(mon, router, clock=lambda: read_cycle_count(gpio))
+
+    # The PicoRV32 fetches every instruction that it executes with a UMI read,
+    # so the monitor sees the program counter of each instruction.  The
+    # FetchProfiler counts the fetches from the program's code in a NumPy
+    # histogram, and attributes them to functions (from the ELF symbol
+    # table), to source lines (with addr2line, since programs are built
+    # with -g), and to call stacks, which can be saved in the folded format
+    # used by flamegraph tools.
+
+    profiler = None
+    if profile or (profile_folded is not None):
+        profiler = FetchProfiler(elf, chipid=router.memory_map.chipid('MEM'))
+        mon = profiler.wrap(mon)
+
+    # Trace triggers other than cycle counts are checked by a TraceControl:
+    # address triggers on each request the monitor receives, and status
+    # triggers by polling the GPIO inputs while waiting for the program to
+    # exit.  It sets a GPIO output to start or stop the dump.
+
+    control = None
+    if trace and ((trace_start is not None) or (trace_stop is not None)):
+        control = TraceControl(gpio, start=trace_start, stop=trace_stop)
+        mon = control.wrap(mon)
+
+    service = UmiBatchService(mon, router, telemetry=stats)
+
+    # The Dispatcher calls service.service() over and over.  When there is nothing
+    # in the queue, the "wait" strategy decides what the host does before polling
+    # again: "spin" polls immediately, "yield" gives up the host core to other
+    # processes (such as the simulator), and "backoff" sleeps for progressively
+    # longer periods.  The latter two free up the host while the RTL is busy,
+    # but add to the time the core waits for each response, so "spin" is the
+    # default, as with the original polling loop.
+
+    dispatcher = Dispatcher(service.service, wait=wait)
+
+    def done():
+        if control is not None:
+            control.poll()
+        return exit_device.done
+
+    try:
+        # run until the program writes its exit code
+        dispatcher.run(until=done)
+    finally:
+        uart.flush()
+        print(f'*** {dispatcher.report()} ***')
+        if recorder is not None:
+            recorder.close()
+        if stats is not None:
+            stats.stop(cycles=read_cycle_count(gpio), dispatcher=dispatcher)
+            if telemetry:
+                print(stats.report())
+            if telemetry_json is not None:
+                stats.save(telemetry_json)
+        if profiler is not None:
+            profiler.flush()
+            if profile:
+                print(profiler.report(addr2line='riscv64-unknown-elf-addr2line'))
+            if profile_folded is not None:
+                profiler.save_folded(profile_folded)
+        if timing is not None:
+            print(timing.report())
+            if memory_timing_json is not None:
+                timing.save(memory_timing_json)
+        if uart_log is not None:
+            Path(uart_log).write_text(uart.getvalue())
+
+    # exit the simulation
+    sys.exit(exit_device.exit_code)
 
 
 if __name__ == '__main__':
@@ -271,10 +455,82 @@ if __name__ == '__main__':
 
     parser = ArgumentParser()
     parser.add_argument('--fast', action='store_true',
-        help="don't build the simulator if one is found")
+        help="don't rebuild the simulator if its sources are unchanged")
     parser.add_argument('--trace', action='store_true',
         help="dump waveforms during simulation")
+    parser.add_argument('--trace-format', default='vcd', choices=TRACE_FORMATS,
+        help="waveform format; fst is compressed")
+    parser.add_argument('--trace-scope', default='testbench', choices=list(TRACE_SCOPES.keys()),
+        help="part of the design to dump waveforms for")
+    parser.add_argument('--trace-depth', type=int, default=0,
+        help="number of hierarchy levels to dump below the scope (0 for all)")
+    parser.add_argument('--trace-start',
+        help="start dumping on this trigger: cycle=N, exit, uart=C, addr=A[:D] or status=N")
+    parser.add_argument('--trace-stop',
+        help="stop dumping on this trigger (same forms as --trace-start)")
+    parser.add_argument('--wait', default='spin', choices=list(WAIT_STRATEGIES.keys()),
+        help="what the host does while waiting for UMI requests")
+    parser.add_argument('--program', default='hello.c',
+        help="C source file in testbench/program to run")
+    parser.add_argument('--bindir',
+        help="directory for the program binary (default: testbench/program)")
+    parser.add_argument('--builddir',
+        help="directory for simulator builds (default: ./build)")
+    parser.add_argument('--record',
+        help="record the monitor's UMI transactions into this trace file")
+    parser.add_argument('--telemetry', action='store_true',
+        help="print request counts, latencies and simulation speed at exit")
+    parser.add_argument('--telemetry-json',
+        help="write the telemetry to this JSON file")
+    parser.add_argument('--uart-flush', default='line', choices=FLUSH_POLICIES,
+        help="when the program's UART output is written to stdout")
+    parser.add_argument('--uart-log',
+        help="write the program's UART output to this file")
+    parser.add_argument('--memory-timing',
+        help="model memory latency and bandwidth: a preset (sram, dram, narrow), a JSON "
+        "file, or parameters such as read_latency=20,banks=4,row_size=2048")
+    parser.add_argument('--memory-timing-json',
+        help="write the memory timing statistics to this JSON file")
+    parser.add_argument('--profile', action='store_true',
+        help="print the functions and source lines with the most instruction fetches at exit")
+    parser.add_argument('--profile-folded',
+        help="write the profiled call stacks to this file, for flamegraph tools")
+    parser.add_argument('--memory-image',
+        help="keep main memory in this file, which is created if needed")
+    parser.add_argument('--snapshot',
+        help="start from the main memory image in this file, without modifying it or "
+        "loading the program")
+    parser.add_argument('--save-snapshot',
+        help="write main memory to this file once the program is loaded, for use with "
+        "--snapshot")
+    parser.add_argument('--sparse-memory', action='store_true',
+        help="allocate main memory in pages on first touch (SparseUmiRam)")
 
     args = parser.parse_args()
 
-    run_test(trace=args.trace, fast=args.fast)
+    run_test(
+        trace=args.trace,
+        fast=args.fast,
+        wait=args.wait,
+        memory_image=args.memory_image,
+        snapshot=args.snapshot,
+        save_snapshot=args.save_snapshot,
+        sparse_memory=args.sparse_memory,
+        program=args.program,
+        bindir=args.bindir,
+        builddir=args.builddir,
+        record=args.record,
+        telemetry=args.telemetry,
+        telemetry_json=args.telemetry_json,
+        uart_flush=args.uart_flush,
+        uart_log=args.uart_log,
+        memory_timing=args.memory_timing,
+        memory_timing_json=args.memory_timing_json,
+        profile=args.profile,
+        profile_folded=args.profile_folded,
+        trace_format=args.trace_format,
+        trace_scope=args.trace_scope,
+        trace_depth=args.trace_depth,
+        trace_start=args.trace_start,
+        trace_stop=args.trace_stop
+    )
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+# Example showing how to drive an EBRICK simulation from asyncio coroutines.
+# External memory is implemented in Python, as in test_prv32.py.
+
+# We suggest that you read through the test_prv32.py script first
+# before diving into this example.
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import asyncio
+import sys
+
+from pathlib import Path
+
+from siliconcompiler.package import path as sc_path
+from switchboard import SbDut, UmiTxRx
+
+import ebrick_demo.ebrick as ebrick
+from ebrick_demo.testbench.program.riscv import build_riscv_binary
+from ebrick_demo.testbench.sim_build import build_simulator
+from ebrick_demo.testbench.elf import load_elf
+from ebrick_demo.testbench.umi_ram import UmiRam
+from ebrick_demo.testbench.umi_service import UmiBatchService
+from ebrick_demo.testbench.umi_router import UmiRouter
+from ebrick_demo.testbench.umi_devices import UartDevice, ExitDevice
+from ebrick_demo.testbench.umi_async import AsyncUmi, AsyncGpio, serve, wait_until
+
+# size of the processor memory in bytes
+MEMORY_SIZE = 32768
+
+# how often the status of the EBRICK is checked, in seconds
+STATUS_INTERVAL = 0.1
+
+
+async def stimulus(gpio, main_memory, program_file):
+    '''Takes the EBRICK out of reset, loads the program and lets the EBRICK boot.'''
+
+    print('*** Assert ebrick "nreset" ***')
+    await gpio.start()
+
+    print('*** De-assert ebrick "nreset" ***')
+    await gpio.set(0, 1)
+
+    print('*** Programming RAM ***')
+    load_elf(main_memory, program_file.with_suffix('.elf'))
+
+    print('*** Assert ebrick "go" ***')
+    await gpio.set(1, 1)
+
+    print('*** Monitoring ebrick output ***')
+
+
+async def watch_status(gpio, exit_device):
+    '''
+    Checks the EBRICK status while the program runs, returning True if the
+    processor traps (status bit 0), which would otherwise leave the test
+    waiting forever for an exit code.
+    '''
+
+    while not exit_device.done:
+        if await gpio.get(0):
+            return True
+        await asyncio.sleep(STATUS_INTERVAL)
+
+    return False
+
+
+async def run(mon, gpioq, main_memory, program_file):
+    router = UmiRouter()
+    router.register_region('MEM', main_memory, size=MEMORY_SIZE)
+    uart = UartDevice()
+    router.register_address(router.memory_map.uart_addr, uart, name='UART')
+    exit_device = ExitDevice()
+    router.register_address(router.memory_map.exit_addr, exit_device, name='EXIT')
+
+    # GPIO inputs 127:64 hold the simulated cycle count (see test_prv32.py)
+    gpio = AsyncGpio(AsyncUmi(gpioq, max_bytes=4), iwidth=128, owidth=32, init=0)
+
+    # Each coroutine below waits on its own queue (or condition), yielding to
+    # the others while it has nothing to do, so that monitor traffic is
+    # serviced while GPIO transactions are in flight and vice versa.
+
+    memory = asyncio.create_task(serve(UmiBatchService(mon, router),
+                                       until=lambda: exit_device.done))
+    status = asyncio.create_task(watch_status(gpio, exit_device))
+
+    await stimulus(gpio, main_memory, program_file)
+
+    # run until the program writes its exit code, or the processor traps
+    done = asyncio.create_task(wait_until(lambda: exit_device.done))
+    await asyncio.wait([done, status], return_when=asyncio.FIRST_COMPLETED)
+
+    uart.flush()
+
+    if status.done() and status.result():
+        print('*** Processor trapped ***')
+        memory.cancel()
+        done.cancel()
+        return 1
+
+    await memory
+    status.cancel()
+
+    cycles = await gpio.get(slice(127, 64))
+    print(f'*** Exit code {exit_device.exit_code} after {cycles} cycles ***')
+
+    return exit_device.exit_code
+
+
+def run_test(trace=False, fast=False, program='hello.c', bindir=None, builddir=None):
+    # build the simulation
+    print('*** Building the RTL simulation ***')
+
+    dut = SbDut('testbench', tool='verilator', trace=trace, default_main=True)
+
+    ebrick.setup(dut, testbench=True)
+
+    # builds go to "builddir" if one is given (the default is ./build), while
+    # the program binary goes to "bindir" (the default is testbench/program)
+    if builddir is not None:
+        dut.set('option', 'builddir', str(Path(builddir).resolve()))
+
+    if bindir is None:
+        bindir = Path(sc_path(dut, 'ebrick_demo')) / 'testbench' / 'program'
+    program_file = Path(bindir).resolve() / Path(program).with_suffix('.bin').name
+
+    dut.add('option', 'idir', 'testbench', package='ebrick_demo')
+    dut.input('testbench/testbench.sv', package='ebrick_demo')
+
+    build_simulator(dut, fast=fast, trace=trace)
+
+    # build the program binary
+    print('*** Building RISC-V program binary ***')
+
+    build_riscv_binary(
+        files=[f'program/{program}', 'program/init.S'],
+        linkcfg='program/link.ld',
+        incdirs=['.', '../config'],
+        output=program_file,
+        cwd=Path(sc_path(dut, 'ebrick_demo')) / 'testbench'
+    )
+
+    # create queues
+    print('*** Creating switchboard queues ***')
+
+    mon = UmiTxRx('mtr2core_0.q', 'core2mtr_0.q', fresh=True)
+    gpioq = UmiTxRx('host2gpio_0.q', 'gpio2host_0.q', fresh=True)
+
+    # launch the simulation
+    print('*** Launching RTL simulation ***')
+
+    dut.simulate()
+
+    main_memory = UmiRam(MEMORY_SIZE)
+
+    # run the coroutines on one event loop until the program exits
+    exit_code = asyncio.run(run(mon, gpioq, main_memory, program_file))
+
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser()
+    parser.add_argument('--fast', action='store_true',
+        help="don't rebuild the simulator if its sources are unchanged")
+    parser.add_argument('--trace', action='store_true',
+        help="dump waveforms during simulation")
+    parser.add_argument('--program', default='hello.c',
+        help="C source file in testbench/program to run")
+    parser.add_argument('--bindir',
+        help="directory for the program binary (default: testbench/program)")
+    parser.add_argument('--builddir',
+        help="directory for simulator builds (default: ./build)")
+
+    args = parser.parse_args()
+
+    run_test(
+        trace=args.trace,
+        fast=args.fast,
+        program=args.program,
+        bindir=args.bindir,
+        builddir=args.builddir
+    )
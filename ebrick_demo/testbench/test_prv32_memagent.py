@@ -14,14 +14,25 @@ import numpy as np
 
 import ebrick_demo.ebrick as ebrick
 from ebrick_demo.testbench.program.riscv import build_riscv_binary
+from ebrick_demo.testbench.sim_build import build_simulator
+from ebrick_demo.testbench.dispatcher import Dispatcher, WAIT_STRATEGIES
+from ebrick_demo.testbench.umi_trace import UmiTraceRecorder
+from ebrick_demo.testbench.telemetry import Telemetry, read_cycle_count
+from ebrick_demo.testbench.umi_service import UmiBatchService
+from ebrick_demo.testbench.umi_router import UmiRouter
+from ebrick_demo.testbench.umi_devices import UartDevice, UartSink, ExitDevice, FLUSH_POLICIES
+from ebrick_demo.testbench.preload import preload, PRELOAD_MODES
 
 from pathlib import Path
-from switchboard import SbDut, UmiTxRx, PyUmiPacket, UmiCmd, umi_opcode
+from switchboard import SbDut, UmiTxRx
 
 from siliconcompiler.package import path as sc_path
 
 
-def run_test(trace=False, fast=False):
+def run_test(trace=False, fast=False, wait='spin',
+             program='hello.c', bindir=None, builddir=None, record=None,
+             telemetry=False, telemetry_json=None, preload_mode='posted', verify=False,
+             uart_flush='line', uart_log=None):
     # build the simulation
     print('*** Setting up simulation build ***')
 
@@ -29,6 +40,15 @@ def run_test(trace=False, fast=False):
 
     ebrick.setup(dut, testbench=True)
 
+    # builds go to "builddir" if one is given (the default is ./build), while
+    # the program binary goes to "bindir" (the default is testbench/program)
+    if builddir is not None:
+        dut.set('option', 'builddir', str(Path(builddir).resolve()))
+
+    if bindir is None:
+        bindir = Path(sc_path(dut, 'ebrick_demo')) / 'testbench' / 'program'
+    program_file = Path(bindir).resolve() / Path(program).with_suffix('.bin').name
+
     dut.add('option', 'idir', 'testbench', package='ebrick_demo')
     dut.input('testbench/ebrick_crossbar_4x4.sv', package='ebrick_demo')
     dut.input('testbench/testbench_prv32_memagent.sv', package='ebrick_demo')
@@ -37,17 +57,17 @@ def run_test(trace=False, fast=False):
     print('*** Building program binary ***')
 
     build_riscv_binary(
-        files=['program/hello.c', 'program/init.S'],
+        files=[f'program/{program}', 'program/init.S'],
         linkcfg='program/link.ld',
         incdirs=['.', '../config'],
-        output='program/hello.bin',
+        output=program_file,
         cwd=Path(sc_path(dut, 'ebrick_demo')) / 'testbench'
     )
 
     # building the simulator binary
     print('*** Building program binary ***')
 
-    dut.build(fast=fast)
+    build_simulator(dut, fast=fast, trace=trace)
 
     # create queues
     print('*** Creating switchboard queues ***')
@@ -64,7 +84,8 @@ def run_test(trace=False, fast=False):
     # put DUT into reset
     print('*** Assert ebrick "nreset" ***')
 
-    gpio = gpioq.gpio(owidth=32, iwidth=32, init=0)
+    # GPIO inputs 127:64 hold the simulated cycle count (see test_prv32.py)
+    gpio = gpioq.gpio(owidth=32, iwidth=128, init=0, max_bytes=4)
 
     # de-assert nreset
     print('*** De-assert ebrick "nreset" ***')
@@ -74,11 +95,17 @@ def run_test(trace=False, fast=False):
     # program the memory
     print('*** Programming RAM ***')
 
-    program_file = Path(sc_path(dut, 'ebrick_demo')) / 'testbench' / 'program' / 'hello.bin'
-    program = np.fromfile(program_file, dtype=np.uint8)
+    program_mem = np.fromfile(program_file, dtype=np.uint8)
     # 0x8888 is the chipid for the Python host
     # Please refer to ebrick_memory_map.vh(or .h) in the config directory
-    mem.write(0x0, program, srcaddr=0x8888 << 40)
+    #
+    # By default, the program is sent as a stream of posted writes followed by
+    # a single read, rather than waiting for a response to each write, so
+    # loading time is not dominated by round trips through the simulation.
+    loaded = preload(mem, 0x0, program_mem, srcaddr=0x8888 << 40, mode=preload_mode,
+                     verify=verify)
+    rate = (loaded.bytes / loaded.time) if loaded.time > 0 else 0
+    print(f'*** Loaded {loaded.bytes} bytes in {loaded.time:.3f}s ({rate:.0f} bytes/s) ***')
 
     # assert go
     print('*** Assert ebrick "go" ***')
@@ -88,41 +115,55 @@ def run_test(trace=False, fast=False):
     # print characters received
     print('*** Monitoring ebrick output ***')
 
-    while True:
-        p = mon.recv(blocking=False)
-        if p is not None:
-            # make sure that we know how to process this request
-            opcode = umi_opcode(p.cmd)
-            assert opcode in {UmiCmd.UMI_REQ_WRITE, UmiCmd.UMI_REQ_POSTED}, \
-                f'Unsupported opcode: {opcode}'
-
-            # send a write reponse if this was an ordinary write (non-posted)
-            if opcode == UmiCmd.UMI_REQ_WRITE:
-                # change the command to a write response
-                cmd = (p.cmd & 0xffffffe0) | int(UmiCmd.UMI_RESP_WRITE)
-
-                # flip the source address and destination address
-                resp = PyUmiPacket(cmd, p.srcaddr, p.dstaddr)
-
-                # send the response
-                mon.send(resp)
-
-            # 0xCCCC is the chipid for the Python monitor
-            # 0x00_C000_0000 is the write address for the UART device
-            # Please refer to ebrick_memory_map.vh(or .h) in the config directory
-            if p.dstaddr == ((0x00 << 56) + (0xCCCC << 40) + 0x00C0000000):
-                # print the character received
-                c = chr(p.data[0])
-                print(c, end='', flush=True)
-            # 0xCCCC is the chipid for the Python monitor
-            # 0x00_D000_0000 is the EXIT ADDRESS
-            # Please refer to ebrick_memory_map.vh(or .h) in the config directory
-            elif p.dstaddr == ((0x00 << 56) + (0xCCCC << 40) + 0x00D0000000):
-                # exit the simulation
-                exit_code = int(p.data.view(np.uint32)[0])
-                sys.exit(exit_code)
-            else:
-                raise ValueError(f'Unsupported address: 0x{p.dstaddr:08x}')
+    # Only the UART and exit addresses are handled in Python; main memory is
+    # implemented by umi_mem_agent in the RTL.  See test_prv32.py for details
+    # on the router and the batched service.
+    # UART output is buffered according to "uart_flush" (see test_prv32.py)
+    uart = UartDevice(sink=UartSink(policy=uart_flush, capture=uart_log is not None))
+
+    router = UmiRouter()
+    router.register_address(router.memory_map.uart_addr, uart, name='UART')
+    exit_device = ExitDevice()
+    router.register_address(router.memory_map.exit_addr, exit_device, name='EXIT')
+
+    # optionally record every request and response into a binary trace,
+    # which can be replayed later without the RTL simulation (see umi_trace.py)
+    recorder = None
+    if record is not None:
+        recorder = UmiTraceRecorder(record)
+        mon = recorder.wrap(mon)
+
+    # request counts, latencies and simulation speed (see test_prv32.py)
+    stats = None
+    if telemetry or (telemetry_json is not None):
+        stats = Telemetry()
+        stats.start(cycles=read_cycle_count(gpio))
+
+    service = UmiBatchService(mon, router, telemetry=stats)
+
+    # the dispatcher polls the monitor, waiting according to the "wait"
+    # strategy when there is nothing to do (see test_prv32.py)
+    dispatcher = Dispatcher(service.service, wait=wait)
+
+    try:
+        # run until the program writes its exit code
+        dispatcher.run(until=lambda: exit_device.done)
+    finally:
+        uart.flush()
+        print(f'*** {dispatcher.report()} ***')
+        if recorder is not None:
+            recorder.close()
+        if stats is not None:
+            stats.stop(cycles=read_cycle_count(gpio), dispatcher=dispatcher)
+            if telemetry:
+                print(stats.report())
+            if telemetry_json is not None:
+                stats.save(telemetry_json)
+        if uart_log is not None:
+            Path(uart_log).write_text(uart.getvalue())
+
+    # exit the simulation
+    sys.exit(exit_device.exit_code)
 
 
 if __name__ == '__main__':
@@ -130,10 +171,46 @@ if __name__ == '__main__':
 
     parser = ArgumentParser()
     parser.add_argument('--fast', action='store_true',
-        help="don't build the simulator if one is found")
+        help="don't rebuild the simulator if its sources are unchanged")
     parser.add_argument('--trace', action='store_true',
         help="dump waveforms during simulation")
+    parser.add_argument('--wait', default='spin', choices=list(WAIT_STRATEGIES.keys()),
+        help="what the host does while waiting for UMI requests")
+    parser.add_argument('--program', default='hello.c',
+        help="C source file in testbench/program to run")
+    parser.add_argument('--bindir',
+        help="directory for the program binary (default: testbench/program)")
+    parser.add_argument('--builddir',
+        help="directory for simulator builds (default: ./build)")
+    parser.add_argument('--record',
+        help="record the monitor's UMI transactions into this trace file")
+    parser.add_argument('--preload', default='posted', choices=PRELOAD_MODES,
+        help="load the program with posted writes, or with acknowledged writes")
+    parser.add_argument('--verify', action='store_true',
+        help="read the program back after loading it")
+    parser.add_argument('--telemetry', action='store_true',
+        help="print request counts, latencies and simulation speed at exit")
+    parser.add_argument('--telemetry-json',
+        help="write the telemetry to this JSON file")
+    parser.add_argument('--uart-flush', default='line', choices=FLUSH_POLICIES,
+        help="when the program's UART output is written to stdout")
+    parser.add_argument('--uart-log',
+        help="write the program's UART output to this file")
 
     args = parser.parse_args()
 
-    run_test(trace=args.trace, fast=args.fast)
+    run_test(
+        trace=args.trace,
+        fast=args.fast,
+        wait=args.wait,
+        program=args.program,
+        bindir=args.bindir,
+        builddir=args.builddir,
+        record=args.record,
+        telemetry=args.telemetry,
+        telemetry_json=args.telemetry_json,
+        uart_flush=args.uart_flush,
+        uart_log=args.uart_log,
+        preload_mode=args.preload,
+        verify=args.verify
+    )
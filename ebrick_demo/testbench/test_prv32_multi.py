@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+
+# Example showing how to simulate several EBRICKs at once, with the Python
+# memory and monitor service for the bricks spread over worker processes.
+
+# We suggest that you read through the test_prv32.py script first
+# before diving into this example.
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import os
+import queue
+import sys
+import time
+import multiprocessing
+
+from pathlib import Path
+
+from siliconcompiler.package import path as sc_path
+from switchboard import SbDut, UmiTxRx
+
+import ebrick_demo.ebrick as ebrick
+from ebrick_demo.testbench.program.riscv import build_riscv_binary
+from ebrick_demo.testbench.sim_build import build_simulator
+from ebrick_demo.testbench.elf import load_elf
+from ebrick_demo.testbench.umi_ram import UmiRam
+from ebrick_demo.testbench.umi_service import UmiBatchService
+from ebrick_demo.testbench.umi_router import UmiRouter
+from ebrick_demo.testbench.umi_devices import UartDevice, ExitDevice
+from ebrick_demo.testbench.dispatcher import Dispatcher, WAIT_STRATEGIES
+from ebrick_demo.testbench.telemetry import Telemetry, read_cycle_count
+
+# size of the processor memory of each brick in bytes
+MEMORY_SIZE = 32768
+
+# the trap outputs of the bricks are read through 32 GPIO inputs
+MAX_BRICKS = 32
+
+
+def brick_queues(brick):
+    '''Returns the names of the (monitor to core, core to monitor) queues for a brick.'''
+
+    return f'mtr2core_{brick}.q', f'core2mtr_{brick}.q'
+
+
+def serve_bricks(worker, bricks, wait, messages):
+    '''
+    Services the monitor queues of several bricks in one process.  "bricks" is
+    a list of (brick number, program binary) pairs.  Each brick has its own
+    memory, UART and exit device.  A "ready" message is sent once the programs
+    are loaded, and a "done" message with the results once every brick has
+    written its exit code.
+    '''
+
+    telemetry = Telemetry()
+
+    services = []
+    exit_devices = []
+    uarts = []
+
+    for brick, program_file in bricks:
+        # the queues were created by the main process before the simulation started
+        mon = UmiTxRx(*brick_queues(brick), fresh=False)
+
+        main_memory = UmiRam(MEMORY_SIZE)
+        load_elf(main_memory, program_file.with_suffix('.elf'))
+
+        uart = UartDevice(echo=False, capture=True)
+        exit_device = ExitDevice()
+
+        router = UmiRouter()
+        router.register_region('MEM', main_memory, size=MEMORY_SIZE)
+        router.register_address(router.memory_map.uart_addr, uart, name='UART')
+        router.register_address(router.memory_map.exit_addr, exit_device, name='EXIT')
+
+        services.append(UmiBatchService(mon, router, telemetry=telemetry))
+        exit_devices.append(exit_device)
+        uarts.append(uart)
+
+    messages.put(('ready', worker, None))
+
+    def poll():
+        # bricks that have exited keep fetching their final instruction, which
+        # is never answered, so only the running bricks are serviced
+        return sum(service.service() for service, exit_device in zip(services, exit_devices)
+                   if not exit_device.done)
+
+    telemetry.start()
+    dispatcher = Dispatcher(poll, wait=wait)
+    dispatcher.run(until=lambda: all(exit_device.done for exit_device in exit_devices))
+    telemetry.stop(dispatcher=dispatcher)
+
+    results = [(brick, exit_device.exit_code, uart.getvalue())
+               for (brick, _), exit_device, uart in zip(bricks, exit_devices, uarts)]
+
+    messages.put(('done', worker, (results, telemetry.to_dict(), dispatcher.report())))
+
+
+def run_test(bricks=4, workers=None, trace=False, fast=False, wait='spin',
+             programs=None, bindir=None, builddir=None, trace_file=None):
+    if not (1 <= bricks <= MAX_BRICKS):
+        raise ValueError(f'Number of bricks must be between 1 and {MAX_BRICKS}')
+
+    if workers is None:
+        workers = min(bricks, os.cpu_count())
+    workers = max(1, min(workers, bricks))
+
+    if not programs:
+        programs = ['hello.c']
+
+    # build the simulation
+    print(f'*** Building the RTL simulation with {bricks} bricks ***')
+
+    dut = SbDut('testbench', tool='verilator', trace=trace, default_main=True)
+
+    ebrick.setup(dut, testbench=True)
+
+    # builds go to "builddir" if one is given (the default is ./build), while
+    # the program binaries go to "bindir" (the default is testbench/program)
+    if builddir is not None:
+        dut.set('option', 'builddir', str(Path(builddir).resolve()))
+
+    if bindir is None:
+        bindir = Path(sc_path(dut, 'ebrick_demo')) / 'testbench' / 'program'
+
+    dut.add('option', 'idir', 'testbench', package='ebrick_demo')
+    dut.add('option', 'define', f'NBRICKS={bricks}')
+    dut.input('testbench/testbench_multi.sv', package='ebrick_demo')
+
+    # the number of bricks is part of the simulator fingerprint, so simulators
+    # for different numbers of bricks are kept side by side
+    build_simulator(dut, fast=fast, trace=trace)
+
+    # build the program binaries; brick i runs programs[i % len(programs)]
+    print('*** Building RISC-V program binaries ***')
+
+    program_files = {}
+    for program in programs:
+        program_files[program] = Path(bindir).resolve() / Path(program).with_suffix('.bin').name
+
+        build_riscv_binary(
+            files=[f'program/{program}', 'program/init.S'],
+            linkcfg='program/link.ld',
+            incdirs=['.', '../config'],
+            output=program_files[program],
+            cwd=Path(sc_path(dut, 'ebrick_demo')) / 'testbench'
+        )
+
+    # create queues for every brick, plus GPIO
+    print('*** Creating switchboard queues ***')
+
+    # the queues persist after these objects go away; the worker processes
+    # open the monitor queues for their bricks themselves
+    for brick in range(bricks):
+        UmiTxRx(*brick_queues(brick), fresh=True)
+    gpioq = UmiTxRx('host2gpio_0.q', 'gpio2host_0.q', fresh=True)
+
+    # launch the simulation
+    print('*** Launching RTL simulation ***')
+
+    # with "trace", the waveforms go to "trace_file" (default: testbench.vcd)
+    plusargs = []
+    if trace and (trace_file is not None):
+        plusargs.append(('dumpfile', trace_file))
+
+    process = dut.simulate(plusargs=plusargs)
+
+    # put the bricks into reset, and then take them out of reset (see test_prv32.py)
+    gpio = gpioq.gpio(iwidth=128, owidth=32, init=0, max_bytes=4)
+    gpio.o[0] = 1  # de-assert nreset
+
+    # Start the worker processes.  Bricks are dealt out to workers round-robin;
+    # each worker loads the programs of its bricks into their memories, reports
+    # that it is ready, and then services its bricks' monitor queues until they
+    # have all written their exit codes.
+    print(f'*** Starting {workers} worker processes ***')
+
+    messages = multiprocessing.Queue()
+    procs = []
+
+    for worker in range(workers):
+        shard = [(brick, program_files[programs[brick % len(programs)]])
+                 for brick in range(worker, bricks, workers)]
+        proc = multiprocessing.Process(target=serve_bricks, args=(worker, shard, wait, messages))
+        proc.start()
+        procs.append(proc)
+
+    ready = 0
+    while ready < workers:
+        try:
+            kind, worker, _ = messages.get(timeout=1)
+        except queue.Empty:
+            # a worker that fails while loading its programs never reports
+            for proc in procs:
+                if not proc.is_alive():
+                    for other in procs:
+                        other.terminate()
+                    process.terminate()
+                    raise RuntimeError(f'Worker process {proc.name} exited with code '
+                                       f'{proc.exitcode} before it was ready')
+            continue
+
+        assert kind == 'ready', f'Unexpected message from worker {worker}: {kind}'
+        ready += 1
+
+    # assert go for all bricks at once
+    print('*** Assert ebrick "go" ***')
+
+    start = time.perf_counter()
+    start_cycles = read_cycle_count(gpio)
+
+    gpio.o[1] = 1  # assert go
+
+    print('*** Monitoring ebrick output ***')
+
+    results = {}
+    telemetry = []
+    trapped = 0
+    failed = False
+
+    try:
+        while len(telemetry) < workers:
+            try:
+                kind, worker, (shard_results, shard_telemetry, report) = messages.get(timeout=1)
+            except queue.Empty:
+                # a brick that traps never writes its exit code
+                trapped = gpio.i[bricks - 1:0]
+                if trapped:
+                    print(f'*** Bricks trapped: {trapped:#x} ***')
+                    break
+
+                failed = any(proc.exitcode not in [None, 0] for proc in procs)
+                if failed:
+                    print('*** A worker process failed ***')
+                    break
+
+                continue
+
+            for brick, exit_code, output in shard_results:
+                results[brick] = (exit_code, output)
+            telemetry.append(shard_telemetry)
+            print(f'*** worker {worker}: {report} ***')
+    finally:
+        for proc in procs:
+            if trapped or failed:
+                proc.terminate()
+            proc.join()
+
+    elapsed = time.perf_counter() - start
+    cycles = read_cycle_count(gpio) - start_cycles
+
+    process.terminate()
+
+    for brick in sorted(results):
+        exit_code, output = results[brick]
+        print(f'*** brick {brick}: exit code {exit_code} ***')
+        print(output, end='')
+
+    packets = sum(t['packets'] for t in telemetry)
+    print(f'*** {bricks} bricks, {workers} workers: {packets} requests in {elapsed:.3f}s '
+          f'({packets / elapsed:.0f} requests/s), {cycles / elapsed:.0f} cycles/s ***')
+
+    passed = (not trapped) and (not failed) and (len(results) == bricks) and \
+        all(exit_code == 0 for exit_code, _ in results.values())
+
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser()
+    parser.add_argument('--bricks', type=int, default=4,
+        help=f"number of EBRICKs to simulate (up to {MAX_BRICKS})")
+    parser.add_argument('--workers', type=int, default=None,
+        help="number of worker processes servicing the bricks (default: one per core)")
+    parser.add_argument('--fast', action='store_true',
+        help="don't rebuild the simulator if its sources are unchanged")
+    parser.add_argument('--trace', action='store_true',
+        help="dump waveforms during simulation")
+    parser.add_argument('--trace-file',
+        help="file to dump the waveforms to (default: testbench.vcd)")
+    parser.add_argument('--wait', default='spin', choices=list(WAIT_STRATEGIES.keys()),
+        help="what the workers do while waiting for UMI requests")
+    parser.add_argument('--program', action='append',
+        help="C source file in testbench/program to run; may be repeated, in which "
+        "case the programs are assigned to the bricks in turn (default: hello.c)")
+    parser.add_argument('--bindir',
+        help="directory for the program binaries (default: testbench/program)")
+    parser.add_argument('--builddir',
+        help="directory for simulator builds (default: ./build)")
+
+    args = parser.parse_args()
+
+    run_test(
+        bricks=args.bricks,
+        workers=args.workers,
+        trace=args.trace,
+        fast=args.fast,
+        wait=args.wait,
+        programs=args.program,
+        bindir=args.bindir,
+        builddir=args.builddir,
+        trace_file=args.trace_file
+    )
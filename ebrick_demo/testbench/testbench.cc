@@ -0,0 +1,209 @@
+// Copyright (c) 2024 Zero ASIC Corporation
+// This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+// Verilator main() for testbench.sv with waveform dumps that can be turned
+// on and off while the simulation runs.  It is switchboard's default main()
+// (switchboard/verilator/testbench.cc), plus a trace file that this file
+// owns: Verilator ignores the level and scope arguments of $dumpvars and
+// does not implement $dumpon/$dumpoff, so testbench.sv (built with
+// EBRICK_TRACE_MAIN defined) instead calls ebrick_trace_enable() to say when
+// the dump should be written.  The part of the design in the dump is fixed
+// when the simulator is built (see trace_control.py).
+
+// For Ctrl-C handling
+#include <signal.h>
+
+// For std::unique_ptr
+#include <memory>
+
+// For changing the clock period
+#include <cmath>
+#include <iostream>
+#include <sstream>
+#include <string>
+
+// Include common routines
+#include <verilated.h>
+
+#if VM_TRACE_FST
+#include <verilated_fst_c.h>
+#elif VM_TRACE
+#include <verilated_vcd_c.h>
+#endif
+
+// Include model header, generated from Verilating "top.v"
+#include "Vtestbench.h"
+#include "Vtestbench__Dpi.h"
+
+// Include switchboard functions
+#include "switchboard.hpp"
+
+#if VM_TRACE_FST
+typedef VerilatedFstC TraceFile;
+static const char* default_dumpfile = "testbench.fst";
+#elif VM_TRACE
+typedef VerilatedVcdC TraceFile;
+static const char* default_dumpfile = "testbench.vcd";
+#endif
+
+// Legacy function required only so linking works on Cygwin and MSVC++
+double sc_time_stamp() {
+    return 0;
+}
+
+// ref: https://stackoverflow.com/a/4217052
+static volatile int got_sigint = 0;
+
+void sigint_handler(int unused) {
+    got_sigint = 1;
+}
+
+// whether the dump is currently being written, set from testbench.sv
+static bool trace_enabled = true;
+
+void ebrick_trace_enable(int on) {
+    trace_enabled = (on != 0);
+}
+
+std::string extract_plusarg_value(const char* match, const char* name) {
+    if (match) {
+        std::string full = std::string(match);
+        std::string prefix = "+" + std::string(name) + "=";
+        size_t len = prefix.size();
+        // match requirements: there must be at least one character after
+        // the prefix, and the argument must start with the prefix,
+        // ignoring the last character of the prefix, which can be
+        // anything (typically "=" or "+")
+        if ((full.size() >= (len + 1)) && (full.substr(0, len - 1) == prefix.substr(0, len - 1))) {
+            return std::string(match).substr(len);
+        }
+    }
+
+    // if we get here, return an empty string
+    return "";
+}
+
+template <typename T> void parse_plusarg(const char* match, const char* name, T& result) {
+    std::string value = extract_plusarg_value(match, name);
+
+    if (value != "") {
+        std::istringstream iss(value);
+        iss >> result;
+    }
+}
+
+int main(int argc, char** argv, char** env) {
+    // Prevent unused variable warnings
+    if (false && argc && argv && env) {}
+
+    // Using unique_ptr is similar to
+    // "VerilatedContext* contextp = new VerilatedContext" then deleting at end.
+    const std::unique_ptr<VerilatedContext> contextp{new VerilatedContext};
+    // Do not instead make Vtop as a file-scope static variable, as the
+    // "C++ static initialization order fiasco" may cause a crash
+
+    // Verilator must compute traced signals
+    contextp->traceEverOn(true);
+
+    // Pass arguments so Verilated code can see them, e.g. $value$plusargs
+    // This needs to be called before you create any model
+    contextp->commandArgs(argc, argv);
+
+    // Construct the Verilated model, from Vtop.h generated from Verilating "top.v".
+    // Using unique_ptr is similar to "Vtop* top = new Vtop" then deleting at end.
+    // "TOP" will be the hierarchical name of the module.
+    const std::unique_ptr<Vtestbench> top{new Vtestbench{contextp.get(), "TOP"}};
+
+    // open the dump file if +trace is given; +dumpfile=<name> overrides
+    // the default name
+#if VM_TRACE
+    std::unique_ptr<TraceFile> tfp;
+    bool trace = false;
+    for (int i = 1; i < argc; i++) {
+        if (std::string(argv[i]) == "+trace") {
+            trace = true;
+        }
+    }
+
+    if (trace) {
+        std::string dumpfile = default_dumpfile;
+        const char* dumpfile_match = contextp->commandArgsPlusMatch("dumpfile");
+        parse_plusarg<std::string>(dumpfile_match, "dumpfile", dumpfile);
+
+        tfp.reset(new TraceFile);
+        top->trace(tfp.get(), 99);
+        tfp->open(dumpfile.c_str());
+    }
+#endif
+
+    // parse the clock period, if provided
+    double period = 10e-9;
+    const char* period_match = contextp->commandArgsPlusMatch("period");
+    parse_plusarg<double>(period_match, "period", period);
+
+    // parse the maximum simulation rate, if provided.  convert it to a target
+    // period in microseconds
+
+    double max_rate = -1;
+    const char* rate_match = contextp->commandArgsPlusMatch("max-rate");
+    parse_plusarg<double>(rate_match, "max-rate", max_rate);
+
+    // convert the clock period an integer, scaling by the time precision
+    uint64_t iperiod = std::round(period * std::pow(10.0, -1.0 * contextp->timeprecision()));
+    uint64_t duration0 = iperiod / 2;
+    uint64_t duration1 = iperiod - duration0;
+
+    // Set Vtestbench's input signals
+    top->clk = 0;
+    top->eval();
+
+    // Set up Ctrl-C handler
+    signal(SIGINT, sigint_handler);
+
+    // Optional delay before setting up main loop
+
+    double start_delay_value = -1;
+    const char* delay_match = contextp->commandArgsPlusMatch("start-delay");
+    parse_plusarg<double>(delay_match, "start-delay", start_delay_value);
+
+    start_delay(start_delay_value);
+
+    // Main loop
+
+    long t_us = -1;
+    long min_period_us = (1.0e6 / max_rate) + 0.5;
+
+    while (!(contextp->gotFinish() || got_sigint)) {
+        max_rate_tick(t_us, min_period_us);
+
+        contextp->timeInc(duration0);
+        top->clk = 1;
+        top->eval();
+#if VM_TRACE
+        if (tfp && trace_enabled) {
+            tfp->dump(contextp->time());
+        }
+#endif
+        contextp->timeInc(duration1);
+        top->clk = 0;
+        top->eval();
+#if VM_TRACE
+        if (tfp && trace_enabled) {
+            tfp->dump(contextp->time());
+        }
+#endif
+    }
+
+    // Final model cleanup
+    top->final();
+
+#if VM_TRACE
+    if (tfp) {
+        tfp->close();
+    }
+#endif
+
+    // Return good completion status
+    // Don't use exit() or destructor won't get called
+    return 0;
+}
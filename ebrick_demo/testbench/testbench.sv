@@ -58,6 +58,8 @@ module testbench (
 
     wire            nreset;
     wire            go;
+    wire            trace_start_host;
+    wire            trace_stop_host;
     wire [IDW-1:0]  chipid;
     wire [RW-1:0]   status;
 
@@ -221,6 +223,15 @@ module testbench (
         gpio_nreset <= 1'b1;
     end
 
+    // count of simulated clock cycles, which the Python host reads through
+    // GPIO inputs 127:64 to measure the simulation speed
+
+    reg [63:0] cycle_count = 64'd0;
+
+    always @(posedge clk) begin
+        cycle_count <= cycle_count + 64'd1;
+    end
+
     // umi_gpio instantiation
 
     `UMI_WIRES(gpio_in, DW, CW, AW);
@@ -230,15 +241,15 @@ module testbench (
         .DW     (DW),
         .AW     (AW),
         .CW     (CW),
-        .IWIDTH (32),
+        .IWIDTH (128),
         .OWIDTH (32)
     ) umi_gpio_ (
         .clk                (clk),
         .nreset             (gpio_nreset),
 
-        .gpio_in            (status),
+        .gpio_in            ({cycle_count, 32'd0, status}),
         /* verilator lint_off WIDTHEXPAND */
-        .gpio_out           ({go, nreset}),
+        .gpio_out           ({trace_stop_host, trace_start_host, go, nreset}),
         /* verilator lint_on WIDTHEXPAND */
 
         `UMI_CONNECT        (udev_req, gpio_in),
@@ -311,11 +322,105 @@ module testbench (
     end
 
     // Waveform probing
+    //
+    // +trace dumps waveforms to +dumpfile=<name> (default: testbench.vcd),
+    // which is compressed if the simulator was built for FST tracing.
+    // +trace_scope=<n> limits the dump to the testbench (0), ebrick_core (1)
+    // or the PicoRV32 (2), and +trace_depth=<n> to n levels below it (0 for
+    // all levels).
+    //
+    // The dump covers the whole run, unless +trace_triggered is given: then
+    // it starts turned off, and is turned on once the cycle count reaches
+    // +trace_start=<n> or the host sets GPIO output 2.  It is turned off
+    // for good once the cycle count reaches +trace_stop=<n> or the host sets
+    // GPIO output 3 (see trace_control.py).
+    //
+    // Verilator ignores the level and scope arguments of $dumpvars and does
+    // not implement $dumpon/$dumpoff.  When EBRICK_TRACE_MAIN is defined, the
+    // dump file is instead opened by testbench.cc, which writes it while
+    // ebrick_trace_enable() has turned it on, and the scope and depth are set
+    // when the simulator is built rather than with plusargs.
+
+`ifdef EBRICK_TRACE_MAIN
+    import "DPI-C" function void ebrick_trace_enable(input int on);
+`endif
+
+    reg         tracing = 1'b0;
+    reg         trace_on = 1'b0;
+    reg         trace_done = 1'b0;
+    reg [63:0]  trace_start = {64{1'b1}};
+    reg [63:0]  trace_stop = {64{1'b1}};
+
+    task set_trace(input on);
+`ifdef EBRICK_TRACE_MAIN
+        ebrick_trace_enable({31'd0, on});
+`else
+        if (on) begin
+            $dumpon;
+        end else begin
+            $dumpoff;
+        end
+`endif
+    endtask
 
     initial begin
+        /* verilator lint_off IGNOREDRETURN */
+
+`ifndef EBRICK_TRACE_MAIN
+        integer trace_scope, trace_depth;
+        reg [8*256-1:0] dumpfile;
+`endif
+
         if ($test$plusargs("trace")) begin
-            $dumpfile("testbench.vcd");
-            $dumpvars(0, testbench);
+`ifndef EBRICK_TRACE_MAIN
+            if (!$value$plusargs("dumpfile=%s", dumpfile)) begin
+                dumpfile = "testbench.vcd";
+            end
+
+            if (!$value$plusargs("trace_scope=%d", trace_scope)) begin
+                trace_scope = 0;
+            end
+
+            if (!$value$plusargs("trace_depth=%d", trace_depth)) begin
+                trace_depth = 0;
+            end
+
+            $dumpfile(dumpfile);
+
+            case (trace_scope)
+                1: $dumpvars(trace_depth, ebrick_core_);
+                2: $dumpvars(trace_depth, ebrick_core_.picorv32_axi_);
+                default: $dumpvars(trace_depth, testbench);
+            endcase
+`endif
+
+            tracing = 1'b1;
+            trace_on = 1'b1;
+
+            if ($test$plusargs("trace_triggered")) begin
+                set_trace(1'b0);
+                trace_on = 1'b0;
+            end
+
+            $value$plusargs("trace_start=%d", trace_start);
+            $value$plusargs("trace_stop=%d", trace_stop);
+        end
+
+        /* verilator lint_on IGNOREDRETURN */
+    end
+
+    always @(posedge clk) begin
+        if (tracing && !trace_done) begin
+            if ((cycle_count >= trace_stop) || trace_stop_host) begin
+                if (trace_on) begin
+                    set_trace(1'b0);
+                end
+                trace_on <= 1'b0;
+                trace_done <= 1'b1;
+            end else if (!trace_on && ((cycle_count >= trace_start) || trace_start_host)) begin
+                set_trace(1'b1);
+                trace_on <= 1'b1;
+            end
         end
     end
 
@@ -0,0 +1,334 @@
+// Instantiates NBRICKS copies of ebrick_core, each with its own chipid and
+// its own pair of switchboard queues to a Python monitor, so that several
+// EBRICKs can be simulated together.  All bricks share one umi_gpio
+// instance for nreset and go.
+
+// Copyright (c) 2024 Zero ASIC Corporation
+// This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+`default_nettype none
+
+`include "ebrick_memory_map.vh"
+`include "umi_macros.vh"
+
+// number of bricks, which may be overridden with a define
+`ifndef NBRICKS
+    `define NBRICKS 4
+`endif
+
+module testbench (
+    `ifdef VERILATOR
+        input clk
+    `endif
+);
+    ///////////////////////
+    // EBRICK parameters //
+    ///////////////////////
+
+    localparam NBRICKS  = `NBRICKS;
+    localparam W        = 2;
+    localparam H        = 2;
+    localparam RW       = 32;
+    localparam DW       = 32;
+    localparam AW       = 64;
+    localparam CW       = 32;
+    localparam IDW      = 16;
+    localparam NPT      = 2;
+    localparam NAIO     = 2;
+    localparam NGPIO    = 16;
+    localparam W2       = W/2;
+    localparam H2       = H/2;
+
+    //////////////////////
+    // clock generation //
+    //////////////////////
+
+    `ifndef VERILATOR
+        localparam PERIOD_CLK = 10;
+
+        reg clk = 1'b0;
+
+        always begin
+            #(PERIOD_CLK/2) clk = ~clk;
+        end
+    `endif
+
+    wire                nreset;
+    wire                go;
+    wire [NBRICKS-1:0]  trap;
+
+    ////////////////////////////////////////////
+    // ebrick_core instances and their queues //
+    ////////////////////////////////////////////
+
+    // brick i uses chipid CORE_CHIPID+i and the queues core2mtr_<i>.q and
+    // mtr2core_<i>.q; the queue names must match those in test_prv32_multi.py
+
+    genvar i;
+
+    for (i=0; i<NBRICKS; i=i+1) begin: brick
+
+        wire [IDW-1:0]  chipid;
+        wire [RW-1:0]   status;
+
+        `UMI_WIRES(core2mtr_req, DW, CW, AW);
+        `UMI_WIRES(mtr2core_resp, DW, CW, AW);
+
+        assign chipid = IDW'(`CORE_CHIPID + i);
+        assign trap[i] = status[0];
+
+        ebrick_core #(
+            .W      (W),
+            .H      (H),
+            .NPT    (NPT),
+            .NAIO   (NAIO),
+            .NGPIO  (NGPIO),
+            .RW     (RW),
+            .DW     (DW),
+            .IDW    (IDW),
+            .AW     (AW),
+            .CW     (CW)
+        ) ebrick_core_ (
+            .clk                (clk),
+            .auxclk             (4'b0),
+            .nreset             (nreset),
+            .go                 (go),
+            .testmode           (1'b0),
+            .chipletmode        (2'b00),
+            .chipdir            (2'b00),
+            .chipid             ({{IDW*(W*H-1){1'b0}}, chipid}),
+            .irq_in             (64'b0),
+            .irq_out            (),
+
+            .jtag_tck           (1'b0),
+            .jtag_tms           (1'b0),
+            .jtag_tdi           (1'b0),
+            .jtag_tdo           (),
+            .jtag_tdo_oe        (),
+
+            .ctrl               ({RW{1'b0}}),
+            .status             (status),
+            .initdone           (),
+            .test_scanmode      (1'b0),
+            .test_scanenable    (1'b0),
+            .test_scanin        (1'b0),
+            .test_scanout       (),
+
+            /* verilator lint_off WIDTHEXPAND */
+
+            .uhost_req_valid    (core2mtr_req_valid),
+            .uhost_req_cmd      (core2mtr_req_cmd),
+            .uhost_req_dstaddr  (core2mtr_req_dstaddr),
+            .uhost_req_srcaddr  (core2mtr_req_srcaddr),
+            .uhost_req_data     (core2mtr_req_data),
+            .uhost_req_ready    ({{(W*H-1){1'b0}}, core2mtr_req_ready}),
+
+            .uhost_resp_valid   ({{(W*H-1){1'b0}}, mtr2core_resp_valid}),
+            .uhost_resp_cmd     ({{CW*(W*H-1){1'b0}}, mtr2core_resp_cmd}),
+            .uhost_resp_dstaddr ({{AW*(W*H-1){1'b0}}, mtr2core_resp_dstaddr}),
+            .uhost_resp_srcaddr ({{AW*(W*H-1){1'b0}}, mtr2core_resp_srcaddr}),
+            .uhost_resp_data    ({{DW*(W*H-1){1'b0}}, mtr2core_resp_data}),
+            .uhost_resp_ready   (mtr2core_resp_ready),
+
+            /* verilator lint_on WIDTHEXPAND */
+
+            .udev_req_valid     ({W*H{1'b0}}),
+            .udev_req_cmd       ({CW*W*H{1'b0}}),
+            .udev_req_dstaddr   ({AW*W*H{1'b0}}),
+            .udev_req_srcaddr   ({AW*W*H{1'b0}}),
+            .udev_req_data      ({DW*W*H{1'b0}}),
+            .udev_req_ready     (),
+
+            .udev_resp_valid    (),
+            .udev_resp_cmd      (),
+            .udev_resp_dstaddr  (),
+            .udev_resp_srcaddr  (),
+            .udev_resp_data     (),
+            .udev_resp_ready    ({W*H{1'b0}}),
+
+            .no_txgpio          (),
+            .no_txgpiooe        (),
+            .no_rxgpio          ({W2*NGPIO{1'b0}}),
+
+            .ea_txgpio          (),
+            .ea_txgpiooe        (),
+            .ea_rxgpio          ({H2*NGPIO{1'b0}}),
+
+            .so_txgpio          (),
+            .so_txgpiooe        (),
+            .so_rxgpio          ({W2*NGPIO{1'b0}}),
+
+            .we_txgpio          (),
+            .we_txgpiooe        (),
+            .we_rxgpio          ({H2*NGPIO{1'b0}}),
+
+            .no_analog          (),
+            .ea_analog          (),
+            .so_analog          (),
+            .we_analog          (),
+            .pad_nptn           (),
+            .pad_eptn           (),
+            .pad_sptn           (),
+            .pad_wptn           (),
+            .pad_nptp           (),
+            .pad_eptp           (),
+            .pad_sptp           (),
+            .pad_wptp           (),
+
+            .csr_rf_ctrl        (8'b0),
+            .csr_sram_ctrl      (8'b0),
+
+            .vss                (),
+            .vdd                (),
+            .vddx               (),
+            .vcc                (),
+            .vdda               ()
+        );
+
+        // ebrick_core (PicoRV32) is the UMI host
+        // monitor (Python) is the UMI device
+
+        umi_to_queue_sim #(
+            .READY_MODE_DEFAULT(2),
+            .DW(DW)
+        ) core2mtr_i (
+            .clk            (clk),
+            `UMI_CONNECT_SB (core2mtr_req)
+        );
+
+        queue_to_umi_sim #(
+            .VALID_MODE_DEFAULT(2),
+            .DW(DW)
+        ) mtr2core_i (
+            .clk            (clk),
+            `UMI_CONNECT_SB (mtr2core_resp)
+        );
+
+        initial begin
+            /* verilator lint_off IGNOREDRETURN */
+
+            // get runtime options indicating the desired behavior of
+            // ready/valid handshaking (see testbench.sv)
+
+            integer valid_mode, ready_mode;
+
+            if (!$value$plusargs("valid_mode=%d", valid_mode)) begin
+               valid_mode = 2;  // default if not provided as a plusarg
+            end
+
+            if (!$value$plusargs("ready_mode=%d", ready_mode)) begin
+               ready_mode = 2;  // default if not provided as a plusarg
+            end
+
+            core2mtr_i.init($sformatf("core2mtr_%0d.q", i));
+            core2mtr_i.set_ready_mode(ready_mode);
+            mtr2core_i.init($sformatf("mtr2core_%0d.q", i));
+            mtr2core_i.set_valid_mode(valid_mode);
+        end
+    end
+
+    //////////////
+    // umi_gpio //
+    //////////////
+
+    reg gpio_nreset = 1'b0;
+
+    always @(posedge clk) begin
+        gpio_nreset <= 1'b1;
+    end
+
+    // count of simulated clock cycles (see testbench.sv)
+
+    reg [63:0] cycle_count = 64'd0;
+
+    always @(posedge clk) begin
+        cycle_count <= cycle_count + 64'd1;
+    end
+
+    `UMI_WIRES(gpio_in, DW, CW, AW);
+    `UMI_WIRES(gpio_out, DW, CW, AW);
+
+    // GPIO inputs 31:0 hold the trap output of each brick, and inputs 127:64
+    // hold the cycle count
+
+    umi_gpio #(
+        .DW     (DW),
+        .AW     (AW),
+        .CW     (CW),
+        .IWIDTH (128),
+        .OWIDTH (32)
+    ) umi_gpio_ (
+        .clk                (clk),
+        .nreset             (gpio_nreset),
+
+        /* verilator lint_off WIDTHEXPAND */
+        .gpio_in            ({cycle_count, 32'd0, 32'(trap)}),
+        .gpio_out           ({go, nreset}),
+        /* verilator lint_on WIDTHEXPAND */
+
+        `UMI_CONNECT        (udev_req, gpio_in),
+        `UMI_CONNECT        (udev_resp, gpio_out)
+    );
+
+    queue_to_umi_sim #(
+        .VALID_MODE_DEFAULT(2),
+        .DW(DW)
+    ) host2gpio_i (
+        .clk            (clk),
+        `UMI_CONNECT_SB (gpio_in)
+    );
+
+    umi_to_queue_sim #(
+        .READY_MODE_DEFAULT(2),
+        .DW(DW)
+    ) gpio2host_i (
+        .clk            (clk),
+        `UMI_CONNECT_SB (gpio_out)
+    );
+
+    initial begin
+        /* verilator lint_off IGNOREDRETURN */
+
+        // get runtime options indicating the desired behavior of
+        // ready/valid handshaking (see testbench.sv)
+
+        integer valid_mode, ready_mode;
+
+        if (!$value$plusargs("valid_mode=%d", valid_mode)) begin
+           valid_mode = 2;  // default if not provided as a plusarg
+        end
+
+        if (!$value$plusargs("ready_mode=%d", ready_mode)) begin
+           ready_mode = 2;  // default if not provided as a plusarg
+        end
+
+        host2gpio_i.init("host2gpio_0.q");
+        host2gpio_i.set_valid_mode(valid_mode);
+        gpio2host_i.init("gpio2host_0.q");
+        gpio2host_i.set_ready_mode(ready_mode);
+    end
+
+    // Waveform probing
+    //
+    // +trace dumps waveforms to +dumpfile=<name> (default: testbench.vcd)
+
+    initial begin
+        /* verilator lint_off IGNOREDRETURN */
+
+        reg [8*256-1:0] dumpfile;
+
+        if ($test$plusargs("trace")) begin
+            if (!$value$plusargs("dumpfile=%s", dumpfile)) begin
+                dumpfile = "testbench.vcd";
+            end
+
+            $dumpfile(dumpfile);
+            $dumpvars(0, testbench);
+        end
+
+        /* verilator lint_on IGNOREDRETURN */
+    end
+
+endmodule
+
+`default_nettype wire
@@ -47,6 +47,15 @@ module testbench (
         go_nreset <= 1'b1;
     end
 
+    // count of simulated clock cycles, which the Python host reads through
+    // GPIO inputs 127:64 to measure the simulation speed
+
+    reg [63:0] cycle_count = 64'd0;
+
+    always @(posedge clk) begin
+        cycle_count <= cycle_count + 64'd1;
+    end
+
     `UMI_WIRES(gpio_in, DW, CW, AW);
     `UMI_WIRES(gpio_out, DW, CW, AW);
 
@@ -70,13 +79,13 @@ module testbench (
         .DW     (DW),
         .AW     (AW),
         .CW     (CW),
-        .IWIDTH (32),
+        .IWIDTH (128),
         .OWIDTH (32)
     ) umi_gpio_ (
         .clk                (clk),
         .nreset             (go_nreset),
 
-        .gpio_in            (status),
+        .gpio_in            ({cycle_count, 32'd0, status}),
         /* verilator lint_off WIDTHEXPAND */
         .gpio_out           ({go, nreset}),
         /* verilator lint_on WIDTHEXPAND */
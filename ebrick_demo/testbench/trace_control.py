@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+
+# Triggered waveform capture, controlled from the Python host
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+
+import time
+
+from collections import namedtuple
+
+import numpy as np
+
+from switchboard import UmiCmd, umi_opcode
+
+# parts of the hierarchy that testbench.sv can limit the dump to, and the
+# value of +trace_scope that selects each
+TRACE_SCOPES = {
+    'testbench': 0,
+    'ebrick_core': 1,
+    'picorv32': 2
+}
+
+# Verilator control files that limit the dump to each scope, and the level
+# of each scope in the hierarchy, counting the testbench as level 1 as
+# Verilator's --trace-depth does
+TRACE_SCOPE_CONFIGS = {
+    'testbench': None,
+    'ebrick_core': 'testbench/trace_ebrick_core.vlt',
+    'picorv32': 'testbench/trace_picorv32.vlt'
+}
+TRACE_SCOPE_LEVELS = {
+    'testbench': 1,
+    'ebrick_core': 2,
+    'picorv32': 3
+}
+
+TRACE_FORMATS = ['vcd', 'fst']
+
+# GPIO outputs of testbench.sv that start and stop the dump
+TRACE_START_BIT = 2
+TRACE_STOP_BIT = 3
+
+# how often status triggers read the GPIO inputs, in seconds
+STATUS_INTERVAL = 1e-3
+
+# A condition that starts or stops the dump:
+# * "cycle": the cycle counter in testbench.sv reaches "value"
+# * "addr": a request to address "value" arrives at the monitor, carrying
+#   "data" if it is not None (for example, a character written to the UART)
+# * "status": bit "value" of the EBRICK status (GPIO inputs 31:0) is set
+Trigger = namedtuple('Trigger', ['kind', 'value', 'data'])
+
+
+def parse_trigger(spec, memory_map):
+    '''
+    Returns the Trigger described by spec, which is one of:
+
+    * cycle=N: at simulated clock cycle N
+    * exit: on the program's write to EXIT_ADDR
+    * uart=C: when character C is written to UART_ADDR (C may also be a
+      character code, such as 0x0a)
+    * addr=A[:D]: on a request to address A, optionally carrying the value D
+    * status=N: when bit N of the EBRICK status is set (bit 0 is the PicoRV32
+      trap output)
+    '''
+
+    kind, _, value = spec.partition('=')
+
+    if kind == 'cycle':
+        return Trigger('cycle', int(value, 0), None)
+    elif kind == 'exit':
+        return Trigger('addr', memory_map.exit_addr, None)
+    elif kind == 'uart':
+        char = ord(value) if len(value) == 1 else int(value, 0)
+        return Trigger('addr', memory_map.uart_addr, char)
+    elif kind == 'addr':
+        addr, _, data = value.partition(':')
+        return Trigger('addr', int(addr, 0), int(data, 0) if data else None)
+    elif kind == 'status':
+        return Trigger('status', int(value, 0), None)
+
+    raise ValueError(f'Invalid trace trigger: {spec!r}')
+
+
+def setup_trace(dut, scope='testbench', depth=0):
+    '''
+    Sets up a Verilator build of testbench.sv whose waveform dump can be
+    started and stopped during the run, limited to "scope" and to "depth"
+    levels below it (0 for all levels).
+
+    Verilator ignores the scope and depth given to $dumpvars and does not
+    implement $dumpon/$dumpoff, so the simulator is built with testbench.cc
+    as its main(), which owns the dump file, and the scope and depth are
+    fixed at build time with a tracing_off/tracing_on control file and
+    --trace-depth.  The SbDut must be created with default_main=False.
+    '''
+
+    if scope not in TRACE_SCOPES:
+        raise ValueError(f'Unknown trace scope: {scope}')
+    if depth < 0:
+        raise ValueError(f'Trace depth must not be negative, got {depth}')
+
+    dut.input('testbench/testbench.cc', package='ebrick_demo')
+    dut.add('option', 'define', 'EBRICK_TRACE_MAIN')
+
+    config = TRACE_SCOPE_CONFIGS[scope]
+    if config is not None:
+        dut.add('tool', 'verilator', 'task', 'compile', 'file', 'config', config,
+                package='ebrick_demo')
+
+    if depth > 0:
+        dut.add('tool', 'verilator', 'task', 'compile', 'option',
+                ['--trace-depth', str(TRACE_SCOPE_LEVELS[scope] + depth - 1)])
+
+
+def trace_plusargs(fmt='vcd', scope='testbench', depth=0, start=None, stop=None):
+    '''
+    Returns the plusargs that set up the dump in testbench.sv: the file name
+    (testbench.vcd or testbench.fst), the hierarchy scope and depth, and the
+    cycle triggers.  With a start trigger, the dump begins turned off.  The
+    scope and depth plusargs are only used by simulators that honor the
+    arguments of $dumpvars; Verilator builds use setup_trace() instead.
+    '''
+
+    if scope not in TRACE_SCOPES:
+        raise ValueError(f'Unknown trace scope: {scope}')
+
+    plusargs = [('dumpfile', f'testbench.{fmt}'),
+                ('trace_scope', TRACE_SCOPES[scope]),
+                ('trace_depth', depth)]
+
+    if start is not None:
+        plusargs.append('trace_triggered')
+        if start.kind == 'cycle':
+            plusargs.append(('trace_start', start.value))
+
+    if (stop is not None) and (stop.kind == 'cycle'):
+        plusargs.append(('trace_stop', stop.value))
+
+    return plusargs
+
+
+class TraceControl:
+    """Starts and stops the waveform dump in testbench.sv on host-side events
+
+    With Verilator, the simulator must have been built with setup_trace(),
+    so that the dump can be turned on and off.
+
+    Cycle triggers are handled in testbench.sv itself (see trace_plusargs()),
+    so they are exact.  Address triggers are checked on each request passing
+    through the UmiTxRx stand-in returned by wrap(), and status triggers are
+    checked by poll(), which reads the GPIO inputs at most once every
+    "interval" seconds.  When one of these fires, the controller sets the
+    start or stop GPIO output, and testbench.sv turns the dump on or off a
+    few hundred cycles later, once the GPIO write has gone through.
+
+    The dump is started at most once and stopped at most once, so a window
+    opens on the first start trigger and closes on the first stop trigger
+    after it.
+    """
+
+    def __init__(self, gpio, start=None, stop=None, interval=STATUS_INTERVAL):
+        self.gpio = gpio
+        self.start = start
+        self.stop = stop
+        self.interval = interval
+
+        # without a start trigger, the dump is on from the beginning; a
+        # cycle start trigger is handled by testbench.sv
+        self.started = (start is None) or (start.kind == 'cycle')
+        self.stopped = False
+
+        self._last_poll = None
+
+    def wrap(self, umi):
+        '''Returns a UmiTxRx stand-in that checks address triggers on each request.'''
+
+        return TriggeredUmi(umi, self)
+
+    def check(self, p):
+        '''Checks the address triggers against the request p.'''
+
+        if (not self.started) and self._matches(self.start, p):
+            self.fire_start()
+        elif self.started and (not self.stopped) and self._matches(self.stop, p):
+            self.fire_stop()
+
+    def poll(self):
+        '''Checks the status triggers, reading the GPIO inputs at most once per interval.'''
+
+        pending = [t for t, done in ((self.start, self.started), (self.stop, self.stopped))
+                   if (t is not None) and (t.kind == 'status') and not done]
+        if not pending:
+            return
+
+        now = time.perf_counter()
+        if (self._last_poll is not None) and (now - self._last_poll < self.interval):
+            return
+        self._last_poll = now
+
+        status = self.gpio.i[31:0]
+        if (not self.started) and self._status(self.start, status):
+            self.fire_start()
+        if self.started and (not self.stopped) and self._status(self.stop, status):
+            self.fire_stop()
+
+    def fire_start(self):
+        '''Turns the dump on.'''
+
+        self.gpio.o[TRACE_START_BIT] = 1
+        self.started = True
+
+    def fire_stop(self):
+        '''Turns the dump off for the rest of the run.'''
+
+        self.gpio.o[TRACE_STOP_BIT] = 1
+        self.stopped = True
+
+    @staticmethod
+    def _matches(trigger, p):
+        if (trigger is None) or (trigger.kind != 'addr') or (p.dstaddr != trigger.value):
+            return False
+
+        if trigger.data is None:
+            return True
+
+        if umi_opcode(p.cmd) == UmiCmd.UMI_REQ_READ:
+            return False
+
+        return int(p.data.view(np.uint8)[0]) == trigger.data
+
+    @staticmethod
+    def _status(trigger, status):
+        return (trigger is not None) and (trigger.kind == 'status') and \
+            bool((status >> trigger.value) & 1)
+
+
+class TriggeredUmi:
+    """Forwards recv() and send() to a UmiTxRx, checking address triggers on requests"""
+
+    def __init__(self, umi, control):
+        self.umi = umi
+        self.control = control
+
+    def recv(self, blocking=True):
+        p = self.umi.recv(blocking=blocking)
+        if p is not None:
+            self.control.check(p)
+        return p
+
+    def send(self, p, *args, **kwargs):
+        return self.umi.send(p, *args, **kwargs)
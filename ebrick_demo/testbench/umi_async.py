@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+# asyncio front end for switchboard UMI queues
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+
+import asyncio
+import numpy as np
+
+from switchboard import PyUmiPacket, UmiCmd, umi_opcode, umi_pack
+from switchboard.bitvector import BitVector
+
+
+class AsyncBackoff:
+    """Waits between polls of a queue without blocking the event loop
+
+    The first "spins" waits only yield to other coroutines; after that, the
+    waits are sleeps that double in length up to max_sleep, so that an idle
+    queue costs little host time.  reset() is called whenever a poll finds
+    work to do.
+    """
+
+    def __init__(self, spins=100, min_sleep=1e-6, max_sleep=1e-3):
+        self.spins = spins
+        self.min_sleep = min_sleep
+        self.max_sleep = max_sleep
+
+        self.count = 0
+        self.sleep = min_sleep
+
+    def reset(self):
+        self.count = 0
+        self.sleep = self.min_sleep
+
+    async def idle(self):
+        if self.count < self.spins:
+            self.count += 1
+            await asyncio.sleep(0)
+        else:
+            await asyncio.sleep(self.sleep)
+            self.sleep = min(2 * self.sleep, self.max_sleep)
+
+
+class AsyncUmi:
+    """Awaitable send() and recv() over a UmiTxRx
+
+    Queues are polled without blocking, and the coroutine waits (letting other
+    coroutines run) while a queue is empty or full.  read() and write() are
+    awaitable versions of the UmiTxRx methods of the same names; requests from
+    different coroutines sharing one AsyncUmi are serialized, so that each one
+    receives its own responses.
+
+    "wait" is a class (such as AsyncBackoff) used to create the wait object
+    for each send() and recv().
+    """
+
+    def __init__(self, umi, srcaddr=0, max_bytes=32, wait=None):
+        self.umi = umi
+        self.srcaddr = srcaddr
+        self.max_bytes = max_bytes
+        self.wait = wait if wait is not None else AsyncBackoff
+
+        self.lock = asyncio.Lock()
+
+    async def recv(self):
+        '''Waits for and returns the next UMI packet.'''
+
+        wait = self.wait()
+
+        while True:
+            p = self.umi.recv(blocking=False)
+            if p is not None:
+                return p
+            await wait.idle()
+
+    async def send(self, p):
+        '''Sends a UMI packet, waiting while the queue is full.'''
+
+        wait = self.wait()
+
+        while not self.umi.send(p, blocking=False):
+            await wait.idle()
+
+    async def write(self, addr, data, srcaddr=None, posted=False):
+        '''Writes a NumPy array (or integer) to addr, waiting for acknowledgement unless posted.'''
+
+        srcaddr = srcaddr if srcaddr is not None else self.srcaddr
+        data = np.atleast_1d(data)
+
+        opcode = UmiCmd.UMI_REQ_POSTED if posted else UmiCmd.UMI_REQ_WRITE
+        itemsize = data.dtype.itemsize
+
+        async with self.lock:
+            for offset, chunk in self._chunks(data):
+                cmd = umi_pack(opcode=int(opcode), size=itemsize.bit_length() - 1,
+                               len=chunk.size - 1)
+                await self.send(PyUmiPacket(cmd, addr + offset, srcaddr,
+                                            np.ascontiguousarray(chunk).view(np.uint8)))
+
+                if not posted:
+                    resp = await self.recv()
+                    self._check_response(resp, UmiCmd.UMI_RESP_WRITE)
+
+    async def read(self, addr, num, dtype=np.uint8, srcaddr=None):
+        '''Reads "num" values of type dtype starting at addr, returning a NumPy array.'''
+
+        srcaddr = srcaddr if srcaddr is not None else self.srcaddr
+        dtype = np.dtype(dtype)
+
+        result = np.empty(num, dtype=dtype)
+
+        async with self.lock:
+            for offset, chunk in self._chunks(result):
+                cmd = umi_pack(opcode=int(UmiCmd.UMI_REQ_READ),
+                               size=dtype.itemsize.bit_length() - 1, len=chunk.size - 1)
+                await self.send(PyUmiPacket(cmd, addr + offset, srcaddr))
+
+                # the response may be split into several packets
+                received = bytearray()
+                while len(received) < chunk.nbytes:
+                    resp = await self.recv()
+                    self._check_response(resp, UmiCmd.UMI_RESP_READ)
+                    received += bytes(resp.data.view(np.uint8))
+
+                chunk[:] = np.frombuffer(bytes(received[:chunk.nbytes]), dtype=dtype)
+
+        return result
+
+    def _chunks(self, data):
+        step = max(self.max_bytes // data.dtype.itemsize, 1)
+        for i in range(0, data.size, step):
+            yield i * data.dtype.itemsize, data[i:i + step]
+
+    @staticmethod
+    def _check_response(p, expected):
+        opcode = umi_opcode(p.cmd)
+        if opcode != expected:
+            raise ValueError(f'Expected {expected.name}, got opcode {opcode}')
+
+
+class AsyncGpio:
+    """Awaitable access to a umi_gpio instance through an AsyncUmi
+
+    Mirrors UmiGpio: outputs are kept in a BitVector and written in full
+    whenever they change, while inputs are read from the RTL on request.
+    """
+
+    def __init__(self, umi, iwidth=32, owidth=32, init=0, dstaddr=0):
+        self.umi = umi
+        self.iwidth = iwidth
+        self.owidth = owidth
+        self.dstaddr = dstaddr
+
+        self.outputs = BitVector(init)
+
+    async def start(self):
+        '''Writes the initial output values.'''
+
+        await self._write()
+
+    async def set(self, key, value):
+        '''Sets output bits, e.g. set(1, 1) or set(slice(7, 0), 0x5a).'''
+
+        self.outputs[key] = value
+        await self._write()
+
+    async def get(self, key=slice(None)):
+        '''Reads input bits, e.g. get(0) or get(slice(127, 64)).'''
+
+        data = await self.umi.read(self.dstaddr, (self.iwidth + 7) // 8)
+        return BitVector.frombytes(data)[key]
+
+    async def _write(self):
+        await self.umi.write(self.dstaddr, self.outputs.tobytes(n=(self.owidth + 7) // 8))
+
+
+async def serve(service, until=None, wait=None):
+    '''
+    Calls service.service() (for example, on a UmiBatchService) until "until"
+    returns True, yielding to other coroutines whenever there is nothing to do.
+    '''
+
+    wait = wait if wait is not None else AsyncBackoff()
+
+    while (until is None) or (not until()):
+        if service.service():
+            wait.reset()
+        else:
+            await wait.idle()
+
+
+async def wait_until(condition, wait=None):
+    '''Waits until condition() returns True.'''
+
+    wait = wait if wait is not None else AsyncBackoff()
+
+    while not condition():
+        await wait.idle()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+# Simple UMI devices implemented by the Python monitor
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+
+import sys
+import numpy as np
+
+from pathlib import Path
+
+# When a UartSink writes its buffered output to its stream:
+# * immediate: after every character, for watching a program interactively
+# * line: at the end of every line
+# * batch: whenever buffer_size characters have accumulated (and on flush()
+#   or close()), which keeps chatty programs from costing a system call per
+#   character in CI runs
+FLUSH_POLICIES = ['immediate', 'line', 'batch']
+
+
+class UartSink:
+    """Buffers the characters printed by a program on their way to a stream
+
+    "stream" may be a file object, a filename, which is opened for writing
+    and closed by close(), or None for sys.stdout (looked up each time the
+    sink writes, so that a redirected stdout is followed).  If echo is False,
+    the output is not written anywhere and is only captured.  If capture is
+    True, everything written is also kept in memory and returned by
+    getvalue().  Capturing is off by default, since the copy grows with
+    everything the program prints.
+    """
+
+    def __init__(self, stream=None, policy='line', buffer_size=4096, capture=False, echo=True):
+        if policy not in FLUSH_POLICIES:
+            raise ValueError(f'Unknown flush policy: {policy}')
+
+        self.owned = isinstance(stream, (str, Path))
+        self._stream = open(stream, 'w') if self.owned else stream
+        self.echo = echo
+        self.policy = policy
+        self.buffer_size = buffer_size
+        self.capture = capture
+
+        self.buffer = []
+        self.pending = 0
+        self.captured = []
+
+    @property
+    def stream(self):
+        '''The stream written to, or None if the output is only captured.'''
+
+        if not self.echo:
+            return None
+
+        return sys.stdout if self._stream is None else self._stream
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, text):
+        '''Adds text to the output, writing it to the stream as the flush policy dictates.'''
+
+        if self.capture:
+            self.captured.append(text)
+
+        if self.stream is None:
+            return
+
+        self.buffer.append(text)
+        self.pending += len(text)
+
+        if (self.policy == 'immediate') or (self.pending >= self.buffer_size) or \
+                ((self.policy == 'line') and ('\n' in text)):
+            self.flush()
+
+    def flush(self):
+        '''Writes any buffered output to the stream.'''
+
+        if self.stream is None:
+            return
+
+        if self.buffer:
+            self.stream.write(''.join(self.buffer))
+            self.buffer = []
+            self.pending = 0
+
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+
+        if self.owned and self.echo:
+            self._stream.close()
+            self.echo = False
+
+    def getvalue(self):
+        '''Returns everything captured since the last reset.'''
+
+        return ''.join(self.captured)
+
+    def reset(self):
+        '''Flushes the stream and discards the captured output.'''
+
+        self.flush()
+        self.captured = []
+
+
+class UartDevice:
+    """Prints each character written to it, optionally keeping a copy of the output
+
+    Characters go to a UartSink.  By default, the sink echoes to stdout one
+    line at a time if "echo" is True, and keeps a copy for getvalue() if
+    "capture" is True.  Call flush() (or close()) once the program is done,
+    so that a partial last line is not left in the buffer.
+    """
+
+    def __init__(self, echo=True, sink=None, capture=False):
+        if sink is None:
+            sink = UartSink(echo=echo, capture=capture)
+
+        self.sink = sink
+
+    def getvalue(self):
+        '''Returns everything printed since the last reset.'''
+
+        return self.sink.getvalue()
+
+    def flush(self):
+        self.sink.flush()
+
+    def close(self):
+        self.sink.close()
+
+    def reset(self):
+        '''Prepares the device for another program run.'''
+
+        self.sink.reset()
+
+    def handle(self, packet):
+        # print the character received
+        self.sink.write(chr(packet.data[0]))
+
+
+class ExitDevice:
+    """Records the exit code written by the program when it finishes"""
+
+    def __init__(self):
+        self.exit_code = None
+
+    @property
+    def done(self):
+        '''True once the program has written its exit code.'''
+
+        return self.exit_code is not None
+
+    def reset(self):
+        '''Prepares the device for another program run.'''
+
+        self.exit_code = None
+
+    def handle(self, packet):
+        self.exit_code = int(packet.data.view(np.uint32)[0])
@@ -8,6 +8,7 @@
 
 import numpy as np
 
+from pathlib import Path
 from switchboard import PyUmiPacket, umi_size, umi_len
 
 
@@ -21,12 +22,23 @@ class UmiRam:
         # initialize the memory with random data
         self.ram = np.random.randint((2**8 - 1), size=self.mem_size, dtype=np.uint8)
 
+    def _load(self, startaddr, endaddr):
+        return self.ram[startaddr:endaddr]
+
+    def _store(self, startaddr, data):
+        self.ram[startaddr:startaddr + data.size] = data
+
     def check_address(self, addr):
         '''Raises an exception if the provided address is outside of memory.'''
 
         if addr >= self.mem_size:
             raise ValueError(f"Trying to access addr: {addr} in a memory of size {self.mem_size}")
 
+    def save(self, filename):
+        '''Writes the current contents of memory to a new image file.'''
+
+        self.ram.tofile(filename)
+
     def initialize_memory(self, startaddr, data):
         '''Loads data into the memory, starting at startaddr.'''
 
@@ -38,7 +50,7 @@ class UmiRam:
 
         # write data to memory as an array of bytes
         data = data.view(np.uint8)
-        self.ram[startaddr:endaddr] = data
+        self._store(startaddr, data)
 
     def write(self, packet):
         '''Performs the write transaction specified in packet.'''
@@ -56,7 +68,7 @@ class UmiRam:
         self.check_address(endaddr)
 
         # perform the write
-        self.ram[startaddr:endaddr] = data
+        self._store(startaddr, data)
 
     def read(self, packet):
         '''Performs the read transaction specified in packet, returning a NumPy array of bytes.'''
@@ -74,4 +86,263 @@ class UmiRam:
         self.check_address(endaddr)
 
         # perform the read and return the result
-        return self.ram[startaddr:endaddr]
+        return self._load(startaddr, endaddr)
+
+    def gather(self, startaddrs, sizes):
+        '''Performs several reads at once, returning a list of NumPy arrays of bytes.'''
+
+        startaddrs = np.asarray(startaddrs, dtype=np.int64)
+        sizes = np.asarray(sizes, dtype=np.int64)
+
+        if startaddrs.size == 0:
+            return []
+
+        # check that the address ranges are valid
+        self.check_address(startaddrs.min())
+        self.check_address((startaddrs + sizes).max())
+
+        # read all of the ranges with a single fancy-indexing operation
+        # and then split the result back into one array per request
+        ends = np.cumsum(sizes)
+        index = np.repeat(startaddrs - (ends - sizes), sizes) + np.arange(ends[-1])
+
+        return np.split(self.ram[index], ends[:-1])
+
+    def scatter(self, startaddrs, chunks):
+        '''Performs several writes at once.  Where writes overlap, the last one wins.'''
+
+        if len(chunks) == 0:
+            return
+
+        startaddrs = np.asarray(startaddrs, dtype=np.int64)
+        data = np.concatenate([chunk.view(np.uint8) for chunk in chunks])
+        sizes = np.array([chunk.view(np.uint8).size for chunk in chunks], dtype=np.int64)
+
+        # check that the address ranges are valid
+        self.check_address(startaddrs.min())
+        self.check_address((startaddrs + sizes).max())
+
+        ends = np.cumsum(sizes)
+        index = np.repeat(startaddrs - (ends - sizes), sizes) + np.arange(ends[-1])
+
+        # if no two writes overlap (checked on the ranges, which is cheaper
+        # than on the bytes), every index appears once
+        order = np.argsort(startaddrs, kind='stable')
+        if np.all((startaddrs[order] + sizes[order])[:-1] <= startaddrs[order][1:]):
+            self.ram[index] = data
+            return
+
+        # NumPy does not define which value lands when an index is repeated
+        # in an assignment, so keep only the last write to each byte
+        _, last = np.unique(index[::-1], return_index=True)
+        last = index.size - 1 - last
+
+        self.ram[index[last]] = data[last]
+
+
+class SparseUmiRam(UmiRam):
+    """A UMI RAM class that allocates its storage in pages, on first touch
+
+    Memory use scales with the footprint that is actually accessed rather than
+    with num_bytes, so a full 40-bit chiplet address space can be modeled.
+    Pages are filled according to "fill" when they are allocated:
+
+    * "zero": all zeros
+    * "pattern": the bytes of "pattern" repeated
+    * "random": random data; the contents of each page depend only on "seed"
+      and the page number, not on the order in which pages are touched
+    """
+
+    def __init__(self, num_bytes, page_size=4096, fill='random', pattern=0, seed=None):
+        if (page_size <= 0) or (page_size & (page_size - 1)):
+            raise ValueError(f"Page size must be a power of two, got {page_size}")
+
+        if fill not in {'zero', 'pattern', 'random'}:
+            raise ValueError(f"Unknown fill policy: {fill}")
+
+        # store the memory size in bytes
+        self.mem_size = np.int64(num_bytes)
+
+        self.page_size = page_size
+        self.page_bits = page_size.bit_length() - 1
+        self.fill = fill
+        self.seed = np.random.SeedSequence().entropy if seed is None else seed
+
+        if fill == 'pattern':
+            # "pattern" is either a single byte value or a sequence of bytes
+            if isinstance(pattern, int):
+                pattern = np.array([pattern], dtype=np.uint8)
+            else:
+                pattern = np.frombuffer(bytes(pattern), dtype=np.uint8)
+            self.pattern = np.resize(pattern, page_size)
+
+        # pages that have been touched, indexed by page number
+        self.pages = {}
+
+    @property
+    def footprint(self):
+        '''Number of bytes of storage allocated so far.'''
+
+        return len(self.pages) * self.page_size
+
+    def page(self, number):
+        '''Returns the storage for a page, allocating it on first touch.'''
+
+        page = self.pages.get(number)
+
+        if page is None:
+            if self.fill == 'zero':
+                page = np.zeros(self.page_size, dtype=np.uint8)
+            elif self.fill == 'pattern':
+                page = self.pattern.copy()
+            else:
+                rng = np.random.default_rng([self.seed, number])
+                page = rng.integers(0, 2**8, size=self.page_size, dtype=np.uint8)
+
+            self.pages[number] = page
+
+        return page
+
+    def _chunks(self, startaddr, endaddr):
+        # yields (page storage, offset in page, offset in range, length)
+        # for each page overlapping [startaddr, endaddr)
+        startaddr = int(startaddr)
+        endaddr = int(endaddr)
+        addr = startaddr
+
+        while addr < endaddr:
+            offset = addr & (self.page_size - 1)
+            length = min(self.page_size - offset, endaddr - addr)
+            yield self.page(addr >> self.page_bits), offset, addr - startaddr, length
+            addr += length
+
+    def _load(self, startaddr, endaddr):
+        chunks = list(self._chunks(startaddr, endaddr))
+
+        # return a copy, as UmiRam.gather() does, so that the data read is
+        # not changed by later writes to the page
+        if len(chunks) == 1:
+            page, offset, _, length = chunks[0]
+            return page[offset:offset + length].copy()
+
+        return np.concatenate([page[offset:offset + length]
+            for page, offset, _, length in chunks])
+
+    def _store(self, startaddr, data):
+        for page, offset, pos, length in self._chunks(startaddr, startaddr + data.size):
+            page[offset:offset + length] = data[pos:pos + length]
+
+    def gather(self, startaddrs, sizes):
+        '''Performs several reads at once, returning a list of NumPy arrays of bytes.'''
+
+        result = []
+
+        for startaddr, size in zip(startaddrs, sizes):
+            # check that the address range is valid
+            self.check_address(startaddr)
+            self.check_address(startaddr + size)
+
+            result.append(self._load(startaddr, startaddr + size))
+
+        return result
+
+    def scatter(self, startaddrs, chunks):
+        '''Performs several writes at once.  Where writes overlap, the last one wins.'''
+
+        for startaddr, chunk in zip(startaddrs, chunks):
+            data = chunk.view(np.uint8)
+
+            # check that the address range is valid
+            self.check_address(startaddr)
+            self.check_address(startaddr + data.size)
+
+            self._store(startaddr, data)
+
+
+class MemmapUmiRam(UmiRam):
+    """A UMI RAM class whose storage is a memory-mapped file
+
+    If "filename" does not exist, it is created and zero-filled.  Otherwise its
+    current contents are used as the initial contents of the memory.  Changes
+    are written through to the file, so it can be reused as a memory image by
+    a later run.
+
+    snapshot() freezes the file as a checkpoint: the file is flushed and then
+    mapped copy-on-write, so that subsequent writes only touch private pages.
+    restore() discards those private pages, returning to the checkpoint.  Both
+    are O(1) in the size of the memory, except when the memory is already
+    mapped copy-on-write: then its current contents exist only in private
+    pages, so snapshot() writes them out to a new snapshot file.
+    """
+
+    def __init__(self, num_bytes, filename, mode='r+'):
+        # store the memory size in bytes
+        self.mem_size = np.int64(num_bytes)
+        self.filename = Path(filename)
+
+        if not self.filename.exists():
+            # create a (sparse) zero-filled file of the right size
+            with open(self.filename, 'wb') as f:
+                f.truncate(int(self.mem_size))
+        elif self.filename.stat().st_size < self.mem_size:
+            raise ValueError(f"Memory image {self.filename} is smaller than {self.mem_size} bytes")
+
+        self.ram = self._map(mode)
+
+    @classmethod
+    def from_snapshot(cls, filename):
+        '''Returns a memory that starts from a snapshot, leaving the snapshot file untouched.'''
+
+        return cls(Path(filename).stat().st_size, filename, mode='c')
+
+    @property
+    def snapshotted(self):
+        '''True if the backing file is currently mapped copy-on-write.'''
+
+        return self.ram.mode == 'c'
+
+    def _map(self, mode):
+        return np.memmap(self.filename, dtype=np.uint8, mode=mode, shape=(int(self.mem_size),))
+
+    def flush(self):
+        '''Writes changes back to the backing file.  Has no effect after snapshot().'''
+
+        self.ram.flush()
+
+    def snapshot(self, filename=None):
+        '''
+        Checkpoints the current contents of memory, returning the path of the
+        snapshot.  The backing file itself becomes the snapshot, unless the
+        memory is already mapped copy-on-write or "filename" is given; then
+        the contents are written to a new file ("filename", or the name of
+        the backing file with a number added), which becomes the snapshot.
+        '''
+
+        if (filename is None) and not self.snapshotted:
+            self.flush()
+        else:
+            if filename is None:
+                filename = self._next_snapshot_name()
+            self.save(filename)
+            self.filename = Path(filename)
+
+        self.ram = self._map('c')
+
+        return self.filename
+
+    def _next_snapshot_name(self):
+        # <stem>.<n><suffix>, next to the backing file
+        n = 1
+        while True:
+            filename = self.filename.with_name(f'{self.filename.stem}.{n}{self.filename.suffix}')
+            if not filename.exists():
+                return filename
+            n += 1
+
+    def restore(self):
+        '''Returns the memory to the contents it had when the snapshot was taken.'''
+
+        if not self.snapshotted:
+            raise ValueError("restore() called before snapshot()")
+
+        self.ram = self._map('c')
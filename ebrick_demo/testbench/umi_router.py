@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+# Address routing for UMI requests, driven by ebrick_memory_map.h
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+
+import re
+
+from bisect import bisect_right
+from collections import namedtuple
+from pathlib import Path
+
+from ebrick_demo.testbench.umi_ram import UmiRam
+
+# default location of the memory map shared by the RTL, firmware and Python
+MEMORY_MAP_FILE = Path(__file__).resolve().parent.parent / 'config' / 'ebrick_memory_map.h'
+
+# mask selecting the address within a chiplet (bits 39:0)
+CHIP_ADDR_MASK = (1 << 40) - 1
+
+_DEFINE = re.compile(r'^\s*#\s*define\s+(\w+)(?:\s+(.*?))?\s*$')
+_IDENTIFIER = re.compile(r'\b[A-Za-z_]\w*\b')
+
+
+def parse_memory_map(filename=MEMORY_MAP_FILE):
+    '''Returns a dictionary mapping each valued #define in filename to its integer value.'''
+
+    text = Path(filename).read_text()
+
+    # drop comments
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.DOTALL)
+    text = re.sub(r'//[^\n]*', '', text)
+
+    # collect the raw macro bodies, skipping include guards
+    bodies = {}
+    for line in text.splitlines():
+        match = _DEFINE.match(line)
+        if match and match.group(2):
+            bodies[match.group(1)] = match.group(2)
+
+    # expand the macros textually, as the C preprocessor would, so that
+    # operator precedence inside of macro bodies is preserved
+    def expand(body, seen):
+        def replace(match):
+            name = match.group(0)
+            if name not in bodies:
+                raise ValueError(f'Undefined macro {name} in {filename}')
+            if name in seen:
+                raise ValueError(f'Recursive macro {name} in {filename}')
+            return expand(bodies[name], seen | {name})
+
+        return _IDENTIFIER.sub(replace, body)
+
+    macros = {}
+    for name, body in bodies.items():
+        expr = expand(body, {name})
+        if not re.fullmatch(r'[0-9a-fA-FxX\s()+\-|&<>~*]*', expr):
+            raise ValueError(f'Cannot evaluate {name} = {body} in {filename}')
+        macros[name] = eval(expr, {'__builtins__': {}})
+
+    return macros
+
+
+class MemoryMap:
+    """Address regions and device addresses described by ebrick_memory_map.h
+
+    Every chiplet <X> with <X>_CHIPID, <X>_ADDR_LOW and <X>_ADDR_HIGH macros
+    becomes a region named <X> (e.g. "MEM", "CORE", "HOST", "MONITOR").  The
+    UART and exit addresses are offsets within the MONITOR region.
+    """
+
+    def __init__(self, filename=MEMORY_MAP_FILE):
+        self.filename = Path(filename)
+        self.macros = parse_memory_map(self.filename)
+
+        self.regions = {}
+        for name, value in self.macros.items():
+            if name.endswith('_CHIPID'):
+                region = name[:-len('_CHIPID')]
+                self.regions[region] = (
+                    self.macros[f'{region}_ADDR_LOW'],
+                    self.macros[f'{region}_ADDR_HIGH']
+                )
+
+        monitor_low = self.regions['MONITOR'][0]
+        self.uart_addr = monitor_low + self.macros['UART_ADDR']
+        self.exit_addr = monitor_low + self.macros['EXIT_ADDR']
+
+    def chipid(self, region):
+        '''Returns the chipid of a region.'''
+
+        return self.macros[f'{region}_CHIPID']
+
+    def size(self, region):
+        '''Returns the size of a region in bytes.'''
+
+        low, high = self.regions[region]
+        return high - low + 1
+
+
+Route = namedtuple('Route', ['low', 'high', 'handler', 'name', 'memory'])
+
+
+class UmiRouter:
+    """Maps UMI destination addresses to the handlers registered for them
+
+    Handlers are registered against inclusive address ranges, and are looked
+    up with a binary search over the precomputed range boundaries.  UmiRam
+    handlers are flagged as memory so that requests to them can be batched;
+    other handlers provide a handle(packet) method that returns the data for
+    read requests.
+    """
+
+    def __init__(self, memory_map=None):
+        self.memory_map = memory_map if memory_map is not None else MemoryMap()
+
+        self.routes = []
+        self._lows = []
+
+    def register(self, low, high, handler, name=None):
+        '''Routes requests to addresses low through high (inclusive) to handler.'''
+
+        route = Route(low, high, handler, name, isinstance(handler, UmiRam))
+
+        for other in self.routes:
+            if (low <= other.high) and (other.low <= high):
+                raise ValueError(f'Route {name} overlaps route {other.name}')
+
+        self.routes = sorted(self.routes + [route], key=lambda r: r.low)
+        self._lows = [r.low for r in self.routes]
+
+        return route
+
+    def register_region(self, region, handler, size=None):
+        '''Routes requests to a region of the memory map, optionally limited to size bytes.'''
+
+        low, high = self.memory_map.regions[region]
+
+        if size is not None:
+            high = min(high, low + size - 1)
+
+        return self.register(low, high, handler, name=region)
+
+    def register_address(self, addr, handler, name=None):
+        '''Routes requests to a single address.'''
+
+        return self.register(addr, addr, handler, name=name)
+
+    def lookup(self, addr):
+        '''Returns the Route for addr, or None if the address is not mapped.'''
+
+        i = bisect_right(self._lows, addr) - 1
+
+        if i >= 0:
+            route = self.routes[i]
+            if addr <= route.high:
+                return route
+
+        return None
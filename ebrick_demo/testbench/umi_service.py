@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+# Batched servicing of routed UMI requests
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+
+import time
+
+from switchboard import PyUmiPacket, UmiCmd, umi_opcode, umi_size, umi_len
+
+# opcodes that the service knows how to handle
+SUPPORTED_OPCODES = {UmiCmd.UMI_REQ_READ, UmiCmd.UMI_REQ_WRITE, UmiCmd.UMI_REQ_POSTED}
+
+# the same opcodes as plain integers, which are much faster to compare in
+# the per-request loop than the UmiCmd members
+_REQ_READ = int(UmiCmd.UMI_REQ_READ)
+_REQ_WRITE = int(UmiCmd.UMI_REQ_WRITE)
+_RESP_READ = int(UmiCmd.UMI_RESP_READ)
+_RESP_WRITE = int(UmiCmd.UMI_RESP_WRITE)
+_SUPPORTED = frozenset(int(opcode) for opcode in SUPPORTED_OPCODES)
+
+# granularity used to detect overlap between pending reads and writes
+GRANULE_BITS = 2
+
+
+def _granules(memory, startaddr, size):
+    first = startaddr >> GRANULE_BITS
+    last = (startaddr + size - 1) >> GRANULE_BITS
+    return [(id(memory), g) for g in range(first, last + 1)]
+
+
+class UmiBatchService:
+    """Services UMI requests in batches
+
+    Each call to service() drains every request that is pending on the UMI
+    connection and routes it with a UmiRouter.  Requests to memory (UmiRam
+    routes) are performed in order with UmiRam.read() and UmiRam.write(),
+    and the responses for the whole batch are sent together, in request
+    order, at the end of the pass.
+
+    With vectorize=True, memory requests are instead grouped into UmiRam.gather()
+    and UmiRam.scatter() calls.  Writes are deferred and combined until a read
+    touches the same bytes, at which point they are committed, so
+    read-after-write ordering is exactly that of the request stream.
+    Likewise, reads are performed before any later write to the same bytes is
+    committed.  This is off by default: building the response packets and
+    routing dominate the cost of each request, so the bookkeeping costs more
+    than it saves, and the PicoRV32 only has one request outstanding, so its
+    batches hold a single request anyway.  Batches of one request are always
+    serviced directly.
+
+    Requests to other routes are passed, in order, to the handle() method of
+    their handler.  For reads, handle() returns the data to send back.
+
+    If a Telemetry object is provided, it is updated with counts and timings
+    for every batch.
+    """
+
+    def __init__(self, umi, router, max_batch=None, telemetry=None, vectorize=False):
+        self.umi = umi
+        self.router = router
+        self.max_batch = max_batch
+        self.telemetry = telemetry
+        self.vectorize = vectorize
+
+        # times at which the requests in the current batch were received
+        self._recv_times = []
+
+        # deferred writes and reads, per memory
+        self._writes = {}
+        self._write_granules = set()
+
+        self._reads = {}
+        self._read_granules = set()
+
+        self._responses = []
+
+    def drain(self):
+        '''Returns a list of all of the requests that are currently pending.'''
+
+        packets = []
+        recv_times = self._recv_times = []
+
+        while (self.max_batch is None) or (len(packets) < self.max_batch):
+            p = self.umi.recv(blocking=False)
+            if p is None:
+                break
+            packets.append(p)
+            if self.telemetry is not None:
+                recv_times.append(time.perf_counter())
+
+        return packets
+
+    def service(self):
+        '''Services all pending requests, returning the number of requests handled.'''
+
+        packets = self.drain()
+
+        if packets:
+            self.process(packets)
+
+        return len(packets)
+
+    def process(self, packets):
+        '''Services the requests in packets and sends their responses.'''
+
+        telemetry = self.telemetry
+        if telemetry is not None:
+            start = time.perf_counter()
+
+        responses = self._responses = []
+
+        direct = (not self.vectorize) or (len(packets) == 1)
+
+        lookup = self.router.lookup
+
+        for p in packets:
+            # make sure that we know how to process this request
+            opcode = umi_opcode(p.cmd)
+            assert opcode in _SUPPORTED, f'Unsupported opcode: {opcode}'
+
+            route = lookup(p.dstaddr)
+
+            if route is None:
+                raise ValueError(f'Unsupported address: 0x{p.dstaddr:08x}')
+
+            if telemetry is not None:
+                telemetry.request(opcode, route.name, (umi_len(p.cmd) + 1) << umi_size(p.cmd))
+
+            if route.memory and direct:
+                if opcode == _REQ_READ:
+                    # copy the data, since the response may be held (see
+                    # umi_timing.py) while later writes change the memory
+                    responses.append(self._read_response(p, route.handler.read(p).copy()))
+                else:
+                    route.handler.write(p)
+            elif route.memory:
+                if opcode == _REQ_READ:
+                    # the response is filled in when the read is performed
+                    responses.append(p)
+                    self._queue_read(route.handler, p, len(responses) - 1)
+                else:
+                    self._queue_write(route.handler, p)
+            else:
+                data = route.handler.handle(p)
+
+                if opcode == _REQ_READ:
+                    if data is None:
+                        raise ValueError(f'No read data for address: 0x{p.dstaddr:08x}')
+                    responses.append(self._read_response(p, data))
+
+            # send a write reponse if this was an ordinary write (non-posted)
+            if opcode == _REQ_WRITE:
+                responses.append(self._write_response(p))
+
+        if self._writes:
+            self.flush_writes()
+        if self._reads:
+            self.flush_reads()
+
+        for resp in responses:
+            self.umi.send(resp)
+
+        if telemetry is not None:
+            # packets that did not come from drain() count as received now
+            recv_times = self._recv_times
+            if len(recv_times) != len(packets):
+                recv_times = [start] * len(packets)
+
+            stop = time.perf_counter()
+            telemetry.batch(recv_times, stop, len(responses), stop - start)
+
+        self._responses = []
+        self._recv_times = []
+
+    def flush_writes(self):
+        '''Commits all deferred writes to memory.'''
+
+        for memory, (addrs, data) in self._writes.items():
+            memory.scatter(addrs, data)
+
+        self._writes = {}
+        self._write_granules = set()
+
+    def flush_reads(self):
+        '''Performs all deferred reads, filling in their responses.'''
+
+        for memory, (addrs, sizes, slots) in self._reads.items():
+            data = memory.gather(addrs, sizes)
+
+            for slot, value in zip(slots, data):
+                p = self._responses[slot]
+                self._responses[slot] = self._read_response(p, value)
+
+        self._reads = {}
+        self._read_granules = set()
+
+    def _queue_write(self, memory, p):
+        # remove chipid from the destination address
+        startaddr = p.dstaddr & 0xFFFFFFFFFF
+        data = p.data.view('uint8')
+        granules = _granules(memory, startaddr, data.size)
+
+        # reads that were issued earlier must see the old contents
+        if not self._read_granules.isdisjoint(granules):
+            self.flush_reads()
+
+        addrs, chunks = self._writes.setdefault(memory, ([], []))
+        addrs.append(startaddr)
+        chunks.append(data.copy())
+        self._write_granules.update(granules)
+
+    def _queue_read(self, memory, p, slot):
+        # remove chipid from the destination address
+        startaddr = p.dstaddr & 0xFFFFFFFFFF
+        size = (umi_len(p.cmd) + 1) << umi_size(p.cmd)
+        granules = _granules(memory, startaddr, size)
+
+        # writes that were issued earlier must be visible to this read
+        if not self._write_granules.isdisjoint(granules):
+            self.flush_writes()
+
+        addrs, sizes, slots = self._reads.setdefault(memory, ([], [], []))
+        addrs.append(startaddr)
+        sizes.append(size)
+        slots.append(slot)
+        self._read_granules.update(granules)
+
+    @staticmethod
+    def _read_response(p, data):
+        # change the command to a read response and flip the source
+        # and destination addresses
+        cmd = (p.cmd & 0xffffffe0) | _RESP_READ
+        return PyUmiPacket(cmd, p.srcaddr, p.dstaddr, data)
+
+    @staticmethod
+    def _write_response(p):
+        # change the command to a write response and flip the source
+        # and destination addresses
+        cmd = (p.cmd & 0xffffffe0) | _RESP_WRITE
+        return PyUmiPacket(cmd, p.srcaddr, p.dstaddr)
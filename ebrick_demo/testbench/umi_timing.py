@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+
+# Latency and bandwidth model for the Python memory service
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+
+import json
+
+from collections import deque
+from pathlib import Path
+
+from switchboard import UmiCmd, umi_opcode, umi_size, umi_len
+
+from ebrick_demo.testbench.umi_router import CHIP_ADDR_MASK
+
+# parameters of MemoryTiming and their defaults (see MemoryTiming)
+TIMING_DEFAULTS = {
+    'read_latency': 1,
+    'write_latency': 1,
+    'banks': 1,
+    'row_size': None,
+    'row_miss_penalty': 0,
+    'bank_busy': 1,
+    'max_outstanding': None,
+    'bytes_per_cycle': None,
+    'clock_hz': None
+}
+
+# example memories, which can be selected by name instead of listing each
+# parameter.  The numbers are representative, not those of a specific part.
+# * sram: on-package SRAM chiplet with a wide port
+# * dram: DRAM chiplet with 8 banks of 2 KiB rows and an 8-byte interface
+# * narrow: slow serial memory, limited by its 1-byte interface
+TIMING_PRESETS = {
+    'sram': {'read_latency': 2, 'write_latency': 1, 'bytes_per_cycle': 16},
+    'dram': {'read_latency': 14, 'write_latency': 10, 'banks': 8, 'row_size': 2048,
+             'row_miss_penalty': 28, 'bank_busy': 4, 'max_outstanding': 8,
+             'bytes_per_cycle': 8},
+    'narrow': {'read_latency': 8, 'write_latency': 8, 'bytes_per_cycle': 1}
+}
+
+
+def parse_timing(spec):
+    '''
+    Returns the MemoryTiming parameters described by spec, which is the name
+    of a preset in TIMING_PRESETS, a JSON file, or a comma-separated list of
+    parameter=value pairs (e.g. "read_latency=20,banks=4").  Parameters that
+    are not given keep their defaults.
+    '''
+
+    if spec in TIMING_PRESETS:
+        return dict(TIMING_PRESETS[spec])
+
+    if spec.endswith('.json') or Path(spec).is_file():
+        with open(spec) as f:
+            return json.load(f)
+
+    params = {}
+    for item in spec.split(','):
+        name, sep, value = item.partition('=')
+        name = name.strip()
+        if (not sep) or (name not in TIMING_DEFAULTS):
+            raise ValueError(f'Invalid memory timing parameter: {item!r}')
+        params[name] = float(value) if name == 'clock_hz' else int(value, 0)
+
+    return params
+
+
+class MemoryTiming:
+    """Cycle-level timing model of a memory chiplet
+
+    access() takes the cycle at which a request arrives and returns the cycle
+    at which it completes, given the requests that came before it:
+
+    * read_latency, write_latency: cycles from starting an access to its data
+    * banks: number of independent banks, interleaved every row_size bytes
+      (or every 64 bytes if there is no row model).  A bank can start a new
+      access bank_busy cycles after starting the previous one (plus the row
+      miss penalty, if any).
+    * row_size: bytes per row; if set, each bank keeps one row open and an
+      access to another row costs row_miss_penalty extra cycles
+    * max_outstanding: most requests in flight; a request arriving when that
+      many are in flight waits for the oldest to complete
+    * bytes_per_cycle: width of the data interface, shared by all banks;
+      None means unlimited bandwidth
+    * clock_hz: simulated clock frequency, only used to report bandwidth in
+      bytes per second
+
+    Requests complete in order, as UMI responses on one connection do.  The
+    model keeps counts of row hits and misses and of the cycles requests
+    spent stalled on each limit, which report() summarizes together with the
+    achieved bandwidth.  When the responses are delivered by a TimedUmi, it
+    calls released() for each one, and report() also gives the latency and
+    bandwidth measured from the cycles at which the responses were sent,
+    which include the time the host took to notice that they were due.
+    """
+
+    def __init__(self, **params):
+        unknown = set(params) - set(TIMING_DEFAULTS)
+        if unknown:
+            raise ValueError(f'Unknown memory timing parameters: {", ".join(sorted(unknown))}')
+
+        params = {**TIMING_DEFAULTS, **params}
+        for name, value in params.items():
+            setattr(self, name, value)
+        self.params = params
+
+        self._interleave = self.row_size if self.row_size is not None else 64
+
+        self.bank_free = [0] * self.banks
+        self.open_row = [None] * self.banks
+
+        # completion cycles of the requests that may still be in flight
+        self._inflight = deque()
+        self._last_done = 0
+        self._bus_free = 0
+
+        self.reads = 0
+        self.writes = 0
+        self.bytes = 0
+        self.row_hits = 0
+        self.row_misses = 0
+        self.latency_total = 0
+        self.latency_max = 0
+        self.stalls = {'outstanding': 0, 'bank': 0, 'bandwidth': 0, 'ordering': 0}
+
+        self.first_cycle = None
+        self.last_cycle = None
+
+        # responses actually sent (see released())
+        self.responses = 0
+        self.delay_total = 0
+        self.delay_max = 0
+        self.late = 0
+        self.last_release = None
+
+    def access(self, cycle, addr, nbytes, write):
+        '''Accounts for an access arriving at "cycle", returning the cycle at which it completes.'''
+
+        if self.first_cycle is None:
+            self.first_cycle = cycle
+
+        # wait for a free slot if too many requests are in flight
+        inflight = self._inflight
+        while inflight and (inflight[0] <= cycle):
+            inflight.popleft()
+
+        issue = cycle
+        if (self.max_outstanding is not None) and (len(inflight) >= self.max_outstanding):
+            issue = inflight[len(inflight) - self.max_outstanding]
+            self.stalls['outstanding'] += issue - cycle
+
+        # wait for the bank, then open the row if needed
+        block = addr // self._interleave
+        bank = block % self.banks
+
+        start = max(issue, self.bank_free[bank])
+        self.stalls['bank'] += start - issue
+
+        penalty = 0
+        if self.row_size is not None:
+            row = block // self.banks
+            if self.open_row[bank] == row:
+                self.row_hits += 1
+            else:
+                self.row_misses += 1
+                penalty = self.row_miss_penalty
+                self.open_row[bank] = row
+
+        self.bank_free[bank] = start + penalty + self.bank_busy
+
+        ready = start + penalty + (self.write_latency if write else self.read_latency)
+
+        # move the data over the shared interface
+        if self.bytes_per_cycle is not None:
+            transfer = -(-nbytes // self.bytes_per_cycle)
+            xfer = max(ready, self._bus_free)
+            self.stalls['bandwidth'] += xfer - ready
+            self._bus_free = xfer + transfer
+            ready = xfer + transfer
+
+        # complete in order
+        done = max(ready, self._last_done)
+        self.stalls['ordering'] += done - ready
+        self._last_done = done
+        inflight.append(done)
+
+        if write:
+            self.writes += 1
+        else:
+            self.reads += 1
+        self.bytes += nbytes
+
+        latency = done - cycle
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        self.last_cycle = max(self.last_cycle or 0, done)
+
+        return done
+
+    def released(self, cycle, done, release):
+        '''
+        Accounts for the response to an access that arrived at "cycle" and
+        completed at "done" being sent at cycle "release".
+        '''
+
+        delay = release - cycle
+        self.responses += 1
+        self.delay_total += delay
+        self.delay_max = max(self.delay_max, delay)
+        self.late += release - done
+        self.last_release = max(self.last_release or 0, release)
+
+    def wrap(self, umi, router, clock):
+        '''
+        Returns a UmiTxRx stand-in that holds the response to each memory
+        request until the simulated clock, read with clock(), reaches its
+        completion cycle.
+        '''
+
+        return TimedUmi(umi, self, router, clock)
+
+    @property
+    def requests(self):
+        return self.reads + self.writes
+
+    @property
+    def cycles(self):
+        if self.first_cycle is None:
+            return 0
+        return self.last_cycle - self.first_cycle
+
+    def to_dict(self):
+        '''Returns the parameters and statistics as a JSON-serializable dictionary.'''
+
+        cycles = self.cycles
+        bytes_per_cycle = (self.bytes / cycles) if cycles else None
+
+        bytes_per_second = None
+        if (bytes_per_cycle is not None) and (self.clock_hz is not None):
+            bytes_per_second = bytes_per_cycle * self.clock_hz
+
+        return {
+            'params': self.params,
+            'reads': self.reads,
+            'writes': self.writes,
+            'bytes': self.bytes,
+            'cycles': cycles,
+            'bandwidth': {
+                'bytes_per_cycle': bytes_per_cycle,
+                'bytes_per_second': bytes_per_second
+            },
+            'latency': {
+                'mean': (self.latency_total / self.requests) if self.requests else None,
+                'max': self.latency_max
+            },
+            'rows': {'hits': self.row_hits, 'misses': self.row_misses},
+            'stalls': dict(self.stalls),
+            'measured': self._measured()
+        }
+
+    def _measured(self):
+        if not self.responses:
+            return None
+
+        cycles = self.last_release - self.first_cycle
+
+        return {
+            'responses': self.responses,
+            'latency': {
+                'mean': self.delay_total / self.responses,
+                'max': self.delay_max
+            },
+            'late': self.late,
+            'bytes_per_cycle': (self.bytes / cycles) if cycles else None
+        }
+
+    def save(self, filename):
+        '''Writes the parameters and statistics to a JSON file.'''
+
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def report(self):
+        '''Returns a printable summary of the statistics.'''
+
+        d = self.to_dict()
+        lines = []
+
+        lines.append(f'memory timing: {d["reads"]} reads, {d["writes"]} writes, '
+                     f'{d["bytes"]} bytes over {d["cycles"]} cycles')
+
+        bandwidth = d['bandwidth']
+        if bandwidth['bytes_per_cycle'] is not None:
+            line = f'achieved bandwidth: {bandwidth["bytes_per_cycle"]:.3f} bytes/cycle'
+            if bandwidth['bytes_per_second'] is not None:
+                line += f' ({bandwidth["bytes_per_second"] / 1e6:.1f} MB/s)'
+            lines.append(line)
+
+        latency = d['latency']
+        if latency['mean'] is not None:
+            lines.append(f'memory latency: mean {latency["mean"]:.1f} cycles, '
+                         f'max {latency["max"]} cycles')
+
+        if self.row_size is not None:
+            rows = d['rows']
+            total = rows['hits'] + rows['misses']
+            rate = (rows['hits'] / total) if total else 0.0
+            lines.append(f'row buffer: {rows["hits"]} hits, {rows["misses"]} misses '
+                         f'({100 * rate:.1f}% hits)')
+
+        lines.append('stall cycles: ' + ', '.join(f'{name} {count}'
+                                                  for name, count in d['stalls'].items()))
+
+        measured = d['measured']
+        if measured is not None:
+            line = (f'measured latency: mean {measured["latency"]["mean"]:.1f} cycles, '
+                    f'max {measured["latency"]["max"]} cycles, '
+                    f'{measured["late"]} cycles later than modeled')
+            if measured['bytes_per_cycle'] is not None:
+                line += f'; measured bandwidth: {measured["bytes_per_cycle"]:.3f} bytes/cycle'
+            lines.append(line)
+
+        return '\n'.join(lines)
+
+
+class TimedUmi:
+    """Forwards recv() and send() to a UmiTxRx, delaying responses to memory requests
+
+    Each request that arrives is stamped with the simulated cycle and, if it
+    goes to a memory route of the router, passed to the MemoryTiming model,
+    which gives the cycle at which it completes.  Requests to other devices
+    complete at once.  Responses are sent in request order, each once the
+    simulated clock has reached its completion cycle.
+
+    Reading the clock is a GPIO transaction, so it is read at most twice per
+    pass of recv() calls ending with an empty queue (one
+    UmiBatchService.drain()) and the send() calls that follow it, and only if
+    the pass has something to do.  Requests are stamped with the cycle at
+    which the pass started.  If a response is not yet due at that cycle, the
+    clock is read again, once, when it is sent (the simulation keeps running
+    while the host services the batch), and every response that is due by
+    then goes out.  The rest are held and sent on the first pass after they
+    are due, so the core sees the modeled latency plus the time it takes the
+    host to notice; use a "spin" or "yield" wait strategy to keep that small.
+    The cycle at which each memory response is sent is passed to
+    MemoryTiming.released(), so that the delay the core actually saw is
+    reported next to the modeled one.
+    """
+
+    def __init__(self, umi, model, router, clock):
+        self.umi = umi
+        self.model = model
+        self.router = router
+        self.clock = clock
+
+        # (arrival cycle, completion cycle, memory) of the requests whose
+        # responses are not yet sent, and the responses that are waiting for
+        # their cycle
+        self._expected = deque()
+        self._held = deque()
+
+        # last cycle read during the current pass, kept until the next pass
+        # starts so that the responses to the pass's requests can use it
+        self._now = None
+        self._refreshed = False
+        self._pass_ended = False
+
+    def recv(self, blocking=True):
+        if self._pass_ended:
+            # the first recv() of a new pass; read the clock again
+            self._now = None
+            self._refreshed = False
+            self._pass_ended = False
+
+        if (self._now is None) and self._held:
+            self._now = self.clock()
+            self._release()
+
+        p = self.umi.recv(blocking=blocking)
+
+        if p is None:
+            self._pass_ended = True
+            return None
+
+        if self._now is None:
+            self._now = self.clock()
+
+        opcode = umi_opcode(p.cmd)
+        done = self._now
+        memory = False
+
+        route = self.router.lookup(p.dstaddr)
+        if (route is not None) and route.memory:
+            nbytes = (umi_len(p.cmd) + 1) << umi_size(p.cmd)
+            done = self.model.access(self._now, p.dstaddr & CHIP_ADDR_MASK, nbytes,
+                                     opcode != UmiCmd.UMI_REQ_READ)
+            memory = True
+
+        if opcode != UmiCmd.UMI_REQ_POSTED:
+            self._expected.append((self._now, done, memory))
+
+        return p
+
+    def send(self, p, *args, **kwargs):
+        arrival, done, memory = self._expected.popleft() if self._expected else (None, 0, False)
+
+        if (self._now is not None) and (self._held or (done > self._now)) \
+                and not self._refreshed:
+            # the clock has moved on while the requests were serviced
+            self._now = self.clock()
+            self._refreshed = True
+            self._release()
+
+        if (not self._held) and (self._now is not None) and (done <= self._now):
+            if memory:
+                self.model.released(arrival, done, self._now)
+            return self.umi.send(p, *args, **kwargs)
+
+        self._held.append((done, arrival, memory, p, args, kwargs))
+
+    def _release(self):
+        held = self._held
+        while held and (held[0][0] <= self._now):
+            done, arrival, memory, p, args, kwargs = held.popleft()
+            if memory:
+                self.model.released(arrival, done, self._now)
+            self.umi.send(p, *args, **kwargs)
+
+    @property
+    def pending(self):
+        '''Number of responses being held.'''
+
+        return len(self._held)
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+
+# Recording and replay of UMI transaction traces
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+
+import time
+import numpy as np
+
+from collections import deque
+from pathlib import Path
+from switchboard import PyUmiPacket, UmiCmd, umi_opcode, umi_size, umi_len
+
+from ebrick_demo.testbench.umi_service import UmiBatchService
+
+# file header: magic, format version, record size
+TRACE_MAGIC = b'UMITRACE'
+TRACE_VERSION = 1
+
+# largest UMI payload that can be recorded
+MAX_DATA_BYTES = 32
+
+# packet directions
+RX = 0  # request received from the EBRICK
+TX = 1  # response sent to the EBRICK
+
+# request opcodes that write memory
+_WRITES = (UmiCmd.UMI_REQ_WRITE, UmiCmd.UMI_REQ_POSTED)
+
+TRACE_DTYPE = np.dtype([
+    ('seq', '<u8'),
+    ('time', '<f8'),
+    ('dir', 'u1'),
+    ('len', 'u1'),
+    ('cmd', '<u4'),
+    ('dstaddr', '<u8'),
+    ('srcaddr', '<u8'),
+    ('data', 'u1', (MAX_DATA_BYTES,))
+])
+
+_HEADER_DTYPE = np.dtype([('magic', 'S8'), ('version', '<u4'), ('itemsize', '<u4')])
+
+
+class UmiTraceRecorder:
+    """Records UMI packets into a compact binary file
+
+    Packets are stored in a preallocated NumPy structured array, which is
+    written to the file in one chunk whenever it fills up (and on flush() or
+    close()), so recording costs one array row update per packet.
+    """
+
+    def __init__(self, filename, capacity=65536):
+        self.file = open(filename, 'wb')
+
+        header = np.array([(TRACE_MAGIC, TRACE_VERSION, TRACE_DTYPE.itemsize)], dtype=_HEADER_DTYPE)
+        header.tofile(self.file)
+
+        self.buffer = np.zeros(capacity, dtype=TRACE_DTYPE)
+        self.count = 0
+        self.seq = 0
+        self.start = time.perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, packet, direction=RX):
+        '''Appends a packet to the trace.'''
+
+        data = packet.data.view(np.uint8) if packet.data is not None else np.zeros(0, np.uint8)
+
+        if data.size > MAX_DATA_BYTES:
+            raise ValueError(f'Packet payload of {data.size} bytes is too large to record')
+
+        row = self.buffer[self.count]
+        row['seq'] = self.seq
+        row['time'] = time.perf_counter() - self.start
+        row['dir'] = direction
+        row['len'] = data.size
+        row['cmd'] = packet.cmd
+        row['dstaddr'] = packet.dstaddr
+        row['srcaddr'] = packet.srcaddr
+        row['data'][:data.size] = data
+        row['data'][data.size:] = 0
+
+        self.seq += 1
+        self.count += 1
+
+        if self.count == self.buffer.size:
+            self.flush()
+
+    def flush(self):
+        '''Writes the buffered packets to the file.'''
+
+        if self.count > 0:
+            self.buffer[:self.count].tofile(self.file)
+            self.count = 0
+
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def wrap(self, umi):
+        '''Returns a UmiTxRx stand-in that records every packet passing through umi.'''
+
+        return RecordingUmi(umi, self)
+
+
+class RecordingUmi:
+    """Forwards recv() and send() to a UmiTxRx, recording each packet"""
+
+    def __init__(self, umi, recorder):
+        self.umi = umi
+        self.recorder = recorder
+
+    def recv(self, blocking=True):
+        p = self.umi.recv(blocking=blocking)
+        if p is not None:
+            self.recorder.record(p, RX)
+        return p
+
+    def send(self, p, *args, **kwargs):
+        self.recorder.record(p, TX)
+        return self.umi.send(p, *args, **kwargs)
+
+
+def read_trace(filename):
+    '''Returns the records in a trace file as a NumPy structured array (memory-mapped).'''
+
+    header = np.fromfile(filename, dtype=_HEADER_DTYPE, count=1)
+
+    if (header.size == 0) or (header['magic'][0] != TRACE_MAGIC):
+        raise ValueError(f'{filename} is not a UMI trace')
+    if header['version'][0] != TRACE_VERSION:
+        raise ValueError(f'{filename} has unsupported trace version {header["version"][0]}')
+    if header['itemsize'][0] != TRACE_DTYPE.itemsize:
+        raise ValueError(f'{filename} has unexpected record size {header["itemsize"][0]}')
+
+    # a trace with no records cannot be memory-mapped (the mapping would be
+    # empty), so return an empty array instead
+    if Path(filename).stat().st_size <= _HEADER_DTYPE.itemsize:
+        return np.zeros(0, dtype=TRACE_DTYPE)
+
+    return np.memmap(filename, dtype=TRACE_DTYPE, mode='r', offset=_HEADER_DTYPE.itemsize)
+
+
+def to_packet(record):
+    '''Converts a trace record back into a PyUmiPacket.'''
+
+    data = np.array(record['data'][:record['len']], dtype=np.uint8)
+
+    return PyUmiPacket(int(record['cmd']), int(record['dstaddr']), int(record['srcaddr']), data)
+
+
+def _key(record):
+    return (int(record['cmd']), int(record['dstaddr']), int(record['srcaddr']),
+            bytes(record['data'][:record['len']]))
+
+
+class ReplayUmi:
+    """A UmiTxRx stand-in that replays the requests in a trace
+
+    recv() returns the recorded requests in order.  Each response passed to
+    send() is compared against the next recorded response, and differences
+    are counted in "mismatches".
+
+    The recorded run starts from memory whose contents are not in the trace
+    (UmiRam fills it with random data), so reads of bytes that the program
+    never wrote cannot be expected to match.  If "known" is given, it is a
+    boolean array with one entry per byte of memory, starting at address
+    "base", that is True where the replay starts from the same contents as
+    the recorded run (e.g. the program).  Writes in the trace mark the bytes
+    that they write as known, and read responses that include unknown bytes
+    are counted in "skipped" instead of being compared.
+    """
+
+    def __init__(self, records, known=None, base=0):
+        self.requests = records[records['dir'] == RX]
+        self.responses = records[records['dir'] == TX]
+
+        self.known = known
+        self.base = base
+
+        self.next_request = 0
+        self.next_response = 0
+        self.mismatches = 0
+        self.first_mismatch = None
+        self.skipped = 0
+
+        # for each read whose response is not yet sent, whether it read
+        # unknown bytes
+        self._unknown_reads = deque()
+
+    @property
+    def done(self):
+        return self.next_request >= self.requests.size
+
+    def recv(self, blocking=True):
+        if self.done:
+            return None
+
+        record = self.requests[self.next_request]
+        self.next_request += 1
+
+        p = to_packet(record)
+
+        if self.known is not None:
+            # requests are performed in order, so the bytes known to a read
+            # are those known when it is received
+            opcode = umi_opcode(p.cmd)
+            offset = p.dstaddr - self.base
+            in_memory = 0 <= offset < self.known.size
+
+            if opcode in _WRITES:
+                if in_memory:
+                    self.known[offset:offset + int(record['len'])] = True
+            elif opcode == UmiCmd.UMI_REQ_READ:
+                nbytes = (umi_len(p.cmd) + 1) << umi_size(p.cmd)
+                self._unknown_reads.append(
+                    in_memory and not self.known[offset:offset + nbytes].all())
+
+        return p
+
+    def send(self, p, *args, **kwargs):
+        sent = (p.cmd, p.dstaddr, p.srcaddr,
+                bytes(p.data.view(np.uint8)) if p.data is not None else b'')
+
+        if self.next_response < self.responses.size:
+            expected = _key(self.responses[self.next_response])
+        else:
+            expected = None
+
+        unknown = False
+        if self._unknown_reads and (umi_opcode(p.cmd) == UmiCmd.UMI_RESP_READ):
+            unknown = self._unknown_reads.popleft()
+
+        if unknown:
+            self.skipped += 1
+        elif sent != expected:
+            self.mismatches += 1
+            if self.first_mismatch is None:
+                self.first_mismatch = (self.next_response, expected, sent)
+
+        self.next_response += 1
+
+        return True
+
+
+def replay(filename, router, max_batch=None, known=None):
+    '''
+    Replays the requests recorded in a trace through a router, without an RTL
+    simulation, returning the ReplayUmi (which holds the mismatch count).
+    "known" marks the bytes of the MEM region whose contents match those of
+    the recorded run (see ReplayUmi).
+    '''
+
+    umi = ReplayUmi(read_trace(filename), known=known, base=router.memory_map.regions['MEM'][0])
+    service = UmiBatchService(umi, router, max_batch=max_batch)
+
+    while service.service():
+        pass
+
+    return umi
+
+
+def diff_traces(filename_a, filename_b):
+    '''
+    Compares the requests in two traces, ignoring timestamps.  Returns None if
+    they match, or the index of the first request that differs.
+    '''
+
+    a = read_trace(filename_a)
+    b = read_trace(filename_b)
+    a = a[a['dir'] == RX]
+    b = b[b['dir'] == RX]
+
+    n = min(a.size, b.size)
+    differs = np.zeros(n, dtype=bool)
+
+    for field in ['cmd', 'dstaddr', 'srcaddr', 'len', 'data']:
+        field_differs = a[field][:n] != b[field][:n]
+        if field_differs.ndim > 1:
+            field_differs = field_differs.any(axis=1)
+        differs |= field_differs
+
+    if differs.any():
+        return int(np.argmax(differs))
+    elif a.size != b.size:
+        return n
+    else:
+        return None
+
+
+if __name__ == '__main__':
+    import sys
+    from argparse import ArgumentParser
+
+    from ebrick_demo.testbench.umi_ram import UmiRam
+    from ebrick_demo.testbench.umi_router import UmiRouter
+    from ebrick_demo.testbench.umi_devices import UartDevice, ExitDevice
+
+    parser = ArgumentParser(description='Replay or compare UMI traces.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parser_replay = subparsers.add_parser('replay', help='replay a trace without RTL')
+    parser_replay.add_argument('trace')
+    parser_replay.add_argument('--program', required=True,
+        help='program binary loaded into memory before the replay')
+    parser_replay.add_argument('--memory-size', type=int, default=32768,
+        help='size of the main memory in bytes')
+
+    parser_diff = subparsers.add_parser('diff', help='compare the requests in two traces')
+    parser_diff.add_argument('trace_a')
+    parser_diff.add_argument('trace_b')
+
+    args = parser.parse_args()
+
+    if args.command == 'replay':
+        main_memory = UmiRam(args.memory_size)
+        program = np.fromfile(args.program, dtype=np.uint8)
+        main_memory.initialize_memory(0, program)
+
+        # only the program is known to be in memory when the recorded run started
+        known = np.zeros(args.memory_size, dtype=bool)
+        known[:program.size] = True
+
+        router = UmiRouter()
+        router.register_region('MEM', main_memory, size=args.memory_size)
+        uart = UartDevice()
+        router.register_address(router.memory_map.uart_addr, uart, name='UART')
+        exit_device = ExitDevice()
+        router.register_address(router.memory_map.exit_addr, exit_device, name='EXIT')
+
+        start = time.perf_counter()
+        umi = replay(args.trace, router, known=known)
+        elapsed = time.perf_counter() - start
+        uart.flush()
+
+        print(f'*** Replayed {umi.requests.size} requests in {elapsed:.3f}s, '
+              f'{umi.mismatches} response mismatches, {umi.skipped} reads of unknown memory '
+              f'not compared, exit code {exit_device.exit_code} ***')
+        if umi.first_mismatch is not None:
+            index, expected, sent = umi.first_mismatch
+            print(f'*** First mismatch at response {index}: expected {expected}, got {sent} ***')
+
+        sys.exit(1 if umi.mismatches else 0)
+    else:
+        index = diff_traces(args.trace_a, args.trace_b)
+        if index is None:
+            print('*** Traces match ***')
+        else:
+            print(f'*** Traces differ at request {index} ***')
+        sys.exit(0 if index is None else 1)